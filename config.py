@@ -24,4 +24,39 @@ class RunMode:
 
 TEMP_FOLDER = os.path.join(os.environ.get("ROBOT_ROOT", os.getcwd()), 'temp')
 OUTPUT_FOLDER = os.path.join(os.environ.get("ROBOT_ROOT", os.getcwd()), 'output')
+STATE_FOLDER = os.path.join(os.environ.get("ROBOT_ROOT", os.getcwd()), 'state')
+# Set by the parallel run coordinator for each worker, which processes the claims of its shard (client id hash % WORKER_COUNT)
+WORKER_ID = os.environ.get("WORKER_ID", "")
+# State shared by the workers of a parallel run (e.g. the Waystar claim statuses read once for all of them)
+SHARED_STATE_FOLDER = STATE_FOLDER
+WORKER_COUNT = int(os.environ.get("WORKER_COUNT", 1))
+if WORKER_ID:
+    TEMP_FOLDER = os.path.join(TEMP_FOLDER, "worker_{}".format(WORKER_ID))
+    OUTPUT_FOLDER = os.path.join(OUTPUT_FOLDER, "worker_{}".format(WORKER_ID))
+    STATE_FOLDER = os.path.join(STATE_FOLDER, "worker_{}".format(WORKER_ID))
+ELEMENT_WAIT_POLL_FREQUENCY = float(os.environ.get("ELEMENT_WAIT_POLL_FREQUENCY", 0.1))
+TIMING_SPANS_ENABLED = os.environ.get("TIMING_SPANS_ENABLED", "true").lower() == "true"
+CENTRALREACH_DATA_MODE = os.environ.get("CENTRALREACH_DATA_MODE", "ui").lower()
+CENTRALREACH_API_URL = os.environ.get("CENTRALREACH_API_URL", "https://members.centralreach.com")
+CENTRALREACH_API_RECORD_FOLDER = os.environ.get("CENTRALREACH_API_RECORD_FOLDER", "")
+CLIENT_CACHE_SIZE = int(os.environ.get("CLIENT_CACHE_SIZE", 256))
+CLAIMS_START_DATE = os.environ.get("CLAIMS_START_DATE", "03/01/2022")
+CLAIMS_END_DATE = os.environ.get("CLAIMS_END_DATE", "03/27/2022")
+# The claim journal and the applied label groups are kept per run: the date range and RUN_ID, which a restarted run keeps
+RUN_ID = os.environ.get("RUN_ID", "")
+RUN_STATE_KEY = "_".join(key for key in (CLAIMS_START_DATE.replace("/", "-"), CLAIMS_END_DATE.replace("/", "-"), RUN_ID) if key)
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", 1))
+MAX_CONCURRENT_WORKERS = int(os.environ.get("MAX_CONCURRENT_WORKERS", PARALLEL_WORKERS))
+MAPPING_FILE_CACHE_ENABLED = os.environ.get("MAPPING_FILE_CACHE_ENABLED", "true").lower() == "true"
+WAYSTAR_PREFETCH_MAX_PAGES = int(os.environ.get("WAYSTAR_PREFETCH_MAX_PAGES", 20))
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "false").lower() == "true"
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 5))
+CLAIM_MAX_ATTEMPTS = int(os.environ.get("CLAIM_MAX_ATTEMPTS", 3))
+CLAIM_RETRY_BACKOFF = float(os.environ.get("CLAIM_RETRY_BACKOFF", 30))
+MAX_CONSECUTIVE_CLAIM_FAILURES = int(os.environ.get("MAX_CONSECUTIVE_CLAIM_FAILURES", 5))
+BROWSER_HEADLESS = os.environ.get("BROWSER_HEADLESS", "false").lower() == "true"
+BLOCK_UNNEEDED_RESOURCES = os.environ.get("BLOCK_UNNEEDED_RESOURCES", "false").lower() == "true"
+SESSION_COOKIES_ENABLED = os.environ.get("SESSION_COOKIES_ENABLED", "true").lower() == "true"
+SESSION_COOKIES_MAX_AGE = int(os.environ.get("SESSION_COOKIES_MAX_AGE", 14400))
+SESSION_COOKIES_KEY = os.environ.get("SESSION_COOKIES_KEY", "")
 tabs_dict = {}
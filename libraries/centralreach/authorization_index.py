@@ -0,0 +1,28 @@
+from bisect import bisect_right
+
+
+class AuthorizationIndex():
+    """
+    SECONDARY authorizations of a client for one month, sorted by start date.
+    Each authorization is a dict with since_date, until_date, manager_name, authorization_number,
+    auth_doc_url and row_position. Manager name and authorization number are None until they are read.
+    """
+
+    def __init__(self, authorizations: list):
+        self.authorizations = sorted(authorizations, key=lambda authorization: authorization["since_date"])
+        self.since_dates = [authorization["since_date"] for authorization in self.authorizations]
+
+    def __len__(self):
+        return len(self.authorizations)
+
+    def find_covering(self, claim_dates: list):
+        """
+        Returns the authorizations whose since/until range covers all the claim dates.
+        Only authorizations starting on or before the first date are checked (binary search on the start dates).
+        """
+        if not claim_dates:
+            return []
+        first_date = min(claim_dates)
+        last_date = max(claim_dates)
+        candidates = self.authorizations[:bisect_right(self.since_dates, first_date)]
+        return [authorization for authorization in candidates if authorization["until_date"] >= last_date]
@@ -1,13 +1,27 @@
-import time
 from libraries.common import (
     log_message,
     act_on_element,
     capture_page_screenshot,
     switch_window,
+    wait_for_page_ready,
+    timed_step,
+    wait_for_table_rows,
+    extract_table_rows,
+    mark_for_rerender,
+    wait_for_rerender,
+    click_without_waiting,
+    LRUCache,
     get_month_difference_between_dates
 )
-from config import OUTPUT_FOLDER, RunMode, tabs_dict
+from libraries.centralreach.centralreach_api import CentralReachAPI
+from libraries.centralreach.authorization_index import AuthorizationIndex
+from libraries.session_store import SessionStore
+from config import OUTPUT_FOLDER, STATE_FOLDER, RunMode, RUN_STATE_KEY, CENTRALREACH_DATA_MODE, CENTRALREACH_API_URL, CENTRALREACH_API_RECORD_FOLDER, CLIENT_CACHE_SIZE, CLAIMS_START_DATE, CLAIMS_END_DATE, tabs_dict
 from datetime import date, datetime
+import copy
+import hashlib
+import json
+import os
 
 class CentralReach():
 
@@ -16,11 +30,15 @@ class CentralReach():
         self.centralreach_url = credentials["url"]
         self.centralreach_login = credentials["login"]
         self.centralreach_password = credentials["password"]
+        self.session_store = SessionStore(rpa_selenium_instance, "centralreach", ["centralreach.com"], "{}:{}".format(self.centralreach_login, self.centralreach_password))
+        self.session_restored = False
         #self.start_date = "09/01/2021"
-        self.start_date = "03/01/2022"
-        self.end_date = "03/27/2022"
+        self.start_date = CLAIMS_START_DATE
+        self.end_date = CLAIMS_END_DATE
         self.maximum_months_date_range = 6
         self.base_filtered_claims_url = ""
+        self.secondary_label_id = "23593"
+        self.bill_status = "4"
         self.full_filtered_claims_url = ""
         self.payor_name = ""
         self.client_id = ""
@@ -36,6 +54,26 @@ class CentralReach():
         self.relationship_to_check = "18"
         self.total_amounts_dict = {}
         self.labels_applied_count = 0
+        self.data_mode = CENTRALREACH_DATA_MODE
+        self.api = None
+        self.client_cache = LRUCache("client name", CLIENT_CACHE_SIZE)
+        self.subscriber_cache = LRUCache("subscriber information", CLIENT_CACHE_SIZE)
+        self.provider_cache = LRUCache("provider label", CLIENT_CACHE_SIZE)
+        self.authorization_cache = LRUCache("authorization index", CLIENT_CACHE_SIZE)
+        self.authorization_page_key = None
+        self.pending_label_groups = {}
+        self.excluded_payors = ["Florida Medicaid", "Kentucky Medicaid FFS", "Kentucky SLP", "Tricare"]
+        self.payor_filter_header_xpath = '//div[@id="content"]/table/thead[@class="tableFloatingHeaderOriginal"]/tr[last()]/th[contains(normalize-space(), "Payor")]/a'
+        self.payor_filter_links_xpath = '//div[@id="insurancesFilterList"]//li/a[@class="filter-id"]'
+        self.billing_rows_xpath = '//div[@id="content"]/table/tbody/tr[contains(@class, "row-item")]'
+        self.applied_label_groups_file = os.path.join(STATE_FOLDER, "applied_label_groups_{}.jsonl".format(RUN_STATE_KEY))
+        self.applied_label_groups = self.load_applied_label_groups()
+        # ClaimJournal of the run, set by the process to mark the claims whose labels were applied as completed
+        self.claim_journal = None
+        self.authorization_code_column_pos = 5
+        self.secondary_authorization_rows_xpath = '//div[@class="module-grid"]/table/tbody/tr[child::td[position() = {} and descendant::a[text() = "SECONDARY"]]]'.format(self.authorization_code_column_pos)
+        # Claim attributes that the pipeline mode extracts in a claim context
+        self.claim_context_attributes = ["claim_id", "client_id", "payor_is_sc_medicaid", "client_name", "provider_label", "total_amounts_dict", "authorization_number", "manager_name"]
 
 
 
@@ -43,13 +81,47 @@ class CentralReach():
         """
         Login to CentralReach with Bitwarden credentials.
         """
+        self.start_login()
+        self.finish_login()
+
+    @timed_step
+    def start_login(self):
+        """
+        Opens CentralReach with the saved session cookies if there are valid ones, otherwise submits the login form
+        without waiting for the page it loads, so the other portals can start their login meanwhile.
+        """
         try:
             log_message("Start - Login CentralReach")
             #tabs_dict["CentralReachMain"] = len(tabs_dict)
+            self.session_restored = self.session_store.restore()
             switch_window("CentralReachMain", self.centralreach_url, open_new_window = False)
-            self.input_credentials()
+            if not self.session_restored:
+                self.input_credentials()
+        except Exception:
+            capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_Login")
+            raise Exception("Login to CentralReach failed")
+
+    @timed_step
+    def finish_login(self):
+        """
+        Waits until CentralReach is logged in. If the restored session isn't valid, logs in with the credentials.
+        """
+        try:
+            switch_window("CentralReachMain")
+            if self.session_restored:
+                if not self.session_store.is_logged_in('//div[@id="contact-details"]', '//input[@id="Username"]'):
+                    log_message("CentralReach restored session is not valid, logging in")
+                    self.session_store.clear()
+                    self.session_restored = False
+                    self.input_credentials()
+            act_on_element('//div[@id="contact-details"]', "find_element", 10)
+            if not self.session_restored:
+                self.session_store.save()
+            if self.data_mode == "api":
+                log_message("CentralReach data will be read from the JSON API")
+                self.api = CentralReachAPI.from_browser(self.browser, CENTRALREACH_API_URL, CENTRALREACH_API_RECORD_FOLDER)
             log_message("Finish - Login CentralReach")
-        except Exception as e:
+        except Exception:
             capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_Login")
             raise Exception("Login to CentralReach failed")
 
@@ -57,13 +129,13 @@ class CentralReach():
         """
         Function that writes the credentials and submits the login form.
         """
-        act_on_element('//input[@id="Username"]', "find_element")
+        act_on_element('//input[@id="Username"]', "find_element", 10)
         self.browser.input_text_when_element_is_visible('//input[@id="Username"]', self.centralreach_login)
         self.browser.input_text_when_element_is_visible('//input[@id="Password"]', self.centralreach_password)
-        self.browser.click_element('//button[@id="login"]')
-        act_on_element('//div[@id="contact-details"]', "find_element", 10)
+        click_without_waiting('//button[@id="login"]')
         return
 
+    @timed_step
     def filter_claims_list(self):
         """
         Filters claims in the Billing menu with two filters activated ('TA-Secondary' filter and date range).
@@ -73,11 +145,12 @@ class CentralReach():
         end_date_tmp = datetime.strptime(self.end_date, "%m/%d/%Y").strftime("%Y-%m-%d")
 
         self.base_filtered_claims_url = "https://members.centralreach.com/#billingmanager/billing/?startdate={}&enddate={}".format(start_date_tmp, end_date_tmp)
-        self.full_filtered_claims_url = "{}&billingLabelIdIncluded=23593&billStatus=4".format(self.base_filtered_claims_url)
+        self.full_filtered_claims_url = "{}&billingLabelIdIncluded={}&billStatus={}".format(self.base_filtered_claims_url, self.secondary_label_id, self.bill_status)
         switch_window("CentralReachMain", self.full_filtered_claims_url)
         self.open_extra_centralreach_tabs()
         log_message("End - Filter Claims List")
 
+    @timed_step
     def open_extra_centralreach_tabs(self):
         """
         Function that opens two tabs 
@@ -97,91 +170,197 @@ class CentralReach():
 
         log_message("Finish - Open Extra CentralReach tabs")
         
+    @timed_step
     def get_payors_list(self):
         """
-        Function that gets the payor list from the filtered claims.
+        Function that gets the payor list from the filtered claims as plain data (name, filter id, url and excluded flag),
+        so the payor loop doesn't depend on the filter list elements.
         """
         log_message("Start - Get Payors List")
         try:
             switch_window("CentralReachMain")
-            act_on_element('//div[@id="content"]/table/thead[@class="tableFloatingHeaderOriginal"]/tr[last()]/th[contains(normalize-space(), "Payor")]/a', 'click_element')
-            payor_element_list = act_on_element('//div[@id="insurancesFilterList"]//li/a[@class="filter-id" and not(child::span[text() = " > Medicaid"])]', "find_elements")
+            act_on_element(self.payor_filter_header_xpath, 'click_element')
+            payor_rows = wait_for_table_rows('{}[not(child::span[text() = " > Medicaid"])]'.format(self.payor_filter_links_xpath), {
+                "name": "./span",
+                "filter_id": (".", "data-id"),
+                "url": (".", "href")
+            })
         except:
             capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_get_payors_list")
             raise Exception("Get payors list in CentralReach failed")
+        payor_list = []
+        for payor_row in payor_rows:
+            payor = {
+                "name": payor_row["name"].replace(">", "").strip(),
+                "filter_id": payor_row["filter_id"],
+                "url": payor_row["url"] if payor_row["url"] and "#billingmanager/billing" in payor_row["url"] else "",
+            }
+            payor["excluded"] = payor["name"] in self.excluded_payors
+            if payor["excluded"]:
+                log_message("{} is in the excluded payor list. Skipping".format(payor["name"]))
+            payor_list.append(payor)
         log_message("Finish - Get payors list")
-        return payor_element_list
+        return payor_list
 
-    def get_payor_name_from_element(self, payor_element):
+    @timed_step
+    def select_payor(self, payor: dict):
         """
-        Function that gets the name of the current payor element in the loop
-        and also checks if it's in the excluded list.
+        Function that filters the billing grid by the payor, by url when the filter link has one,
+        otherwise clicking the filter link found by its filter id (or name).
         """
+        self.payor_name = payor["name"]
         try:
             switch_window("CentralReachMain")
-            self.payor_name = payor_element.find_element_by_xpath('./span').text
-            self.payor_name = self.payor_name.replace(">", "").strip()
-            excluded_payors = ["Florida Medicaid", "Kentucky Medicaid FFS", "Kentucky Medicaid FFS", "Kentucky SLP", "Tricare"]
-            if self.payor_name in excluded_payors:
-                log_message("{} is in the excluded payor list. Skipping".format(self.payor_name))
-                self.payor_name = None
+            # get_claims_result waits until these rows are replaced by the rows of the payor
+            mark_for_rerender(self.billing_rows_xpath)
+            if payor["url"]:
+                switch_window("CentralReachMain", payor["url"])
+                return
+            if payor["filter_id"]:
+                payor_xpath = '{}[@data-id = "{}"]'.format(self.payor_filter_links_xpath, payor["filter_id"])
             else:
-                act_on_element(payor_element, "click_element")
+                payor_xpath = '{}[normalize-space(translate(span, ">", "")) = "{}"]'.format(self.payor_filter_links_xpath, payor["name"])
+            try:
+                act_on_element(payor_xpath, "click_element", 2)
+            except:
+                act_on_element(self.payor_filter_header_xpath, 'click_element')
+                act_on_element(payor_xpath, "click_element")
         except:
-            capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_get_payor_name_from_element")
-            raise Exception("Get payor name from element failed.")
+            capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_select_payor")
+            raise Exception("Select payor {} failed.".format(payor["name"]))
 
-    def get_claims_result(self):
-        """Function that gets the claims from list with a specific payor"""
+    @timed_step
+    def get_claims_result(self, client_filter=None):
+        """
+        Function that gets the billing entries from list with a specific payor.
+        With a client filter (e.g. the shard of a parallel worker), only the entries of the clients it accepts are returned.
+        """
         log_message("Start - Get Claims Result")
+        client_name_column_pos = 9
+        if self.api:
+            start_date = datetime.strptime(self.start_date, "%m/%d/%Y").strftime("%Y-%m-%d")
+            end_date = datetime.strptime(self.end_date, "%m/%d/%Y").strftime("%Y-%m-%d")
+            entries = self.api.get_billing_entries(start_date, end_date, self.payor_name, self.secondary_label_id, self.bill_status)
+            if client_filter is not None:
+                entries = [entry for entry in entries if client_filter(str(entry.get("clientId", "")))]
+            log_message("Finish - Get Claims Result: {} billing entries".format(len(entries)))
+            return [str(entry["id"]) for entry in entries]
         try:
             switch_window("CentralReachMain")
-            time.sleep(2)
-            rows = act_on_element('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item")]', "find_elements")
+            wait_for_rerender(self.billing_rows_xpath, "centralreach", replaced_sleep=2)
+            rows = wait_for_table_rows(self.billing_rows_xpath, {
+                "row_id": (".", "id"),
+                "client_id": ('./td[{}]/a[contains(@class, "vcard")]'.format(client_name_column_pos), "contactid")
+            })
+            if client_filter is not None:
+                rows = [row for row in rows if client_filter(row["client_id"] or "")]
+            entry_ids = [row["row_id"].split("billing-grid-row-")[1].strip() for row in rows if row["row_id"]]
         except:
             capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_claims_result")
             log_message("No claims result found for this payor.")
-            rows = []
+            entry_ids = []
             #raise Exception("No claims result found for this payor.")
 
-        log_message("Finish - Get Claims Result")
-        return rows
+        log_message("Finish - Get Claims Result: {} billing entries".format(len(entry_ids)))
+        return entry_ids
 
-    def get_claim_information(self, claim_result):
+    def open_claims_grid(self, tab_name: str, url: str, replaced_sleep: float = 2):
         """
-        Function that gets the claim id and searchs it in a new tab to extract the full details
+        Function that goes to a billing or claims grid url in the tab and waits until the rows of the previous grid
+        are replaced, so the rows read next belong to the new url.
         """
-        log_message("Start - Get Claim Information")
+        switch_window(tab_name)
+        mark_for_rerender(self.billing_rows_xpath)
+        switch_window(tab_name, url)
+        wait_for_rerender(self.billing_rows_xpath, "centralreach", replaced_sleep=replaced_sleep)
+
+    @timed_step
+    def get_claim_records(self, entry_ids: list):
+        """
+        Function that resolves the billing entries of a payor to claim records (claim id, entry ids, payor and client id).
+        Entries that belong to an already resolved claim are not searched again, so each claim is processed once.
+        """
+        log_message("Start - Get Claim Records")
+        if self.api:
+            claim_records = self.api.get_claim_records(entry_ids)
+            for claim_record in claim_records:
+                claim_record["claim_search_url"] = "{}&claimId={}".format(self.base_filtered_claims_url, claim_record["claim_id"])
+            log_message("Finish - Get Claim Records: {} claims from {} billing entries".format(len(claim_records), len(entry_ids)))
+            return claim_records
+
         claim_id_column_pos = 3
         payor_column_pos = 10
         client_name_column_pos = 9
+        claim_rows_xpath = self.billing_rows_xpath
+        claim_records = []
+        resolved_entry_ids = set()
+        for entry_id in entry_ids:
+            if entry_id in resolved_entry_ids:
+                continue
+            try:
+                billing_entry_url = "https://members.centralreach.com/#claims/list/?billingEntryId={}".format(entry_id)
+                self.open_claims_grid("CentralReachClaim2", billing_entry_url, 0)
+                claim_id = act_on_element('{}[position() = 1]/td[{}]'.format(claim_rows_xpath, claim_id_column_pos), "find_element").text
+                claim_search_url = "{}&claimId={}".format(self.base_filtered_claims_url, claim_id)
+
+                self.open_claims_grid("CentralReachClaim1", claim_search_url)
+                claim_rows = wait_for_table_rows(claim_rows_xpath, {
+                    "row_id": (".", "id"),
+                    "payor": './td[{}]'.format(payor_column_pos),
+                    "client_id": ('./td[{}]/a[contains(@class, "vcard")]'.format(client_name_column_pos), "contactid")
+                }, 10)
+            except:
+                capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_get_claim_records")
+                raise Exception("Get Claim records failed.")
+            claim_entry_ids = [row["row_id"].split("billing-grid-row-")[1].strip() for row in claim_rows if row["row_id"]]
+            resolved_entry_ids.update(claim_entry_ids)
+            resolved_entry_ids.add(entry_id)
+            claim_records.append({
+                "claim_id": claim_id,
+                "entry_ids": claim_entry_ids,
+                "payor": claim_rows[0]["payor"],
+                "client_id": claim_rows[0]["client_id"],
+                "claim_search_url": claim_search_url
+            })
+        log_message("Finish - Get Claim Records: {} claims from {} billing entries".format(len(claim_records), len(entry_ids)))
+        return claim_records
+
+    @timed_step
+    def get_claim_information(self, claim_record: dict):
+        """
+        Function that opens the claim search of a claim record to extract the full details
+        """
+        log_message("Start - Get Claim Information")
+        client_name_column_pos = 9
         provider_column_pos = 11
+        self.claim_id = claim_record["claim_id"]
+        self.client_id = claim_record["client_id"]
+        self.payor_is_sc_medicaid = self.sc_medicaid_cr_name.lower() in claim_record["payor"].lower()
+        if self.api:
+            self.get_claim_information_from_api(claim_record)
+            log_message("Finish - Get Claim Information")
+            return
         try:
-            switch_window("CentralReachMain")
-            entry_id = claim_result.get_attribute("id")
-            entry_id = entry_id.split("billing-grid-row-")[1].strip()
-
-            billing_entry_url = "https://members.centralreach.com/#claims/list/?billingEntryId={}".format(entry_id)
-            switch_window("CentralReachClaim2", billing_entry_url)
-            self.claim_id = act_on_element('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item") and position() = 1]/td[{}]'.format(claim_id_column_pos), "find_element").text
-            claim_search_url = "{}&claimId={}".format(self.base_filtered_claims_url, self.claim_id)
-            
-            switch_window("CentralReachClaim1", claim_search_url)
-            time.sleep(2)
-            claim_payor = act_on_element('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item") and position() = 1]/td[{}]'.format(payor_column_pos),'find_element', 10).text
+            self.open_claims_grid("CentralReachClaim1", claim_record["claim_search_url"])
             client_element = act_on_element('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item") and position() = 1]/td[{}]/a[contains(@class, "vcard")]'.format(client_name_column_pos),'find_element', 10)
-            self.client_id = client_element.get_attribute("contactid")
             
-            if self.sc_medicaid_cr_name.lower() in claim_payor.lower():
-                self.payor_is_sc_medicaid = True
+            if self.payor_is_sc_medicaid:
                 self.get_total_amounts()
 
-            act_on_element(client_element, 'click_element')
-            self.client_name = act_on_element('//div[@id="contactcard"]//h5[@class="no-margin-bottom"]', 'find_element').text
+            self.client_name = self.client_cache.get(self.client_id)
+            if self.client_name is None:
+                act_on_element(client_element, 'click_element')
+                self.client_name = act_on_element('//div[@id="contactcard"]//h5[@class="no-margin-bottom"]', 'find_element').text
+                self.client_cache.put(self.client_id, self.client_name)
             print("Client id {}, Client name: {}".format(self.client_id, self.client_name))
             act_on_element('//th[text() = "RATE"]', 'click_element')
-            act_on_element('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item") and position() = 1]/td[{}]/a[contains(@class, "vcard")]'.format(provider_column_pos),'click_element', 10)
-            self.provider_label = act_on_element('//span[@class="tag-name" and contains(text(), "Certification")]', 'find_element').text
+            provider_element = act_on_element('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item") and position() = 1]/td[{}]/a[contains(@class, "vcard")]'.format(provider_column_pos),'find_element', 10)
+            provider_id = provider_element.get_attribute("contactid")
+            self.provider_label = self.provider_cache.get(provider_id)
+            if self.provider_label is None:
+                act_on_element(provider_element, 'click_element', 10)
+                self.provider_label = act_on_element('//span[@class="tag-name" and contains(text(), "Certification")]', 'find_element').text
+                self.provider_cache.put(provider_id, self.provider_label)
             self.labels_dict = {
                 "labels_to_add": [],
                 "labels_to_remove": []
@@ -191,65 +370,184 @@ class CentralReach():
             raise Exception("Get Claim information failed.")
         
         log_message("Finish - Get Claim Information")
+
+    def get_claim_information_from_api(self, claim_record: dict):
+        """
+        Function that gets the client and provider details of a claim record from the CentralReach API
+        """
+        try:
+            self.client_name = self.client_cache.get(self.client_id)
+            self.provider_label = self.provider_cache.get(claim_record["provider_id"])
+            if self.client_name is None or self.provider_label is None:
+                claim_details = self.api.get_claim_details(claim_record)
+                self.client_name = claim_details["client_name"]
+                self.provider_label = claim_details["provider_label"]
+                self.client_cache.put(self.client_id, self.client_name)
+                self.provider_cache.put(claim_record["provider_id"], self.provider_label)
+            if self.payor_is_sc_medicaid:
+                self.total_amounts_dict = self.api.get_total_amounts(self.claim_id)
+            self.labels_dict = {
+                "labels_to_add": [],
+                "labels_to_remove": []
+            }
+        except Exception as e:
+            log_message("Get Claim information from API failed: {}".format(str(e)))
+            raise Exception("Get Claim information failed.")
          
 
+    def create_claim_extractor(self):
+        """
+        Function that returns a copy of this instance with its own API session, to extract claims in the pipeline extractor thread.
+        The session is copied from the logged in API session, as the active browser tab can be another site (e.g. Waystar).
+        The copy shares the client, subscriber, provider and authorization caches.
+        """
+        claim_extractor = copy.copy(self)
+        if self.api:
+            claim_extractor.api = self.api.copy_session()
+        else:
+            switch_window("CentralReachMain")
+            claim_extractor.api = CentralReachAPI.from_browser(self.browser, CENTRALREACH_API_URL, CENTRALREACH_API_RECORD_FOLDER)
+        return claim_extractor
+
+    @timed_step
+    def extract_claim_context(self, claim_record: dict):
+        """
+        Function that extracts everything the submission of a claim needs from the CentralReach API and returns it as a dict:
+        claim information, authorization (and the labels of an invalid one), and subscriber information or service lines.
+        """
+        self.get_claim_information(claim_record)
+        claim_context = {"labels_dict": copy.deepcopy(self.labels_dict)}
+        claim_context["valid_auth_number"] = self.get_authorization_number()
+        claim_context["authorization_labels_dict"] = self.labels_dict
+        claim_context["subscriber_info_dict"] = {}
+        claim_context["service_lines_list"] = []
+        if claim_context["valid_auth_number"]:
+            if self.payor_is_sc_medicaid:
+                claim_context["service_lines_list"] = self.get_service_lines()
+            else:
+                self.get_subscriber_information()
+                claim_context["subscriber_info_dict"] = self.subscriber_info_dict
+        for attribute in self.claim_context_attributes:
+            claim_context[attribute] = getattr(self, attribute)
+        return claim_context
+
+    def load_claim_context(self, claim_context: dict):
+        """
+        Function that sets the claim attributes from a claim context extracted by the pipeline extractor
+        """
+        for attribute in self.claim_context_attributes:
+            setattr(self, attribute, claim_context[attribute])
+        self.labels_dict = copy.deepcopy(claim_context["labels_dict"])
+        self.subscriber_info_dict = claim_context["subscriber_info_dict"]
+
+    @timed_step
     def get_authorization_number(self):
         """
         Function that gets the authorization number of the secondary Claim.
+        The SECONDARY authorizations are indexed once per client and month, later claims of the client reuse the index.
         """
         log_message("Start - Get Authorization Number on CentralReach")
         date_column_pos = 7
-        code_column_pos = 5
+        self.authorization_number = ""
 
-        switch_window("CentralReachClaim1")
-        claim_dates = act_on_element('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item")]/td[{}]/span[contains(@class, "inline-block")]'.format(date_column_pos),'find_elements')
-        claim_dates = [datetime.strptime(claim_date.text, "%m/%d/%y") for claim_date in claim_dates]
+        if self.api:
+            claim_dates = self.api.get_claim_dates(self.claim_id)
+        else:
+            switch_window("CentralReachClaim1")
+            claim_dates = self.get_claim_dates(date_column_pos)
+            claim_dates = [datetime.strptime(claim_date, "%m/%d/%y") for claim_date in claim_dates]
         first_claim_date = claim_dates[0]
-        claim_month_date = int(first_claim_date.strftime("%m"))
-        claim_year_date = first_claim_date.strftime("%Y")
-        auth_url = "https://members.centralreach.com/#billingmanager/authorizations/?clientId={}".format(self.client_id)
-        
+        authorization_key = (self.client_id, first_claim_date.month, first_claim_date.year)
+
+        authorization_index = self.authorization_cache.get(authorization_key)
+        if authorization_index is None:
+            authorization_index = self.build_authorization_index(*authorization_key)
+            self.authorization_cache.put(authorization_key, authorization_index)
+        else:
+            log_message("Reusing authorization index of client {} for {}/{}".format(*authorization_key))
+
+        valid_secondary_authorizations = authorization_index.find_covering(claim_dates)
+        if len(valid_secondary_authorizations) == 1:
+            log_message("All claims are in valid range for this secondary.")
+            secondary_authorization = valid_secondary_authorizations[0]
+            if self.payor_is_sc_medicaid:
+                if secondary_authorization["manager_name"] is None:
+                    self.read_authorization_manager_name(authorization_key, secondary_authorization)
+                self.manager_name = secondary_authorization["manager_name"]
+            if secondary_authorization["authorization_number"] is None:
+                switch_window("CentralReachClientInfo", secondary_authorization["auth_doc_url"], skip_if_current = True)
+                self.authorization_page_key = None
+                secondary_authorization["authorization_number"] = act_on_element('//input[@data-bind="value: authorizationNumber"]', 'find_element', 15).get_attribute("value")
+                wait_for_page_ready("centralreach", replaced_sleep=5)
+            self.authorization_number = secondary_authorization["authorization_number"]
+        elif len(valid_secondary_authorizations) >= 2:
+            self.authorization_number = None
+        else:
+            log_message("Secondary claim not found")
+        log_message("Finish - Get authorization number in CentralReach")
+        return self.check_if_valid_auth_number()
+
+    def open_authorizations_page(self, client_id: str, month: int, year: int):
+        """
+        Function that opens the authorizations of the client for the month in the CentralReachClientInfo tab
+        """
+        if self.authorization_page_key == (client_id, month, year):
+            switch_window("CentralReachClientInfo")
+            return
+        auth_url = "https://members.centralreach.com/#billingmanager/authorizations/?clientId={}".format(client_id)
         switch_window("CentralReachClientInfo", auth_url)
         act_on_element('//button[child::span[@data-bind="text: monthDisplay"]]','click_element', 15)
-        act_on_element('//li[{}]/a[@data-click="setMonth"]'.format(claim_month_date),'click_element')
+        act_on_element('//li[{}]/a[@data-click="setMonth"]'.format(month),'click_element')
         act_on_element('//button[child::span[@data-bind="text: year"]]','click_element')
-        act_on_element('//li/a[@data-click="setYear" and text() = "{}"]'.format(claim_year_date),'click_element')
-        time.sleep(2)
+        act_on_element('//li/a[@data-click="setYear" and text() = "{}"]'.format(year),'click_element')
+        wait_for_page_ready("centralreach", replaced_sleep=2)
+        self.authorization_page_key = (client_id, month, year)
+
+    def build_authorization_index(self, client_id: str, month: int, year: int):
+        """
+        Function that reads the SECONDARY authorizations of the client for the month into an AuthorizationIndex
+        """
+        if self.api:
+            return AuthorizationIndex(self.api.get_authorizations(client_id, month, year))
+
+        since_column_pos = 6
+        until_column_pos = 7
+        self.open_authorizations_page(client_id, month, year)
         try:
-            secondary_rows = act_on_element('//div[@class="module-grid"]/table/tbody/tr[child::td[position() = {} and descendant::a[text() = "SECONDARY"]]]'.format(code_column_pos),'find_elements')
+            secondary_rows = wait_for_table_rows(self.secondary_authorization_rows_xpath, {
+                "since_date": './td[{}]/div'.format(since_column_pos),
+                "until_date": './td[{}]/div'.format(until_column_pos),
+                "auth_doc_url": ('./td[{}]/a[child::i[contains(@class, "fa-file")]]'.format(self.authorization_code_column_pos), "href")
+            })
         except:
             capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_get_authorization_number")
-            log_message("Secondary claim not found")   
-        else:
-            since_column_pos = 6
-            until_column_pos = 7
-            valid_secondary_claims = []
-            for row in secondary_rows:
-                since_date = row.find_element_by_xpath('./td[{}]/div'.format(since_column_pos)).text
-                since_date = datetime.strptime(since_date, "%m/%d/%Y")
-                until_date = row.find_element_by_xpath('./td[{}]/div'.format(until_column_pos)).text
-                until_date = datetime.strptime(until_date, "%m/%d/%Y")
-                claims_in_range = [claim_date for claim_date in claim_dates if since_date <= claim_date <= until_date]
-
-                if len(claims_in_range) == len(claim_dates):
-                    log_message("All claims are in valid range for this secondary.")
-                    valid_secondary_claims.append(row)
-                
-            if len(valid_secondary_claims) == 1:
-                secondary_row = valid_secondary_claims[0]
-                if self.payor_is_sc_medicaid:
-                    act_on_element(secondary_row.find_element_by_xpath('//div[@class="module-grid"]/table/tbody/tr[child::td[position() = 5 and descendant::a[text() = "SECONDARY"]]]//a[contains(@data-koset, "managerId")]'), 'click_element')
-                    self.manager_name = act_on_element('//div[@id="contactcard"]//h5[@class="no-margin-bottom"]', 'find_element').text
-                
-                auth_doc_url = secondary_row.find_element_by_xpath('./td[{}]/a[child::i[contains(@class, "fa-file")]]'.format(code_column_pos)).get_attribute("href")
-                self.browser.go_to(auth_doc_url)
-                self.authorization_number = act_on_element('//input[@data-bind="value: authorizationNumber"]', 'find_element', 15).get_attribute("value")
-            elif len(valid_secondary_claims) >= 2:
-                self.authorization_number = None
-        time.sleep(5) # delete later
-        log_message("Finish - Get authorization number in CentralReach")
-        return self.check_if_valid_auth_number()
+            secondary_rows = []
+        authorizations = [{
+            "since_date": datetime.strptime(row["since_date"], "%m/%d/%Y"),
+            "until_date": datetime.strptime(row["until_date"], "%m/%d/%Y"),
+            "auth_doc_url": row["auth_doc_url"],
+            "row_position": row_position,
+            "manager_name": None,
+            "authorization_number": None
+        } for row_position, row in enumerate(secondary_rows, 1)]
+        return AuthorizationIndex(authorizations)
 
+    def read_authorization_manager_name(self, authorization_key: tuple, secondary_authorization: dict):
+        """
+        Function that opens the manager card of a SECONDARY authorization and stores the manager name in it
+        """
+        self.open_authorizations_page(*authorization_key)
+        act_on_element('({})[{}]//a[contains(@data-koset, "managerId")]'.format(self.secondary_authorization_rows_xpath, secondary_authorization["row_position"]), 'click_element')
+        secondary_authorization["manager_name"] = act_on_element('//div[@id="contactcard"]//h5[@class="no-margin-bottom"]', 'find_element').text
+
+    def get_claim_dates(self, date_column_pos: int):
+        """
+        Function that returns the date text of every row in the claims list of the current tab
+        """
+        claim_rows = wait_for_table_rows('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item")]', {
+            "date": './td[{}]/span[contains(@class, "inline-block")]'.format(date_column_pos)
+        })
+        return [claim_row["date"] for claim_row in claim_rows if claim_row["date"]]
 
     def check_if_valid_auth_number(self):
         """
@@ -265,14 +563,32 @@ class CentralReach():
             valid_auth_number = True
         return valid_auth_number
         
+    @timed_step
     def get_subscriber_information(self):
         """
         Function that gets subscriber information from the secondary payor of the client.
         """
         log_message("Start - Get Subscriber Information on CentralReach")
 
+        subscriber_info_dict = self.subscriber_cache.get((self.client_id, self.payor_name))
+        if subscriber_info_dict is not None:
+            self.subscriber_info_dict = dict(subscriber_info_dict)
+            log_message("Finish - Get Subscriber Information on CentralReach (cached)")
+            return
+
+        if self.api:
+            try:
+                self.subscriber_info_dict = self.api.get_subscriber_information(self.client_id, self.payor_name, self.relationship_to_check)
+                self.subscriber_cache.put((self.client_id, self.payor_name), dict(self.subscriber_info_dict))
+            except Exception as e:
+                log_message("Get Subscriber Information from API failed: {}".format(str(e)))
+                raise Exception("Get Subscriber Information failed.")
+            log_message("Finish - Get Subscriber Information on CentralReach")
+            return
+
         payors_patient_info_url = "https://members.centralreach.com/#contacts/details/?id={}&mode=profile&edit=payors".format(self.client_id)
         switch_window("CentralReachClientInfo", payors_patient_info_url)
+        self.authorization_page_key = None
         act_on_element('//div[@class="list-group"]/div[descendant::div[@class = "txt-lg" and normalize-space() = "Secondary: {}"]]//a[text() = "Details"]'.format(self.payor_name),'click_element', 20)
         act_on_element('//a[@data-toggle="tab" and child::span[text() = "Subscriber"]]','click_element')
         try:
@@ -293,50 +609,76 @@ class CentralReach():
                 birthday = ""
         except:
             capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_get_subscriber_information")
+            self.invalidate_client_cache(self.client_id)
             raise Exception("Get Subscriber Information failed.")
         else:
-            self.subscriber_info_dict['first_name'] = first_name
-            self.subscriber_info_dict['last_name'] = last_name
-            self.subscriber_info_dict['gender'] = gender
-            self.subscriber_info_dict['insured_id'] = insured_id
-            self.subscriber_info_dict['patient_relationship_to_subscriber'] = patient_relationship_to_subscriber
-            self.subscriber_info_dict['birthday'] = birthday
+            self.subscriber_info_dict = {
+                'first_name': first_name,
+                'last_name': last_name,
+                'gender': gender,
+                'insured_id': insured_id,
+                'patient_relationship_to_subscriber': patient_relationship_to_subscriber,
+                'birthday': birthday
+            }
+            self.subscriber_cache.put((self.client_id, self.payor_name), dict(self.subscriber_info_dict))
 
         log_message("Finish - Get Subscriber Information on CentralReach")
 
+    def invalidate_client_cache(self, client_id: str = None):
+        """
+        Function that removes the cached name and subscriber information of a client (or of every client)
+        """
+        if client_id is None:
+            self.client_cache.invalidate()
+            self.subscriber_cache.invalidate()
+        else:
+            self.client_cache.invalidate(client_id)
+            self.subscriber_cache.invalidate(where=lambda key: key[0] == client_id)
+
+    def log_cache_stats(self):
+        """
+        Function that logs the hits and misses of the client and provider caches
+        """
+        for cache in [self.client_cache, self.subscriber_cache, self.provider_cache, self.authorization_cache]:
+            cache.log_stats()
+
+    @timed_step
     def get_service_lines(self):
         """
         Function that returns the service lines of the claim in a list of dictionaries
         """
         log_message("Start - Get Service Lines from CentralReach")
+        if self.api:
+            service_lines_dict_list = self.api.get_service_lines(self.claim_id)
+            log_message("Finish - Get Service Lines from CentralReach")
+            return service_lines_dict_list
         service_lines_claim_url = "https://members.centralreach.com/#claims/editor/?claimId={}&page=serviceLines".format(self.claim_id)
-        switch_window("CentralReachClaim2", service_lines_claim_url)
+        switch_window("CentralReachClaim2", service_lines_claim_url, skip_if_current = True)
         service_lines_base_xpath = '//div[contains(@data-bind, "filteredServiceLines()") and descendant::h2[contains(normalize-space(), "Service Lines")]]'
         service_lines_table_xpath = '{}/table/tbody/tr'.format(service_lines_base_xpath)
         service_lines_dict_list = []
-        service_lines_rows = act_on_element(service_lines_table_xpath, 'find_elements', 10)
+        service_lines_rows = wait_for_table_rows(service_lines_table_xpath, {
+            "date_from": './td[contains(@data-bind, "serviceDateFrom")]',
+            "place": './td[contains(@data-bind, "placeOfService")]',
+            "hcpcs_code": './td[contains(@data-bind, "formattedService")]',
+            "charges": './td[contains(@data-bind, "amount")]',
+            "units": './td[contains(@data-bind, "formattedUnits")]'
+        }, 10)
         for service_lines_row in service_lines_rows:
-            date_from = service_lines_row.find_element_by_xpath('./td[contains(@data-bind, "serviceDateFrom")]').text
-            place = service_lines_row.find_element_by_xpath('./td[contains(@data-bind, "placeOfService")]').text
-            hcpcs_code = service_lines_row.find_element_by_xpath('./td[contains(@data-bind, "formattedService")]').text.strip()
-            charges = service_lines_row.find_element_by_xpath('./td[contains(@data-bind, "amount")]').text
-            charges = charges.replace("$", "").strip()
-            units = service_lines_row.find_element_by_xpath('./td[contains(@data-bind, "formattedUnits")]').text
-            units = units.replace("UN", "").strip()
-
             service_lines_dict = {
-                "from_date_service": date_from,
-                "to_date_service" : date_from,
-                "place": place,
-                "hcpcs_code": hcpcs_code,
-                "charge": charges,
-                "units": units
+                "from_date_service": service_lines_row["date_from"],
+                "to_date_service" : service_lines_row["date_from"],
+                "place": service_lines_row["place"],
+                "hcpcs_code": service_lines_row["hcpcs_code"],
+                "charge": service_lines_row["charges"].replace("$", "").strip(),
+                "units": service_lines_row["units"].replace("UN", "").strip()
             }
             service_lines_dict_list.append(service_lines_dict)
         log_message("Finish - Get Service Lines from CentralReach")
         return service_lines_dict_list
 
     
+    @timed_step
     def get_total_amounts(self):
         """
         Function that gets the total amounts (Owed and Paid) from the claims generated with the same claim number
@@ -350,12 +692,12 @@ class CentralReach():
         if month_difference >= self.maximum_months_date_range:
             log_message("Month difference is greater than {} months".format(self.maximum_months_date_range))
             date_column_pos = 7
-            claim_dates = act_on_element('//div[@id="content"]/table/tbody/tr[contains(@class, "row-item")]/td[{}]/span[contains(@class, "inline-block")]'.format(date_column_pos),'find_elements')
-            claim_dates = [datetime.strptime(claim_date.text, "%m/%d/%y").strftime("%Y-%m-%d") for claim_date in claim_dates]
+            claim_dates = self.get_claim_dates(date_column_pos)
+            claim_dates = [datetime.strptime(claim_date, "%m/%d/%y").strftime("%Y-%m-%d") for claim_date in claim_dates]
             new_start_date = claim_dates[-1]
             new_end_date = claim_dates[0]
             new_claim_url = "https://members.centralreach.com/#billingmanager/billing/?startdate={}&enddate={}&claimId={}".format(new_start_date, new_end_date, self.claim_id)
-            self.browser.go_to(new_claim_url)
+            self.open_claims_grid("CentralReachClaim1", new_claim_url, 0)
 
         act_on_element('//a[text() = "Load Totals"]', 'click_element', 10)
         owed_amount = act_on_element('//tr[contains(@data-bind, "totalsLoaded") and not(contains(@style, "display: none"))]//span[contains(@data-bind, "amountOwedAgreed")]', 'find_element').text
@@ -372,57 +714,190 @@ class CentralReach():
         }
         log_message("Finish - Get Claims Total Amounts from CentralReach")
 
-    def apply_and_remove_labels_to_claims(self):
+    def queue_labels_for_claim(self, claim_record: dict):
         """
-        Function that bulk applies and removes certain labels to claims.
+        Function that stores the label decision of the current claim so it's applied in bulk at the end of the payor pass.
+        Claims with the same labels to add and remove are grouped together.
         """
-        log_message("Start - Apply and Remove Labels to Claims")
-        applied_changes = True
-        if len(self.labels_dict['labels_to_add']) > 0 or len(self.labels_dict['labels_to_remove']) > 0:
-            self.labels_applied_count += 1
-            print("labels_applied_count", self.labels_applied_count)
-            print("self.labels_dict", self.labels_dict)
-            switch_window("CentralReachClaim1")
-            time.sleep(1)
-            labels_to_add = self.labels_dict.get('labels_to_add', [])
-            labels_to_remove = self.labels_dict.get('labels_to_remove', [])
+        labels_to_add = self.labels_dict.get('labels_to_add', [])
+        labels_to_remove = self.labels_dict.get('labels_to_remove', [])
+        if len(labels_to_add) == 0 and len(labels_to_remove) == 0:
+            return False
+        label_group_key = (tuple(sorted(set(labels_to_add))), tuple(sorted(set(labels_to_remove))))
+        self.pending_label_groups.setdefault(label_group_key, []).append(claim_record)
+        return True
+
+    def get_label_group_id(self, label_group_key: tuple, claim_records: list):
+        """
+        Function that returns a stable id for a label group of a payor, used in the applied label groups record
+        """
+        claim_ids = sorted(claim_record["claim_id"] for claim_record in claim_records)
+        group_text = json.dumps([self.payor_name, self.start_date, self.end_date, label_group_key, claim_ids])
+        return hashlib.sha256(group_text.encode()).hexdigest()
+
+    def load_applied_label_groups(self):
+        """
+        Function that reads the ids of the label groups already applied by previous (crashed) runs
+        """
+        applied_label_groups = set()
+        if os.path.exists(self.applied_label_groups_file):
+            with open(self.applied_label_groups_file) as applied_file:
+                for line in applied_file:
+                    if line.strip():
+                        applied_label_groups.add(json.loads(line)["group_id"])
+        return applied_label_groups
+
+    def clear_applied_label_groups(self):
+        """
+        Function that removes the applied label groups record of the run once it finished normally
+        """
+        if os.path.exists(self.applied_label_groups_file):
+            os.remove(self.applied_label_groups_file)
+        self.applied_label_groups = set()
+
+    def record_applied_label_group(self, group_id: str, label_group_key: tuple, claim_records: list):
+        """
+        Function that appends an applied label group to the record file and flushes it to disk
+        """
+        with open(self.applied_label_groups_file, "a") as applied_file:
+            applied_file.write(json.dumps({
+                "group_id": group_id,
+                "payor": self.payor_name,
+                "labels_to_add": label_group_key[0],
+                "labels_to_remove": label_group_key[1],
+                "claim_ids": [claim_record["claim_id"] for claim_record in claim_records],
+                "applied_at": datetime.now().isoformat()
+            }) + "\n")
+            applied_file.flush()
+            os.fsync(applied_file.fileno())
+        self.applied_label_groups.add(group_id)
+
+    @timed_step
+    def apply_pending_labels(self):
+        """
+        Function that applies the queued labels and payments of the payor pass, one bulk selection per label group.
+        Only the claims whose billing entries were all labeled are recorded as applied and completed.
+        Returns the claim records whose labels couldn't be applied.
+        """
+        log_message("Start - Apply Pending Labels: {} groups".format(len(self.pending_label_groups)))
+        unlabeled_claim_records = []
+        for label_group_key, claim_records in self.pending_label_groups.items():
+            group_id = self.get_label_group_id(label_group_key, claim_records)
+            if group_id in self.applied_label_groups:
+                log_message("Label group {} for {} claims was already applied. Skipping".format(label_group_key, len(claim_records)))
+                labeled_claim_records = claim_records
+            else:
+                labeled_claim_records = self.apply_label_group(claim_records, list(label_group_key[0]), list(label_group_key[1]))
+                if RunMode.save_changes and labeled_claim_records:
+                    self.record_applied_label_group(self.get_label_group_id(label_group_key, labeled_claim_records), label_group_key, labeled_claim_records)
+            if self.claim_journal is not None:
+                for claim_record in labeled_claim_records:
+                    self.claim_journal.record(claim_record["claim_id"], "completed")
+            unlabeled_claim_records.extend(claim_record for claim_record in claim_records if claim_record not in labeled_claim_records)
+        self.pending_label_groups = {}
+        log_message("Finish - Apply Pending Labels: {} claims not labeled".format(len(unlabeled_claim_records)))
+        return unlabeled_claim_records
+
+    def get_billing_grid_entry_ids(self):
+        """
+        Function that returns the billing entry ids of the rows shown in the billing grid of the current tab
+        """
+        rows = extract_table_rows(self.billing_rows_xpath, {"row_id": (".", "id")})
+        return [row["row_id"].split("billing-grid-row-")[1].strip() for row in rows if row["row_id"]]
+
+    def apply_label_group(self, claim_records: list, labels_to_add: list, labels_to_remove: list):
+        """
+        Function that labels the claims of a label group. The claims whose billing entries are all in the payor billing grid
+        are labeled in one bulk selection. The grid is filtered by label and bill status and paged, so the other claims
+        are labeled one by one from their claim search, which shows all their entries.
+        Returns the claim records whose billing entries were all labeled.
+        """
+        switch_window("CentralReachMain")
+        wait_for_page_ready("centralreach", replaced_sleep=1)
+        grid_entry_ids = set(self.get_billing_grid_entry_ids())
+        grid_claim_records = [claim_record for claim_record in claim_records if claim_record["entry_ids"] and set(claim_record["entry_ids"]) <= grid_entry_ids]
+        labeled_claim_records = []
+        if grid_claim_records:
+            entry_ids = [entry_id for claim_record in grid_claim_records for entry_id in claim_record["entry_ids"]]
+            self.apply_and_remove_labels_to_claims(entry_ids, labels_to_add, labels_to_remove)
+            labeled_claim_records.extend(grid_claim_records)
+        for claim_record in claim_records:
+            if claim_record in grid_claim_records:
+                continue
+            log_message("Billing entries of claim {} are not all in the billing grid, labeling them from the claim search".format(claim_record["claim_id"]))
             try:
-                act_on_element('//div[@id="content"]/table/thead[@class="tableFloatingHeaderOriginal"]/tr[last()]/th[contains(@class, "check")]/input[@type = "checkbox"]','click_element')
-                act_on_element('//div[@id="content"]/table/thead[@class="tableFloatingHeaderOriginal"]//button[contains(normalize-space(), "Label selected")]','click_element')
-                
-                for label in labels_to_add:
-                    self.browser.input_text_when_element_is_visible('//div[@class="modal-body"]/div[@class="panel panel-default" and descendant::h4 = "Apply Labels"]//input[contains(@class, "select2-input")]', label)
-                    act_on_element('//div[@id="select2-drop"]//div[@class="select2-result-label" and text() = "{}"]'.format(label),'click_element')
-                
-                for label in labels_to_remove:
-                    self.browser.input_text_when_element_is_visible('//div[@class="modal-body"]/div[@class="panel panel-default" and descendant::h4 = "Remove Labels"]//input[@class="select2-input select2-default"]', label)
-                    act_on_element('//div[@id="select2-drop"]//div[@class="select2-result-label" and text() = "{}"]'.format(label),'click_element')
-                
-                time.sleep(2) #delete later
-                if RunMode.save_changes:
-                    act_on_element('//button[text() = "Apply Label Changes"]','click_element')
-                else:
-                    act_on_element('//div[@class="modal in" and descendant::h2[contains(text(), "Bulk Apply Labels")]]//button[text() = "Close"]','click_element')
-        
-                act_on_element('//div[@id="content"]/table/thead[@class="tableFloatingHeaderOriginal"]//a[@id="btnBillingPayment"]','click_element')
-                act_on_element('//form[@id="bulk-payments-main-form"]//input[@class = "form-control hasDatepicker"]','find_element', 10)
-                todays_date = datetime.today().strftime("%m/%d/%Y")
-                self.browser.input_text_when_element_is_visible('//form[@id="bulk-payments-main-form"]//input[@class = "form-control hasDatepicker"]', todays_date)
-                act_on_element('//select[@name="payment-type"]', "click_element")
-                act_on_element('//select[@name="payment-type"]/option[text() = "Activity"]', "click_element")
-                reference_txt = ", ".join(labels_to_add)
-                self.browser.input_text_when_element_is_visible('//input[contains(@data-bind, "reference")]', reference_txt)
-                act_on_element('//select[@class = "form-control required add-create-payor"]', "click_element")
-                act_on_element('//select[@class = "form-control required add-create-payor"]/option[contains(text(), "Secondary:")]', "click_element")
-                time.sleep(8) #delete later
-                if RunMode.save_changes:
-                    act_on_element('//button[text() = "Apply Payments"]','click_element')
-                else:
-                    act_on_element('//div[@class="bulk-payments-container"]//button[text() = "Cancel"]','click_element')
+                self.open_claims_grid("CentralReachClaim1", claim_record["claim_search_url"])
+                self.apply_and_remove_labels_to_claims(claim_record["entry_ids"], labels_to_add, labels_to_remove)
             except Exception as e:
-                capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_Apply_and_remove_labels_to_claim")
-                raise Exception("Apply and remove labels to claims failed.")
-        else:
-            applied_changes = False
+                log_message("Labels of claim {} were not applied: {}".format(claim_record["claim_id"], str(e)), "WARN")
+                continue
+            labeled_claim_records.append(claim_record)
+        return labeled_claim_records
+
+    def select_billing_rows(self, entry_ids: list):
+        """
+        Function that checks the rows of the billing entries in the billing grid and unchecks any other row.
+        Returns the number of selected rows.
+        """
+        return self.browser.driver.execute_script("""
+            var entryIds = arguments[0], selected = 0;
+            var rows = document.querySelectorAll('#content table tbody tr.row-item');
+            for (var i = 0; i < rows.length; i++) {
+                var checkbox = rows[i].querySelector('td.check input[type="checkbox"]');
+                if (checkbox === null) { continue; }
+                var shouldBeChecked = entryIds.indexOf(rows[i].id.replace('billing-grid-row-', '')) >= 0;
+                if (checkbox.checked !== shouldBeChecked) { checkbox.click(); }
+                if (shouldBeChecked) { selected++; }
+            }
+            return selected;
+        """, entry_ids)
+
+    @timed_step
+    def apply_and_remove_labels_to_claims(self, entry_ids: list, labels_to_add: list, labels_to_remove: list):
+        """
+        Function that bulk applies and removes certain labels to the billing entries of a group of claims,
+        in the billing grid of the current tab. Nothing is applied unless every billing entry is selected.
+        """
+        log_message("Start - Apply and Remove Labels to Claims")
+        self.labels_applied_count += 1
+        log_message("Label group {}: labels to add {}, labels to remove {}".format(self.labels_applied_count, labels_to_add, labels_to_remove))
+        try:
+            act_on_element(self.billing_rows_xpath, "find_elements")
+            selected_rows = self.select_billing_rows(entry_ids)
+            if selected_rows == 0 or selected_rows != len(set(entry_ids)):
+                raise Exception("Only {} of {} billing entries were found in the billing grid".format(selected_rows, len(set(entry_ids))))
+            act_on_element('//div[@id="content"]/table/thead[@class="tableFloatingHeaderOriginal"]//button[contains(normalize-space(), "Label selected")]','click_element')
+
+            for label in labels_to_add:
+                self.browser.input_text_when_element_is_visible('//div[@class="modal-body"]/div[@class="panel panel-default" and descendant::h4 = "Apply Labels"]//input[contains(@class, "select2-input")]', label)
+                act_on_element('//div[@id="select2-drop"]//div[@class="select2-result-label" and text() = "{}"]'.format(label),'click_element')
+            
+            for label in labels_to_remove:
+                self.browser.input_text_when_element_is_visible('//div[@class="modal-body"]/div[@class="panel panel-default" and descendant::h4 = "Remove Labels"]//input[@class="select2-input select2-default"]', label)
+                act_on_element('//div[@id="select2-drop"]//div[@class="select2-result-label" and text() = "{}"]'.format(label),'click_element')
+            
+            wait_for_page_ready("centralreach", replaced_sleep=2)
+            if RunMode.save_changes:
+                act_on_element('//button[text() = "Apply Label Changes"]','click_element')
+            else:
+                act_on_element('//div[@class="modal in" and descendant::h2[contains(text(), "Bulk Apply Labels")]]//button[text() = "Close"]','click_element')
+    
+            act_on_element('//div[@id="content"]/table/thead[@class="tableFloatingHeaderOriginal"]//a[@id="btnBillingPayment"]','click_element')
+            act_on_element('//form[@id="bulk-payments-main-form"]//input[@class = "form-control hasDatepicker"]','find_element', 10)
+            todays_date = datetime.today().strftime("%m/%d/%Y")
+            self.browser.input_text_when_element_is_visible('//form[@id="bulk-payments-main-form"]//input[@class = "form-control hasDatepicker"]', todays_date)
+            act_on_element('//select[@name="payment-type"]', "click_element")
+            act_on_element('//select[@name="payment-type"]/option[text() = "Activity"]', "click_element")
+            reference_txt = ", ".join(labels_to_add)
+            self.browser.input_text_when_element_is_visible('//input[contains(@data-bind, "reference")]', reference_txt)
+            act_on_element('//select[@class = "form-control required add-create-payor"]', "click_element")
+            act_on_element('//select[@class = "form-control required add-create-payor"]/option[contains(text(), "Secondary:")]', "click_element")
+            wait_for_page_ready("centralreach", replaced_sleep=8)
+            if RunMode.save_changes:
+                act_on_element('//button[text() = "Apply Payments"]','click_element')
+            else:
+                act_on_element('//div[@class="bulk-payments-container"]//button[text() = "Cancel"]','click_element')
+        except Exception:
+            capture_page_screenshot(OUTPUT_FOLDER, "Exception_centralreach_Apply_and_remove_labels_to_claim")
+            raise Exception("Apply and remove labels to claims failed.")
         log_message("Finish - Apply and Remove Labels to Claims")
-        return applied_changes
@@ -0,0 +1,215 @@
+import copy
+import json
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from datetime import datetime
+from libraries.common import log_message
+from libraries.centralreach.centralreach_api_replay import get_record_file_name
+
+
+class CentralReachAPI():
+    """
+    Client for the JSON endpoints that the members.centralreach.com SPA itself calls.
+    It reuses the cookies of the authenticated Selenium session in a pooled HTTP session.
+    The base url can point to a local stand-in server (CentralReachReplayServer) that replays the responses
+    recorded with record_folder, one file per method and params.
+    """
+
+    # Endpoint methods used by the SPA, called as POST {base_url}/api/?{method}
+    methods = {
+        "billing_entries": "billing.loadbillingentries",
+        "claims": "claims.loadclaims",
+        "claim_service_lines": "claims.loadclaimservicelines",
+        "billing_totals": "billing.loadbillingtotals",
+        "billing_payments": "billing.loadbillingpayments",
+        "contact": "contacts.loadcontact",
+        "contact_tags": "contacts.loadcontacttags",
+        "contact_payors": "contacts.loadcontactpayors",
+        "authorizations": "billing.loadauthorizations",
+    }
+
+    def __init__(self, base_url: str, cookies: list = None, record_folder: str = "", timeout: int = 30):
+        self.base_url = base_url.rstrip("/")
+        self.record_folder = record_folder
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept": "application/json", "X-Requested-With": "XMLHttpRequest"})
+        for cookie in cookies or []:
+            self.session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+
+    @classmethod
+    def from_browser(cls, rpa_selenium_instance, base_url: str, record_folder: str = ""):
+        """
+        Creates the client with the cookies of the logged in browser session.
+        """
+        client = cls(base_url, rpa_selenium_instance.driver.get_cookies(), record_folder)
+        client.session.headers["User-Agent"] = rpa_selenium_instance.driver.execute_script("return navigator.userAgent;")
+        return client
+
+    def copy_session(self):
+        """
+        Creates a client with its own HTTP session and the cookies and headers of this one, e.g. for another thread.
+        The cookies are not read from the browser again, since its active tab can be another site.
+        """
+        client = type(self)(self.base_url, record_folder=self.record_folder, timeout=self.timeout)
+        client.session.headers.update(self.session.headers)
+        for cookie in self.session.cookies:
+            client.session.cookies.set_cookie(copy.copy(cookie))
+        return client
+
+    def call(self, endpoint: str, payload: dict = None):
+        """
+        Calls an endpoint method and returns the decoded JSON response.
+        """
+        method = self.methods[endpoint]
+        response = self.session.post("{}/api/?{}".format(self.base_url, method), json=payload or {}, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if self.record_folder:
+            with open(os.path.join(self.record_folder, get_record_file_name(method, payload)), "w") as record_file:
+                json.dump({"request": payload or {}, "response": data}, record_file, indent=2)
+        if isinstance(data, dict) and data.get("success") is False:
+            raise Exception("CentralReach API {} failed: {}".format(method, data.get("message", "")))
+        return data
+
+    def get_items(self, endpoint: str, payload: dict = None):
+        """
+        Calls an endpoint that returns a list of items.
+        """
+        data = self.call(endpoint, payload)
+        return data.get("items", []) if isinstance(data, dict) else data
+
+    @staticmethod
+    def format_date(date_value: str, date_format: str = "%m/%d/%Y"):
+        """
+        Converts an ISO date of the API (2022-03-01T00:00:00) to the format shown in the UI.
+        """
+        if not date_value:
+            return ""
+        return datetime.strptime(date_value[:10], "%Y-%m-%d").strftime(date_format)
+
+    @staticmethod
+    def format_amount(amount):
+        return "{:.2f}".format(float(amount or 0))
+
+    def get_billing_entries(self, start_date: str, end_date: str, payor_name: str = "", label_id: str = "", bill_status: str = ""):
+        """
+        Returns the billing grid rows of the date range (dates in YYYY-MM-DD), optionally filtered by payor.
+        """
+        payload = {"startDate": start_date, "endDate": end_date, "billingLabelIdIncluded": label_id, "billStatus": bill_status}
+        entries = self.get_items("billing_entries", payload)
+        if payor_name:
+            entries = [entry for entry in entries if entry.get("payorName", "").replace(">", "").strip() == payor_name]
+        return entries
+
+    def get_claim_records(self, entry_ids: list):
+        """
+        Resolves billing entries to claim records (claim id, entry ids, payor, client and provider) in one call.
+        Entries of the same claim are merged into one record.
+        """
+        claim_records = {}
+        for claim in self.get_items("claims", {"billingEntryIds": entry_ids}):
+            claim_id = str(claim["id"])
+            if claim_id not in claim_records:
+                claim_records[claim_id] = {
+                    "claim_id": claim_id,
+                    "entry_ids": [],
+                    "payor": claim.get("payorName", ""),
+                    "client_id": str(claim["clientId"]),
+                    "provider_id": str(claim["providerId"]),
+                }
+            entry_id = str(claim.get("billingEntryId", ""))
+            if entry_id and entry_id not in claim_records[claim_id]["entry_ids"]:
+                claim_records[claim_id]["entry_ids"].append(entry_id)
+        return list(claim_records.values())
+
+    def get_claim_details(self, claim_record: dict):
+        """
+        Returns the client name and the provider certification label of a claim record.
+        """
+        client = self.call("contact", {"contactId": claim_record["client_id"]})
+        provider_tags = self.get_items("contact_tags", {"contactId": claim_record["provider_id"]})
+        provider_label = next((tag["name"] for tag in provider_tags if "Certification" in tag.get("name", "")), "")
+        return {
+            "client_name": "{} {}".format(client.get("firstName", ""), client.get("lastName", "")).strip(),
+            "provider_label": provider_label,
+        }
+
+    def get_claim_dates(self, claim_id: str):
+        """
+        Returns the service dates of the billing entries of a claim, newest first as in the billing grid.
+        """
+        entries = self.get_items("billing_entries", {"claimId": claim_id})
+        claim_dates = [datetime.strptime(entry["dateOfService"][:10], "%Y-%m-%d") for entry in entries]
+        return sorted(claim_dates, reverse=True)
+
+    def get_authorizations(self, client_id: str, month: int, year: int):
+        """
+        Returns the SECONDARY authorizations of the client for the month as dicts with since/until dates,
+        manager name and authorization number.
+        """
+        authorizations = self.get_items("authorizations", {"clientId": client_id, "month": month, "year": year})
+        return [{
+            "since_date": datetime.strptime(authorization["startDate"][:10], "%Y-%m-%d"),
+            "until_date": datetime.strptime(authorization["endDate"][:10], "%Y-%m-%d"),
+            "manager_name": authorization.get("managerName", ""),
+            "authorization_number": authorization.get("authorizationNumber", ""),
+            "auth_doc_url": "",
+            "row_position": 0,
+        } for authorization in authorizations if str(authorization.get("code", "")).upper() == "SECONDARY"]
+
+    def get_subscriber_information(self, client_id: str, payor_name: str, relationship_to_check: str):
+        """
+        Returns the subscriber_info_dict of the client's secondary payor.
+        """
+        payors = self.get_items("contact_payors", {"contactId": client_id})
+        payor = next(payor for payor in payors if payor.get("type", "").lower() == "secondary" and payor.get("name", "") == payor_name)
+        subscriber = payor.get("subscriber", {})
+        patient_relationship_to_subscriber = str(payor.get("patient", {}).get("relationType", ""))
+        birthday = ""
+        if patient_relationship_to_subscriber.upper() == relationship_to_check.upper():
+            birthday = self.format_date(subscriber.get("birthDate", ""))
+        return {
+            "first_name": subscriber.get("firstName", ""),
+            "last_name": subscriber.get("lastName", ""),
+            "gender": subscriber.get("gender", ""),
+            "insured_id": subscriber.get("policyId", ""),
+            "patient_relationship_to_subscriber": patient_relationship_to_subscriber,
+            "birthday": birthday,
+        }
+
+    def get_total_amounts(self, claim_id: str):
+        """
+        Returns the total_amounts_dict (owed, paid and paid date) of the billing entries of a claim.
+        """
+        totals = self.call("billing_totals", {"claimId": claim_id})
+        payments = self.get_items("billing_payments", {"claimId": claim_id})
+        paid_date = self.format_date(payments[0]["date"]) if payments else ""
+        return {
+            "paid_amount": self.format_amount(totals.get("amountPaid")),
+            "coinsurance_amount": self.format_amount(totals.get("amountOwedAgreed")),
+            "paid_date": paid_date,
+        }
+
+    def get_service_lines(self, claim_id: str):
+        """
+        Returns the service lines of the claim in the same dicts as CentralReach.get_service_lines.
+        """
+        service_lines = self.get_items("claim_service_lines", {"claimId": claim_id})
+        service_lines_dict_list = []
+        for service_line in service_lines:
+            date_from = self.format_date(service_line.get("serviceDateFrom", ""))
+            service_lines_dict_list.append({
+                "from_date_service": date_from,
+                "to_date_service": date_from,
+                "place": str(service_line.get("placeOfService", "")),
+                "hcpcs_code": str(service_line.get("formattedService", "")).strip(),
+                "charge": self.format_amount(service_line.get("amount")),
+                "units": str(service_line.get("units", "")),
+            })
+        log_message("{} service lines loaded from CentralReach API".format(len(service_lines_dict_list)))
+        return service_lines_dict_list
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def get_record_file_name(method: str, payload: dict = None):
+    """
+    Returns the file name of the recording of an API call: the method and a hash of its params,
+    so every call of a method with different params keeps its own response.
+    """
+    params_hash = hashlib.sha256(json.dumps(payload or {}, sort_keys=True).encode()).hexdigest()[:16]
+    return "{}_{}.json".format(method, params_hash)
+
+
+class CentralReachReplayServer():
+    """
+    Local stand-in for the CentralReach JSON API that replays the responses recorded with
+    CENTRALREACH_API_RECORD_FOLDER. Point CENTRALREACH_API_URL to its base_url to run the API mode on recorded data.
+    """
+
+    def __init__(self, record_folder: str, port: int = 0):
+        self.record_folder = record_folder
+        self.port = port
+        self.server = None
+        self.server_thread = None
+        self.requests_count = 0
+        self.missing_recordings = []
+        # Cookie header of every request, to check which session made the calls
+        self.cookie_headers = []
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def get_response(self, method: str, payload: dict):
+        """
+        Returns the recorded response of the call, or None if it wasn't recorded.
+        """
+        self.requests_count += 1
+        record_file_name = get_record_file_name(method, payload)
+        record_file_path = os.path.join(self.record_folder, record_file_name)
+        if not os.path.exists(record_file_path):
+            self.missing_recordings.append(record_file_name)
+            return None
+        with open(record_file_path) as record_file:
+            return json.load(record_file)["response"]
+
+    def start(self):
+        replay_server = self
+
+        class ReplayHandler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                method = self.path.split("?", 1)[1] if "?" in self.path else ""
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+                replay_server.cookie_headers.append(self.headers.get("Cookie", ""))
+                response = replay_server.get_response(method, json.loads(body or b"{}"))
+                if response is None:
+                    self.send_json(404, {"success": False, "message": "No recording of {} with these params".format(method)})
+                else:
+                    self.send_json(200, response)
+
+            def send_json(self, status: int, data):
+                content = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), ReplayHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    # python -m libraries.centralreach.centralreach_api_replay <record folder> [port]
+    replay_server = CentralReachReplayServer(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 8765)
+    print("Replaying {} on {}".format(replay_server.record_folder, replay_server.start()))
+    try:
+        replay_server.server_thread.join()
+    except KeyboardInterrupt:
+        replay_server.stop()
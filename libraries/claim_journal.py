@@ -0,0 +1,108 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class ClaimJournal():
+    """
+    SQLite journal of the state of each claim, kept in the state folder so a run can resume after a crash:
+    extracted (CentralReach data read), submitted (Waystar / SC Medicaid done, labels decided) and completed (labels applied).
+    Every transition is committed when it's recorded. A disabled journal (development runs, nothing saved) records nothing.
+    The journal is kept per run (date range and RUN_ID) and cleared once the run finishes normally.
+    """
+
+    def __init__(self, database_path: str, enabled: bool = True):
+        self.database_path = database_path
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.connection = None
+        if not enabled:
+            return
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS claims (
+                claim_id TEXT PRIMARY KEY,
+                payor TEXT,
+                state TEXT,
+                labels_to_add TEXT,
+                labels_to_remove TEXT,
+                claim_context TEXT,
+                elapsed_seconds REAL,
+                updated_at TEXT
+            )""")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS transitions (
+                claim_id TEXT,
+                state TEXT,
+                recorded_at TEXT
+            )""")
+        self.connection.commit()
+
+    def get(self, claim_id: str):
+        """
+        Returns the journal entry of the claim as a dict, or None if it was never recorded.
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT state, labels_to_add, labels_to_remove, claim_context, elapsed_seconds FROM claims WHERE claim_id = ?", (claim_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "state": row[0],
+            "labels_dict": {"labels_to_add": json.loads(row[1] or "[]"), "labels_to_remove": json.loads(row[2] or "[]")},
+            "claim_context": json.loads(row[3]) if row[3] else None,
+            "elapsed_seconds": row[4] or 0,
+        }
+
+    def record(self, claim_id: str, state: str, payor: str = "", labels_dict: dict = None, claim_context: dict = None, elapsed_seconds: float = None):
+        """
+        Records a state transition of the claim. Values not given keep the ones already recorded.
+        """
+        if not self.enabled:
+            return
+        recorded_at = datetime.now().isoformat()
+        labels_dict = labels_dict or {}
+        with self.lock:
+            self.connection.execute("INSERT OR IGNORE INTO claims (claim_id) VALUES (?)", (claim_id,))
+            self.connection.execute("""
+                UPDATE claims SET
+                    payor = COALESCE(NULLIF(?, ''), payor),
+                    state = ?,
+                    labels_to_add = COALESCE(?, labels_to_add),
+                    labels_to_remove = COALESCE(?, labels_to_remove),
+                    claim_context = COALESCE(?, claim_context),
+                    elapsed_seconds = COALESCE(?, elapsed_seconds),
+                    updated_at = ?
+                WHERE claim_id = ?""", (
+                    payor,
+                    state,
+                    json.dumps(labels_dict["labels_to_add"]) if "labels_to_add" in labels_dict else None,
+                    json.dumps(labels_dict["labels_to_remove"]) if "labels_to_remove" in labels_dict else None,
+                    json.dumps(claim_context) if claim_context is not None else None,
+                    elapsed_seconds,
+                    recorded_at,
+                    claim_id
+                ))
+            self.connection.execute("INSERT INTO transitions (claim_id, state, recorded_at) VALUES (?, ?, ?)", (claim_id, state, recorded_at))
+            self.connection.commit()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def clear(self):
+        """
+        Closes the journal and removes its database files, so the next run of the same date range starts from scratch.
+        """
+        self.close()
+        if not self.enabled:
+            return
+        for file_path in (self.database_path, "{}-wal".format(self.database_path), "{}-shm".format(self.database_path)):
+            if os.path.exists(file_path):
+                os.remove(file_path)
@@ -1,12 +1,17 @@
-import shutil, time, os, sys
+import shutil, time, os, sys, json, select, ctypes, ctypes.util, functools, csv, hashlib, threading
+from contextlib import contextmanager
+from collections import OrderedDict
 from robot.api import logger
-from datetime import datetime, timedelta
+from datetime import datetime
 from RPA.Robocorp.Vault import Vault
 from RPA.Browser.Selenium import Selenium
 from RPA.FileSystem import FileSystem
 from ta_bitwarden_cli.ta_bitwarden_cli import Bitwarden
-from config import OUTPUT_FOLDER, tabs_dict
+from config import OUTPUT_FOLDER, ELEMENT_WAIT_POLL_FREQUENCY, TIMING_SPANS_ENABLED, BLOCK_UNNEEDED_RESOURCES, tabs_dict
 from RPA.Excel.Files import Files
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 
 
 browser = Selenium()
@@ -101,69 +106,789 @@ def capture_page_screenshot(folder_path: str, name: str = None):
     )
 
 
-def act_on_element(path: str, action: str, time_range: int = 5):
+timing_spans = []
+# Open spans of each thread, so the steps of the pipeline extractor thread nest on their own
+timing_span_stacks = threading.local()
+timing_start = time.perf_counter()
+
+
+@contextmanager
+def timing_span(name: str, category: str = "step", **span_args):
+    """
+    Times the block as a span nested under the currently open spans (run -> payor -> claim -> step).
+    Yields the span args dict so values known later (e.g. the claim id) can be added.
+    """
+    if not TIMING_SPANS_ENABLED:
+        yield span_args
+        return
+    if not hasattr(timing_span_stacks, "stack"):
+        timing_span_stacks.stack = []
+    timing_span_stack = timing_span_stacks.stack
+    timing_span_stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield span_args
+    except Exception as e:
+        span_args["error"] = str(e)
+        raise
+    finally:
+        timing_span_stack.pop()
+        timing_spans.append({
+            "name": name,
+            "category": category,
+            "start": start - timing_start,
+            "duration": time.perf_counter() - start,
+            "parent": timing_span_stack[-1] if timing_span_stack else "",
+            "thread": threading.current_thread().name,
+            "args": span_args
+        })
+
+
+def timed_step(function):
+    """
+    Decorator that times a driver step as a span.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not TIMING_SPANS_ENABLED:
+            return function(*args, **kwargs)
+        with timing_span(function.__qualname__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def get_percentile(sorted_values: list, percentile: float):
+    """
+    Returns the nearest-rank percentile of a sorted list.
+    """
+    index = max(int(round(percentile / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def export_timing_spans(folder: str = OUTPUT_FOLDER):
+    """
+    Saves the spans as a Chrome trace (chrome://tracing, Perfetto) and a per-step p50/p95 summary table.
+    """
+    if not timing_spans:
+        return
+    thread_ids = {}
+    for span in timing_spans:
+        thread_ids.setdefault(span["thread"], len(thread_ids) + 1)
+    trace_events = [{
+        "name": span["name"],
+        "cat": span["category"],
+        "ph": "X",
+        "ts": int(span["start"] * 1000000),
+        "dur": int(span["duration"] * 1000000),
+        "pid": os.getpid(),
+        "tid": thread_ids[span["thread"]],
+        "args": {key: str(value) for key, value in span["args"].items()}
+    } for span in timing_spans]
+    with open(os.path.join(folder, "timing_trace.json"), "w") as trace_file:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, trace_file)
+
+    durations_by_step = {}
+    for span in timing_spans:
+        durations_by_step.setdefault((span["category"], span["name"]), []).append(span["duration"])
+    summary_rows = []
+    for (category, name), durations in durations_by_step.items():
+        durations.sort()
+        summary_rows.append([category, name, len(durations), round(sum(durations), 3), round(get_percentile(durations, 50), 3), round(get_percentile(durations, 95), 3)])
+    summary_rows.sort(key=lambda row: row[3], reverse=True)
+    with open(os.path.join(folder, "timing_summary.csv"), "w", newline="") as summary_file:
+        writer = csv.writer(summary_file)
+        writer.writerow(["category", "name", "count", "total_s", "p50_s", "p95_s"])
+        writer.writerows(summary_rows)
+    log_message("Timing summary (category | name | count | total | p50 | p95):")
+    for row in summary_rows:
+        log_message("{} | {} | {} | {}s | {}s | {}s".format(*row))
+
+
+element_wait_stats = {}
+
+
+def record_element_wait(path, elapsed: float, retries: int, found: bool):
+    """
+    Stores how long a wait on a locator took and how many times it was retried.
+    """
+    locator = path if isinstance(path, str) else "<WebElement>"
+    stats = element_wait_stats.setdefault(locator, {"waits": 0, "timeouts": 0, "retries": 0, "total_time": 0.0, "max_time": 0.0})
+    stats["waits"] += 1
+    stats["retries"] += retries
+    stats["total_time"] += elapsed
+    stats["max_time"] = max(stats["max_time"], elapsed)
+    if not found:
+        stats["timeouts"] += 1
+
+
+def get_matching_elements(path, condition: str = "present"):
+    """
+    Returns the elements of the locator that match the condition (present, visible, clickable or count>0).
+    """
+    if isinstance(path, WebElement):
+        elements = [path]
+    else:
+        elements = browser.find_elements(path)
+    if condition == "visible":
+        elements = [element for element in elements if element.is_displayed()]
+    elif condition == "clickable":
+        elements = [element for element in elements if element.is_displayed() and element.is_enabled()]
+    elif condition not in ("present", "count>0"):
+        raise ValueError("Unknown wait condition {}".format(condition))
+    return elements
+
+
+def wait_until(path, check, time_range: float = 5, poll_frequency: float = ELEMENT_WAIT_POLL_FREQUENCY, record_wait: bool = True):
+    """
+    Explicit wait that polls the check function until it returns a truthy value.
+    Any exception raised by the check counts as a retry. The wait is recorded under the locator, unless record_wait
+    is False (page readiness waits, recorded in page_ready_stats instead).
+    """
+    attempts = [0]
+
+    def attempt(driver):
+        attempts[0] += 1
+        return check()
+
+    start = time.perf_counter()
+    found = False
+    try:
+        result = WebDriverWait(browser.driver, time_range, poll_frequency, ignored_exceptions=(Exception,)).until(attempt)
+        found = True
+        return result
+    finally:
+        if record_wait:
+            record_element_wait(path, time.perf_counter() - start, max(attempts[0] - 1, 0), found)
+
+
+def act_on_element(path, action: str, time_range: float = 5, condition: str = None, poll_frequency: float = ELEMENT_WAIT_POLL_FREQUENCY):
     """
     Acts as the fluent wait of Selenium.
+    Default conditions: clickable for click_element, present for find_element and count>0 for find_elements.
     """
-    timer = datetime.now() + timedelta(0, time_range)
-    while timer > datetime.now():
-        try:
-            if action == "click_element":
-                browser.click_element(path)
+    if action == "click_element":
+        def check():
+            elements = get_matching_elements(path, condition or "clickable")
+            if elements:
+                browser.click_element(elements[0])
                 return True
-            elif action == "find_elements":
-                results = browser.find_elements(path)
-                if results:
-                    return results
-                else:
-                    raise Exception
-            elif action == "find_element":
-                result = browser.find_element(path)
-                return result
-        except Exception as e:
-            time.sleep(1)
-    raise Exception("Element {} not found".format(path))
+            return False
+    elif action == "find_elements":
+        def check():
+            return get_matching_elements(path, condition or "count>0")
+    elif action == "find_element":
+        def check():
+            elements = get_matching_elements(path, condition or "present")
+            return elements[0] if elements else False
+    else:
+        raise ValueError("Unknown action {}".format(action))
+    try:
+        return wait_until(path, check, time_range, poll_frequency)
+    except TimeoutException:
+        raise Exception("Element {} not found".format(path))
+
+
+def click_without_waiting(path, time_range: float = 5):
+    """
+    Clicks the element from a page script, so the call returns without waiting for the page the click loads
+    (e.g. a login submit) while other tabs are used.
+    """
+    element = act_on_element(path, "find_element", time_range, "clickable")
+    browser.driver.execute_script("var element = arguments[0]; setTimeout(function() { element.click(); }, 0);", element)
+
+
+def log_element_wait_stats(top: int = 20):
+    """
+    Logs the locators that spent the most time waiting and saves all the wait stats in the output folder.
+    """
+    if not element_wait_stats:
+        return
+    sorted_stats = sorted(element_wait_stats.items(), key=lambda item: item[1]["total_time"], reverse=True)
+    log_message("Element waits - top {} locators by total wait time:".format(top))
+    for locator, stats in sorted_stats[:top]:
+        log_message("{:.2f}s total, {:.2f}s max, {} waits, {} retries, {} timeouts - {}".format(
+            stats["total_time"], stats["max_time"], stats["waits"], stats["retries"], stats["timeouts"], locator))
+    with open(os.path.join(OUTPUT_FOLDER, "element_wait_stats.json"), "w") as stats_file:
+        json.dump(dict(sorted_stats), stats_file, indent=2)
+
+
+PENDING_REQUESTS_SCRIPT = """
+var w = window;
+if (!w.__taPendingRequests) {
+    w.__taPendingRequests = {count: 0};
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        w.__taPendingRequests.count++;
+        this.addEventListener('loadend', function() { w.__taPendingRequests.count--; });
+        return send.apply(this, arguments);
+    };
+    if (w.fetch) {
+        var fetch = w.fetch;
+        w.fetch = function() {
+            w.__taPendingRequests.count++;
+            return fetch.apply(this, arguments).finally(function() { w.__taPendingRequests.count--; });
+        };
+    }
+}
+"""
+
+# The Knockout root binding of CentralReach stays applied across hash navigations, so it can't tell that a view
+# has settled: the grids read after a navigation are marked with mark_for_rerender and waited with wait_for_rerender.
+PAGE_READY_SCRIPTS = {
+    "": "return true;",
+    "centralreach": "return typeof window.ko !== 'undefined' && document.getElementById('content') !== null;",
+    "waystar": "return true;",
+    "scmedicaid": "return typeof window.Ajax === 'undefined' || window.Ajax.activeRequestCount === 0;",
+}
+
+page_ready_stats = {}
+
+
+def is_page_ready(site: str = ""):
+    """
+    Checks that the document is loaded, there are no pending XHR/fetch requests and the site specific condition is met.
+    """
+    script = "{} return document.readyState === 'complete' && window.__taPendingRequests.count <= 0 && (typeof window.jQuery === 'undefined' || window.jQuery.active === 0) && (function() {{ {} }})();".format(
+        PENDING_REQUESTS_SCRIPT, PAGE_READY_SCRIPTS[site])
+    return browser.driver.execute_script(script)
+
+
+def wait_for_page_ready(site: str = "", time_range: float = 10, replaced_sleep: float = 0):
+    """
+    Waits until the current page of the site is done loading. Used instead of fixed sleeps.
+    The time waited and the fixed sleep it replaces are stored to measure the savings.
+    It doesn't raise if the page is still busy after the time range, it behaves like the old sleep.
+    """
+    start = time.perf_counter()
+    try:
+        wait_until(site, lambda: is_page_ready(site), time_range, record_wait=False)
+    except TimeoutException:
+        log_message("Page of {} still loading after {} seconds".format(site or "current site", time_range))
+    record_page_ready(site, time.perf_counter() - start, replaced_sleep)
+
+
+def mark_for_rerender(path: str):
+    """
+    Marks the elements of the xpath (e.g. the rows of a grid) before a navigation, so wait_for_rerender can tell
+    when the site has replaced them. Returns the number of marked elements, 0 if nothing is rendered yet.
+    """
+    return browser.driver.execute_script("""
+        var elements = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (var i = 0; i < elements.snapshotLength; i++) { elements.snapshotItem(i).setAttribute('data-ta-stale', '1'); }
+        return elements.snapshotLength;
+    """, path)
+
+
+def wait_for_rerender(path: str, site: str = "", time_range: float = 10, replaced_sleep: float = 0):
+    """
+    Waits until none of the elements marked with mark_for_rerender is left (the site replaced or removed them,
+    e.g. a grid or Tapestry zone update) and the page is ready. The wait is recorded in page_ready_stats.
+    """
+    start = time.perf_counter()
+
+    def rerendered():
+        return not browser.find_elements("xpath:({})[@data-ta-stale]".format(path))
+
+    try:
+        wait_until(path, rerendered, time_range, record_wait=False)
+        wait_until(site, lambda: is_page_ready(site), time_range, record_wait=False)
+    except TimeoutException:
+        log_message("Element {} was not rendered again after {} seconds".format(path, time_range))
+    record_page_ready(site, time.perf_counter() - start, replaced_sleep)
+
+
+def record_page_ready(site: str, elapsed: float, replaced_sleep: float):
+    """
+    Stores the time spent waiting for a site and the fixed sleep time it replaced.
+    """
+    stats = page_ready_stats.setdefault(site or "current site", {"waits": 0, "total_time": 0.0, "replaced_sleep": 0.0})
+    stats["waits"] += 1
+    stats["total_time"] += elapsed
+    stats["replaced_sleep"] += replaced_sleep
+
+
+def log_page_ready_stats():
+    """
+    Logs the page readiness wait times against the fixed sleeps they replaced.
+    """
+    for site, stats in page_ready_stats.items():
+        log_message("Page readiness {}: {} waits, {:.2f}s waited instead of {:.2f}s of fixed sleeps ({:.2f}s saved)".format(
+            site, stats["waits"], stats["total_time"], stats["replaced_sleep"], stats["replaced_sleep"] - stats["total_time"]))
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+PARTIAL_DOWNLOAD_EXTENSIONS = (".crdownload", ".part", ".tmp")
+
+
+class DownloadWatcher():
+    """
+    Watches a folder for a new downloaded file. Uses inotify on Linux and a short polling interval elsewhere.
+    Must be opened before the download starts so no file is missed:
+
+        with DownloadWatcher(OUTPUT_FOLDER, "xlsx") as download:
+            browser.go_to(file_download_url)
+            file_path = download.wait(20)
+    """
+
+    def __init__(self, folder: str = OUTPUT_FOLDER, file_extension: str = "", settle_time: float = 0.3, poll_frequency: float = 0.1):
+        self.folder = folder
+        self.file_extension = file_extension.lower().lstrip(".")
+        self.settle_time = settle_time
+        self.poll_frequency = poll_frequency
+        self.existing_files = set()
+        self.inotify_fd = None
+
+    def __enter__(self):
+        self.existing_files = set(os.listdir(self.folder))
+        self.inotify_fd = self.start_inotify()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    def start_inotify(self):
+        """
+        Returns an inotify file descriptor watching the folder for finished files, or None if inotify is not available.
+        """
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            inotify_fd = libc.inotify_init1(os.O_NONBLOCK)
+            if inotify_fd < 0:
+                return None
+            if libc.inotify_add_watch(inotify_fd, self.folder.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+                os.close(inotify_fd)
+                return None
+            return inotify_fd
+        except (OSError, AttributeError):
+            return None
+
+    def is_downloaded_file(self, file_name: str):
+        """
+        Checks that the file is new, is not a partial download and has the expected extension.
+        """
+        lower_name = file_name.lower()
+        return (
+            file_name not in self.existing_files
+            and not lower_name.endswith(PARTIAL_DOWNLOAD_EXTENSIONS)
+            and lower_name.endswith(".{}".format(self.file_extension))
+        )
+
+    def find_downloaded_file(self):
+        """
+        Returns the path of the new downloaded file in the folder, if any.
+        """
+        for file_name in os.listdir(self.folder):
+            if self.is_downloaded_file(file_name):
+                return os.path.join(self.folder, file_name)
+        return None
+
+    def wait_for_folder_event(self, time_range: float):
+        """
+        Blocks until the folder changes (inotify) or the polling interval ends.
+        """
+        if self.inotify_fd is None:
+            time.sleep(min(time_range, self.poll_frequency))
+            return
+        ready, _, _ = select.select([self.inotify_fd], [], [], time_range)
+        if ready:
+            try:
+                os.read(self.inotify_fd, 4096)
+            except BlockingIOError:
+                pass
+
+    def has_settled_size(self, file_path: str):
+        """
+        Checks that the file size doesn't change during the settle time.
+        """
+        size = os.path.getsize(file_path)
+        time.sleep(self.settle_time)
+        return os.path.exists(file_path) and os.path.getsize(file_path) == size
+
+    def wait(self, time_range: float = 10):
+        """
+        Waits until the downloaded file is in place and returns its exact path.
+        """
+        timer = time.perf_counter() + time_range
+        while True:
+            file_path = self.find_downloaded_file()
+            if file_path and self.has_settled_size(file_path):
+                return file_path
+            remaining = timer - time.perf_counter()
+            if remaining <= 0:
+                raise Exception("The file download timed out")
+            self.wait_for_folder_event(remaining if file_path is None else min(remaining, self.settle_time))
 
 
 def check_file_download_complete(file_extension: str, time_range: int = 10, folder: str = OUTPUT_FOLDER):
     """
-    Checks that a file has finished downloading.
-    """
-    actual_downloaded_files_amount = len(file_system.find_files("{}/*.{}".format(folder, file_extension)))
-    downloaded_files_amount = actual_downloaded_files_amount
-    timer = datetime.now() + timedelta(0, time_range)
-    while not downloaded_files_amount == actual_downloaded_files_amount + 1 and timer > datetime.now():
-        time.sleep(1)
-        downloaded_files = file_system.find_files("{}/*.{}".format(folder, file_extension))
-        downloaded_files_amount = len(downloaded_files)
-    if downloaded_files_amount != actual_downloaded_files_amount + 1:
-        raise Exception("The file download timed out")
-    else:
-        return downloaded_files
+    Checks that a file has finished downloading and returns its path.
+    Only files that appear after this call are detected, use DownloadWatcher to start watching before the download.
+    """
+    with DownloadWatcher(folder, file_extension) as download:
+        return download.wait(time_range)
 
-def switch_window(tab_name: str = "", url: str = "", open_new_window: bool = True):
-    """Function that switches to the desired tab and goes to an url if needed.
-       If the tab name exists, just get the index. Otherwise, creates a new tab.
+class ResourceBlocker():
+    """
+    Blocks the images, web fonts and third-party scripts (analytics, chat widgets) the bot never uses,
+    with the Chrome DevTools Protocol Network.setBlockedURLs of each tab.
+    The block list is set for the site of the url before each navigation. The allowlist of a site removes
+    patterns from its block list, so e.g. login pages keep their captcha and icon fonts keep the links clickable.
     """
-    
-    if tab_name == "":
-        tab_index = 0
-    elif not tab_name in tabs_dict:
+
+    blocked_patterns = [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+        "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+        "*hotjar.com*", "*fullstory.com*", "*newrelic.com*", "*nr-data.net*", "*segment.com*", "*mixpanel.com*", "*pendo.io*",
+        "*intercom.io*", "*intercomcdn.com*", "*zdassets.com*", "*zendesk.com*", "*livechatinc.com*", "*drift.com*",
+        "*gstatic.com*", "*google.com/recaptcha*"
+    ]
+    # Site: host of its urls
+    site_hosts = {
+        "centralreach": "centralreach.com",
+        "waystar": "zirmed.com",
+        "scmedicaid": "scmedicaid.com",
+        "sharepoint": "sharepoint.com",
+    }
+    # Site: block patterns that are not blocked for it
+    site_allowlists = {
+        "centralreach": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.svg"],
+        "waystar": ["*.gif", "*.png"],
+        "scmedicaid": ["*gstatic.com*", "*google.com/recaptcha*"],
+        "sharepoint": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    }
+
+    def __init__(self, rpa_selenium_instance, enabled: bool = False):
+        self.browser = rpa_selenium_instance
+        self.enabled = enabled
+        self.handle_sites = {}
+
+    def get_site(self, url: str):
+        return next((site for site, host in self.site_hosts.items() if host in url), "")
+
+    def get_blocked_patterns(self, site: str):
+        """
+        Returns the block list of the site: the blocked patterns without the ones in its allowlist.
+        """
+        allowlist = self.site_allowlists.get(site, [])
+        return [pattern for pattern in self.blocked_patterns if pattern not in allowlist]
+
+    def apply(self, url: str):
+        """
+        Sets the block list of the url's site on the current tab, if it isn't already set.
+        """
+        if not self.enabled:
+            return
+        site = self.get_site(url)
+        handle = self.browser.driver.current_window_handle
+        if self.handle_sites.get(handle) == site:
+            return
+        try:
+            self.browser.driver.execute_cdp_cmd("Network.enable", {})
+            self.browser.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.get_blocked_patterns(site)})
+        except Exception as e:
+            log_message("Resource blocking is not available in this browser, it's turned off: {}".format(str(e)))
+            self.enabled = False
+            return
+        self.handle_sites[handle] = site
+
+
+class TabManager():
+    """
+    Keeps the window handle of each named tab so switching doesn't depend on the handles list order.
+    Switches to the tab that is already active are skipped. Navigations always load the url, as callers expect fresh
+    content, unless the caller opts in to skipping the url that is already open.
+    """
+
+    def __init__(self, rpa_selenium_instance, handles_dict: dict, resource_blocker: ResourceBlocker = None):
+        self.browser = rpa_selenium_instance
+        self.handles_dict = handles_dict
+        self.resource_blocker = resource_blocker
+        self.current_handle = None
+        self.counters = self.get_empty_counters()
+        self.hooked_handles = set()
+
+    @staticmethod
+    def get_empty_counters():
+        return {"switches": 0, "skipped_switches": 0, "navigations": 0, "skipped_navigations": 0}
+
+    def get_unassigned_handle(self, ignored_handles: set = frozenset()):
+        """
+        Returns a window handle that isn't assigned to any tab name (e.g. a popup opened by the site), if any.
+        """
+        assigned_handles = set(self.handles_dict.values()) | set(ignored_handles)
+        unassigned_handles = [handle for handle in self.browser.get_window_handles() if handle not in assigned_handles]
+        return unassigned_handles[-1] if unassigned_handles else None
+
+    def open_tab(self, tab_name: str, open_new_window: bool = True):
+        """
+        Registers the handle of a new tab. When open_new_window is False the tab is a window opened by the site
+        (or the first browser window), so the newest unassigned handle is used.
+        """
         if open_new_window:
-            browser.execute_javascript("window.open()")
-        tabs_dict[tab_name] = len(tabs_dict)
-    tab_index = tabs_dict[tab_name]
-    browser.switch_window(locator=browser.get_window_handles()[tab_index])
+            # The handles open before window.open() are ignored, so the first browser window isn't taken when it's still unassigned
+            previous_handles = set(self.browser.get_window_handles())
+            self.browser.execute_javascript("window.open()")
+            handle = wait_until("new_window:{}".format(tab_name), lambda: self.get_unassigned_handle(previous_handles), 10)
+        else:
+            handle = self.get_unassigned_handle() or self.handles_dict.get(tab_name) or self.browser.driver.current_window_handle
+        self.handles_dict[tab_name] = handle
+        return handle
+
+    def switch(self, tab_name: str = "", url: str = "", open_new_window: bool = True, skip_if_current: bool = False):
+        """
+        Switches to the tab and goes to the url if needed. If the tab name doesn't exist, creates a new tab.
+        An empty tab name switches to the first browser window. The url that is already open is refreshed,
+        since going to the same hash url doesn't reload a single page app, or skipped if skip_if_current is True.
+        """
+        if tab_name == "":
+            handle = self.browser.get_window_handles()[0]
+        elif tab_name not in self.handles_dict or not open_new_window:
+            handle = self.open_tab(tab_name, open_new_window)
+        else:
+            handle = self.handles_dict[tab_name]
+
+        if handle == self.current_handle:
+            self.counters["skipped_switches"] += 1
+        else:
+            self.browser.switch_window(locator=handle)
+            self.current_handle = handle
+            self.counters["switches"] += 1
+            self.hook_new_documents(handle)
 
-    if url != "":
-        browser.go_to(url)
+        if url != "":
+            url_is_current = self.browser.driver.current_url == url
+            if url_is_current and skip_if_current:
+                self.counters["skipped_navigations"] += 1
+            else:
+                if self.resource_blocker is not None:
+                    self.resource_blocker.apply(url)
+                if url_is_current:
+                    self.browser.driver.refresh()
+                else:
+                    self.browser.go_to(url)
+                self.counters["navigations"] += 1
+                self.install_pending_requests_hook()
+
+    def hook_new_documents(self, handle: str):
+        """
+        Registers the pending requests hook to run before the scripts of every new document of the tab (DevTools Protocol),
+        so the requests a page starts while it loads are counted too.
+        """
+        if handle in self.hooked_handles:
+            return
+        self.hooked_handles.add(handle)
+        try:
+            self.browser.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": PENDING_REQUESTS_SCRIPT})
+        except Exception:
+            pass
+
+    def install_pending_requests_hook(self):
+        """
+        Installs the pending requests hook right after a navigation, for the hash navigations of the single page apps
+        that don't load a new document.
+        """
+        try:
+            self.browser.driver.execute_script(PENDING_REQUESTS_SCRIPT)
+        except Exception:
+            pass
+
+    def close(self, tab_name: str):
+        """
+        Closes the current tab and forgets its handle.
+        """
+        self.browser.execute_javascript("window.close()")
+        self.handles_dict.pop(tab_name, None)
+        self.current_handle = None
+
+    def reset(self, transient_tabs: tuple = ()):
+        """
+        Brings the browser back to a known state after a failed step: dismisses an open alert and closes the transient tabs
+        and the windows opened by the sites that aren't assigned to a tab name.
+        """
+        try:
+            self.browser.driver.switch_to.alert.dismiss()
+        except Exception:
+            pass
+        handles_to_close = [self.handles_dict.pop(tab_name) for tab_name in transient_tabs if tab_name in self.handles_dict]
+        assigned_handles = set(self.handles_dict.values())
+        handles_to_close.extend(handle for handle in self.browser.get_window_handles() if handle not in assigned_handles and handle not in handles_to_close)
+        for handle in handles_to_close:
+            try:
+                self.browser.switch_window(locator=handle)
+                self.browser.execute_javascript("window.close()")
+            except Exception:
+                pass
+        self.current_handle = None
+
+    def reload(self, tab_name: str, url: str = ""):
+        """
+        Loads the url in the tab, or reloads its current page, if the tab was opened. Returns False if it wasn't.
+        """
+        if tab_name not in self.handles_dict:
+            return False
+        self.switch(tab_name)
+        self.switch(tab_name, url or self.browser.driver.current_url)
+        return True
+
+    def pop_counters(self):
+        """
+        Returns the switch/navigation counters since the last call and resets them.
+        """
+        counters = self.counters
+        self.counters = self.get_empty_counters()
+        return counters
+
+
+resource_blocker = ResourceBlocker(browser, BLOCK_UNNEEDED_RESOURCES)
+tab_manager = TabManager(browser, tabs_dict, resource_blocker)
+
+
+def switch_window(tab_name: str = "", url: str = "", open_new_window: bool = True, skip_if_current: bool = False):
+    """Function that switches to the desired tab and goes to an url if needed.
+       If the tab name exists, just use its window handle. Otherwise, creates a new tab.
+       Pass skip_if_current = True for read-only pages that don't need to be loaded again.
+    """
+    tab_manager.switch(tab_name, url, open_new_window, skip_if_current)
 
 def close_window(tab_name: str):
     """
     Function that close a tab and deletes it from the tabs dictionary
     """
-    browser.execute_javascript("window.close()")
-    tabs_dict.pop(tab_name, None)
+    tab_manager.close(tab_name)
+
+EXTRACT_TABLE_ROWS_SCRIPT = """
+var rowsXpath = arguments[0], columns = arguments[1];
+var rows = document.evaluate(rowsXpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var result = [];
+for (var i = 0; i < rows.snapshotLength; i++) {
+    var row = rows.snapshotItem(i), rowData = {};
+    for (var j = 0; j < columns.length; j++) {
+        var cell = document.evaluate(columns[j][1], row, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        var attribute = columns[j][2];
+        if (cell === null) {
+            rowData[columns[j][0]] = null;
+        } else if (attribute === "text") {
+            rowData[columns[j][0]] = (cell.innerText === undefined ? cell.textContent : cell.innerText).trim();
+        } else if (attribute in cell && cell[attribute] !== undefined && cell[attribute] !== null && typeof cell[attribute] !== "object") {
+            rowData[columns[j][0]] = String(cell[attribute]);
+        } else {
+            rowData[columns[j][0]] = cell.getAttribute(attribute);
+        }
+    }
+    result.push(rowData);
+}
+return result;
+"""
+
+
+def extract_table_rows(rows_xpath: str, columns: dict):
+    """
+    Extracts all the rows of a grid in a single WebDriver call and returns them as a list of dicts.
+    The columns dict maps each key to an xpath relative to the row, or to a tuple (xpath, attribute)
+    where attribute can be any element property/attribute (default is the visible text).
+    Keys whose cell is not found are None.
+    """
+    columns_list = []
+    for key, column in columns.items():
+        column_xpath, attribute = column if isinstance(column, tuple) else (column, "text")
+        columns_list.append([key, column_xpath, attribute])
+    if rows_xpath.startswith("xpath:"):
+        rows_xpath = rows_xpath[len("xpath:"):]
+    return browser.driver.execute_script(EXTRACT_TABLE_ROWS_SCRIPT, rows_xpath, columns_list)
+
+
+def wait_for_table_rows(rows_xpath: str, columns: dict, time_range: float = 5):
+    """
+    Waits until the grid has at least one row and extracts all its rows with extract_table_rows.
+    """
+    act_on_element(rows_xpath, "find_elements", time_range)
+    return extract_table_rows(rows_xpath, columns)
+
+
+FILL_INPUTS_SCRIPT = """
+var inputs = arguments[0], notFound = [];
+for (var i = 0; i < inputs.length; i++) {
+    var input = document.evaluate(inputs[i][0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (input === null) {
+        notFound.push(inputs[i][0]);
+        continue;
+    }
+    input.focus();
+    input.value = inputs[i][1];
+    input.dispatchEvent(new Event("input", {bubbles: true}));
+    input.dispatchEvent(new Event("change", {bubbles: true}));
+    input.dispatchEvent(new Event("blur"));
+}
+return notFound;
+"""
+
+
+def fill_inputs(inputs: list):
+    """
+    Fills a list of (input xpath, value) in a single WebDriver call, firing the input, change and blur events
+    the page handlers listen to. Returns the xpaths whose input was not found.
+    """
+    return browser.driver.execute_script(FILL_INPUTS_SCRIPT, [[input_xpath, str(value)] for input_xpath, value in inputs])
+
+
+class LRUCache():
+    """
+    Bounded run-scoped cache that evicts the least recently used entry, with hit/miss counters.
+    """
+
+    def __init__(self, name: str, maxsize: int = 256):
+        self.name = name
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key=None, where=None):
+        """
+        Removes one key, the keys matching the where function, or every entry if neither is given.
+        """
+        if key is not None:
+            self.entries.pop(key, None)
+        elif where is not None:
+            for cached_key in [cached_key for cached_key in self.entries if where(cached_key)]:
+                del self.entries[cached_key]
+        else:
+            self.entries.clear()
+
+    def log_stats(self):
+        log_message("Cache {}: {} hits, {} misses, {} entries".format(self.name, self.hits, self.misses, len(self.entries)))
+
+
+def get_file_sha256(file_path: str, chunk_size: int = 65536):
+    """
+    Returns the SHA-256 hex digest of the file content.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
 
 def get_month_difference_between_dates(end: datetime, start: datetime):
     """
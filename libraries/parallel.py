@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from libraries.common import log_message
+from config import OUTPUT_FOLDER, SHARED_STATE_FOLDER, RUN_STATE_KEY, WORKER_ID, WORKER_COUNT
+
+
+def is_worker_client(client_id: str, worker_id: str = WORKER_ID, worker_count: int = WORKER_COUNT):
+    """
+    Checks that the billing entries of the client belong to the shard of the worker. Claims are sharded by a hash of
+    their client id, which the billing grid shows before the claims are resolved, so each worker only resolves its own
+    entries. Every billing entry of a claim has the same client, so every claim has one worker.
+    """
+    if not worker_id or worker_count <= 1:
+        return True
+    return int(hashlib.sha256(str(client_id).encode()).hexdigest(), 16) % worker_count == int(worker_id) - 1
+
+
+def clear_shared_state():
+    """
+    Removes the state shared by the workers of a previous parallel run of the same date range and RUN_ID.
+    """
+    if not os.path.isdir(SHARED_STATE_FOLDER):
+        return
+    for file_name in os.listdir(SHARED_STATE_FOLDER):
+        if file_name.startswith("shared_") and RUN_STATE_KEY in file_name:
+            os.remove(os.path.join(SHARED_STATE_FOLDER, file_name))
+
+
+def start_worker(worker_id: int, worker_count: int):
+    """
+    Starts a bot run for one claim shard in its own process (own Selenium session, tabs, portal logins and state folder).
+    Every worker reads the whole date range and processes only the claims of its shard.
+    """
+    worker_env = dict(os.environ)
+    worker_env.update({
+        "WORKER_ID": str(worker_id),
+        "WORKER_COUNT": str(worker_count),
+        "PARALLEL_WORKERS": "1",
+    })
+    log_file = open(os.path.join(OUTPUT_FOLDER, "worker_{}.log".format(worker_id)), "w")
+    worker_process = subprocess.Popen([sys.executable] + sys.argv, env=worker_env, stdout=log_file, stderr=subprocess.STDOUT)
+    log_message("Worker {} started for claim shard {} of {} (pid {})".format(worker_id, worker_id, worker_count, worker_process.pid))
+    return {"process": worker_process, "log_file": log_file, "shard": "{}/{}".format(worker_id, worker_count), "started_at": time.time()}
+
+
+def read_worker_summary(worker_id: int, worker: dict):
+    """
+    Reads the run summary saved by a finished worker.
+    """
+    worker_summary = {
+        "worker_id": str(worker_id),
+        "shard": worker["shard"],
+        "claims_processed": 0,
+        "exit_code": worker["process"].returncode,
+        "elapsed_seconds": round(time.time() - worker["started_at"], 1)
+    }
+    summary_path = os.path.join(OUTPUT_FOLDER, "worker_{}".format(worker_id), "run_summary.json")
+    if os.path.exists(summary_path):
+        with open(summary_path) as summary_file:
+            worker_summary["claims_processed"] = json.load(summary_file)["claims_processed"]
+    elapsed_hours = worker_summary["elapsed_seconds"] / 3600
+    worker_summary["claims_per_hour"] = round(worker_summary["claims_processed"] / elapsed_hours, 1) if elapsed_hours else 0
+    return worker_summary
+
+
+def run_parallel(start_date: str, end_date: str, workers: int, max_concurrent_workers: int):
+    """
+    Splits the claims of the date range into one shard per worker and runs each shard in a worker process,
+    at most max_concurrent_workers at a time. Merges the worker summaries into parallel_summary.json
+    and raises if any worker failed.
+    """
+    log_message("Start - Parallel run of {} claim shards, {} at a time".format(workers, max_concurrent_workers))
+    run_start = time.time()
+    clear_shared_state()
+    pending_workers = list(range(1, max(1, workers) + 1))
+    running_workers = {}
+    worker_summaries = []
+    while pending_workers or running_workers:
+        while pending_workers and len(running_workers) < max(1, max_concurrent_workers):
+            worker_id = pending_workers.pop(0)
+            running_workers[worker_id] = start_worker(worker_id, max(1, workers))
+        for worker_id, worker in list(running_workers.items()):
+            if worker["process"].poll() is not None:
+                worker["log_file"].close()
+                worker_summary = read_worker_summary(worker_id, worker)
+                worker_summaries.append(worker_summary)
+                log_message("Worker {} finished with exit code {}: {} claims in {}s ({} claims/hour)".format(
+                    worker_id, worker_summary["exit_code"], worker_summary["claims_processed"], worker_summary["elapsed_seconds"], worker_summary["claims_per_hour"]))
+                del running_workers[worker_id]
+        time.sleep(1)
+
+    worker_summaries.sort(key=lambda worker_summary: int(worker_summary["worker_id"]))
+    total_claims = sum(worker_summary["claims_processed"] for worker_summary in worker_summaries)
+    elapsed_seconds = round(time.time() - run_start, 1)
+    parallel_summary = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "max_concurrent_workers": max_concurrent_workers,
+        "claims_processed": total_claims,
+        "elapsed_seconds": elapsed_seconds,
+        "claims_per_hour": round(total_claims / (elapsed_seconds / 3600), 1) if elapsed_seconds else 0,
+        "workers": worker_summaries
+    }
+    with open(os.path.join(OUTPUT_FOLDER, "parallel_summary.json"), "w") as summary_file:
+        json.dump(parallel_summary, summary_file, indent=2)
+    clear_shared_state()
+    log_message("Finish - Parallel run: {} claims in {}s ({} claims/hour)".format(total_claims, elapsed_seconds, parallel_summary["claims_per_hour"]))
+
+    failed_workers = [worker_summary["worker_id"] for worker_summary in worker_summaries if worker_summary["exit_code"] != 0]
+    if failed_workers:
+        raise Exception("Parallel run workers {} failed. Check their logs in the output folder".format(", ".join(failed_workers)))
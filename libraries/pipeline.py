@@ -0,0 +1,113 @@
+import json
+import os
+import queue
+import threading
+import time
+from libraries.common import log_message
+from config import OUTPUT_FOLDER
+
+
+pipeline_stats = {
+    "claims_extracted": 0,
+    "claims_submitted": 0,
+    "queue_depth_samples": 0,
+    "queue_depth_total": 0,
+    "max_queue_depth": 0,
+    "extractor_blocked_time": 0.0,
+    "submitter_waiting_time": 0.0,
+}
+
+
+class ClaimPipeline():
+    """
+    Runs the claims of a payor in two stages: an extractor thread reads each claim from CentralReach (API mode, no browser)
+    and puts its claim context on a bounded queue, while the browser thread takes them from the queue and submits them
+    to Waystar or SC Medicaid. A full queue blocks the extractor (backpressure), so it never gets more than
+    queue_size claims ahead of the submitter. Labels keep flowing to the label groups applied at the end of the payor.
+    Claims whose extraction failed are passed to on_extract_error in the browser thread; without it the run stops.
+    """
+
+    def __init__(self, extract, submit, queue_size: int = 5, on_extract_error=None):
+        self.extract = extract
+        self.submit = submit
+        self.on_extract_error = on_extract_error
+        self.claim_queue = queue.Queue(maxsize=max(1, queue_size))
+        self.stop_event = threading.Event()
+
+    def record_queue_depth(self):
+        queue_depth = self.claim_queue.qsize()
+        pipeline_stats["queue_depth_samples"] += 1
+        pipeline_stats["queue_depth_total"] += queue_depth
+        pipeline_stats["max_queue_depth"] = max(pipeline_stats["max_queue_depth"], queue_depth)
+
+    def put(self, item):
+        """
+        Puts an item on the queue, waiting while it's full unless the submitter stopped.
+        """
+        put_start = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                self.claim_queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        pipeline_stats["extractor_blocked_time"] += time.perf_counter() - put_start
+
+    def run_extractor(self, claim_records: list):
+        """
+        Extractor thread: puts (claim record, claim context, error) on the queue, and None when there are no more claims.
+        """
+        for claim_record in claim_records:
+            if self.stop_event.is_set():
+                return
+            try:
+                claim_context = self.extract(claim_record)
+            except Exception as e:
+                self.put((claim_record, None, e))
+                continue
+            pipeline_stats["claims_extracted"] += 1
+            self.put((claim_record, claim_context, None))
+            self.record_queue_depth()
+        self.put(None)
+
+    def run(self, claim_records: list):
+        """
+        Extracts and submits the claim records, submitting each claim as soon as it's extracted.
+        """
+        extractor_thread = threading.Thread(target=self.run_extractor, args=(claim_records,), name="ClaimExtractor", daemon=True)
+        extractor_thread.start()
+        try:
+            while True:
+                get_start = time.perf_counter()
+                item = self.claim_queue.get()
+                pipeline_stats["submitter_waiting_time"] += time.perf_counter() - get_start
+                self.record_queue_depth()
+                if item is None:
+                    break
+                claim_record, claim_context, error = item
+                if error is not None:
+                    if self.on_extract_error is None:
+                        raise Exception("Extraction of claim {} failed: {}".format(claim_record["claim_id"], str(error)))
+                    self.on_extract_error(claim_record, error)
+                    continue
+                if self.submit(claim_record, claim_context) is not False:
+                    pipeline_stats["claims_submitted"] += 1
+        finally:
+            self.stop_event.set()
+            extractor_thread.join(5)
+
+
+def log_pipeline_stats(folder: str = OUTPUT_FOLDER):
+    """
+    Logs the queue depth, backpressure and starvation of the pipeline mode and saves them in pipeline_stats.json.
+    """
+    if not pipeline_stats["queue_depth_samples"]:
+        return
+    summary = dict(pipeline_stats)
+    summary["average_queue_depth"] = round(pipeline_stats["queue_depth_total"] / pipeline_stats["queue_depth_samples"], 2)
+    summary["extractor_blocked_time"] = round(pipeline_stats["extractor_blocked_time"], 1)
+    summary["submitter_waiting_time"] = round(pipeline_stats["submitter_waiting_time"], 1)
+    with open(os.path.join(folder, "pipeline_stats.json"), "w") as stats_file:
+        json.dump(summary, stats_file, indent=2)
+    log_message("Pipeline: {claims_extracted} claims extracted, {claims_submitted} submitted, queue depth avg {average_queue_depth} / max {max_queue_depth}, "
+                "extractor blocked {extractor_blocked_time}s (backpressure), submitter waited {submitter_waiting_time}s for claims".format(**summary))
@@ -1,14 +1,34 @@
-from libraries.common import log_message, capture_page_screenshot, browser
+from libraries.common import log_message, capture_page_screenshot, log_element_wait_stats, log_page_ready_stats, wait_for_page_ready, timing_span, export_timing_spans, tab_manager, browser
 from libraries.sharepoint.sharepoint import SharePoint
 from libraries.centralreach.centralreach import CentralReach
 from libraries.waystar.waystar import Waystar
 from libraries.scmedicaid.scmedicaid import SCMedicaid
+from libraries.pipeline import ClaimPipeline, log_pipeline_stats
+from libraries.claim_journal import ClaimJournal
+from libraries.parallel import is_worker_client
+from config import OUTPUT_FOLDER, STATE_FOLDER, WORKER_ID, WORKER_COUNT, RUN_STATE_KEY, PIPELINE_MODE, PIPELINE_QUEUE_SIZE, BROWSER_HEADLESS, CLAIM_MAX_ATTEMPTS, CLAIM_RETRY_BACKOFF, MAX_CONSECUTIVE_CLAIM_FAILURES, RunMode
+import json
+import os
 import time
-from config import OUTPUT_FOLDER
 
 class Process:
     def __init__(self, credentials: dict):
         log_message("Initialization.")
+        self.start_time = time.time()
+        self.claims_processed_count = 0
+        # Claims skipped or resumed from the claim journal of a previous (crashed) run
+        self.resume_stats = {"completed_claims_skipped": 0, "submitted_claims_resumed": 0, "time_saved_seconds": 0.0}
+        self.claim_journal = ClaimJournal(os.path.join(STATE_FOLDER, "claim_journal_{}.sqlite3".format(RUN_STATE_KEY)), RunMode.save_changes)
+        # Set when start() gets to its end, the run state is only cleared then
+        self.run_completed = False
+        # Failed claims waiting to be retried after the main pass, and claims that failed all their attempts
+        self.retry_queue = []
+        self.failed_claims = []
+        # Failed payors waiting to be retried after the main pass, and payors that failed all their attempts
+        self.payor_retry_queue = []
+        self.failed_payors = []
+        self.consecutive_claim_failures = 0
+        self.current_payor = None
         """
         All the initialization steps are performed here, without which it makes no sense to go to the main process.
         This part may include:
@@ -25,24 +45,39 @@ class Process:
             "download.default_directory": OUTPUT_FOLDER,
             "download.prompt_for_download": False,
         }
-        browser.open_available_browser(preferences = prefs)
+        browser.open_available_browser(preferences = prefs, headless = BROWSER_HEADLESS)
         browser.set_window_size(1920, 1080)
-        browser.maximize_browser_window()
+        if BROWSER_HEADLESS:
+            # Headless Chrome doesn't download files unless it's allowed through the DevTools Protocol
+            browser.driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": OUTPUT_FOLDER})
+        else:
+            browser.maximize_browser_window()
         
         sharepoint = SharePoint(browser, {"url": "https://esaeducation.sharepoint.com/:x:/g/behavioralhealth/cbo/EVatyGRU6WZFgQsYTlWfAFYBph75bBqPFsaMFGUQftMSlA?e=kZf4AY"})
-        sharepoint.download_file()
+        sharepoint.start_download()
+        self.sharepoint = sharepoint
 
         centralreach = CentralReach(browser, credentials["CentralReach"])
-        centralreach.login()
+        centralreach.claim_journal = self.claim_journal
         self.centralreach = centralreach
-
         waystar = Waystar(browser, credentials["Waystar"])
-        waystar.login()
         self.waystar = waystar
-
         sc_medicaid = SCMedicaid(browser, credentials["SCMedicaid"])
-        sc_medicaid.login()
         self.sc_medicaid = sc_medicaid
+
+        # Every portal submits its login (or restores its saved session) before any of them waits for its landing page,
+        # so the portal logins load at the same time in their own tabs
+        with timing_span("Login portals", "login"):
+            centralreach.start_login()
+            waystar.start_login()
+            sc_medicaid.start_login()
+            centralreach.finish_login()
+            waystar.finish_login()
+            sc_medicaid.finish_login()
+
+        self.pipeline_mode = PIPELINE_MODE and centralreach.api is not None
+        if PIPELINE_MODE and not self.pipeline_mode:
+            log_message("Pipeline mode needs CENTRALREACH_DATA_MODE=api, the claims are processed one by one")
         
 
     def start(self):
@@ -53,44 +88,340 @@ class Process:
 
         --------------------- THIS IS NOT THE FINAL PROCESS VERSION. IT WILL CHANGE
         """
-        log_message("--------------- [Macro Step 2: Prepare for Process] ---------------")
-        mapping_file_data_dict = self.waystar.read_mapping_file()
-        log_message("--------------- [Macro Step 3: Prepare to Process Claims] ---------------")
-        self.centralreach.filter_claims_list()
-        payor_element_list = self.centralreach.get_payors_list()
-        for payor_element in payor_element_list:
-            self.centralreach.get_payor_name_from_element(payor_element)
-            if self.centralreach.payor_name:
+        with timing_span("Run", "run"):
+            log_message("--------------- [Macro Step 2: Prepare for Process] ---------------")
+            self.mapping_index = self.waystar.read_mapping_file(self.sharepoint.wait_for_file())
+            log_message("--------------- [Macro Step 3: Prepare to Process Claims] ---------------")
+            self.centralreach.filter_claims_list()
+            payor_list = self.centralreach.get_payors_list()
+            for payor in payor_list:
+                if not payor["excluded"]:
+                    self.run_payor(payor)
+            self.retry_failed_payors()
+            self.retry_failed_claims()
+            wait_for_page_ready(replaced_sleep=5)
+        self.run_completed = True
+
+    def run_payor(self, payor: dict, attempt: int = 1):
+        """
+        Processes the claims of a payor: filters the billing grid, reads its claims, prefetches their Waystar statuses,
+        processes them and applies their labels. A failed payor step doesn't stop the run, the payor is queued for a retry.
+        Claims of the payor already queued for a retry or failed are not processed again.
+        """
+        self.current_payor = payor
+        with timing_span(payor["name"], "payor", attempt=attempt) as payor_span:
+            try:
+                self.centralreach.select_payor(payor)
                 log_message("******* Processing claims for payor {} *******".format(self.centralreach.payor_name))
-                claims_result_list = self.centralreach.get_claims_result()
-                for claim_row in claims_result_list:
-                    self.centralreach.get_claim_information(claim_row)
-                    log_message("***Processing claim with id {}****".format(self.centralreach.claim_id))
-                    if self.centralreach.payor_is_sc_medicaid:
-                        log_message("--------------- [Macro Step 5: Process Claims in SC Medicaid] ---------------")
-                        is_valid_auth_number = self.centralreach.get_authorization_number()
-                        if is_valid_auth_number:
-                            service_lines_list = self.centralreach.get_service_lines()
-                            self.sc_medicaid.populate_beneficiary_information(self.centralreach.client_name)
-                            self.sc_medicaid.populate_rendering_provider(self.centralreach.manager_name)
-                            self.sc_medicaid.populate_authorization_number(self.centralreach.authorization_number)
-                            self.sc_medicaid.populate_primary_diagnosis()
-                            self.sc_medicaid.populate_det_lines(service_lines_list)
-                            self.centralreach.labels_dict = self.sc_medicaid.populate_other_coverage_info(self.centralreach.client_name, self.centralreach.total_amounts_dict, self.centralreach.labels_dict)
-                    else:
-                        log_message("--------------- [Macro Step 4: Process Claims in Waystar] ---------------")
-                        self.centralreach.labels_dict = self.waystar.determine_if_valid_secondary_claim(self.centralreach.claim_id, self.centralreach.labels_dict)
-                        if len(self.centralreach.labels_dict['labels_to_add']) == 0 and len(self.centralreach.labels_dict['labels_to_remove']) == 0:
-                            is_valid_auth_number = self.centralreach.get_authorization_number()
-                            if is_valid_auth_number:
-                                self.centralreach.get_subscriber_information()
-                                self.waystar.populate_payer_information(mapping_file_data_dict, self.centralreach.payor_name)
-                                self.waystar.populate_authorization_and_subscriber_information(self.centralreach.subscriber_info_dict, self.centralreach.authorization_number)
-                                self.centralreach.labels_dict = self.waystar.check_remit_information(mapping_file_data_dict, self.centralreach.payor_name, self.centralreach.provider_label, self.centralreach.labels_dict)
-                    
-                    log_message("--------------- [Macro Step 6: Add/Remove Labels and Bulk-Apply Payments] ---------------")
-                    self.centralreach.apply_and_remove_labels_to_claims()
-        time.sleep(5)
+                entry_ids = self.centralreach.get_claims_result(is_worker_client if WORKER_ID else None)
+                claim_records = self.centralreach.get_claim_records(entry_ids)
+                handled_claim_ids = set(retry_item["claim_record"]["claim_id"] for retry_item in self.retry_queue)
+                handled_claim_ids.update(failed_claim["claim_id"] for failed_claim in self.failed_claims)
+                claim_records = [claim_record for claim_record in claim_records if claim_record["claim_id"] not in handled_claim_ids and not self.resume_claim(claim_record)]
+                waystar_claim_ids = [claim_record["claim_id"] for claim_record in claim_records if self.centralreach.sc_medicaid_cr_name.lower() not in claim_record["payor"].lower()]
+                if waystar_claim_ids:
+                    self.waystar.prefetch_claim_statuses(waystar_claim_ids)
+                if self.pipeline_mode:
+                    claim_extractor = self.centralreach.create_claim_extractor()
+                    claim_pipeline = ClaimPipeline(
+                        lambda claim_record: self.extract_claim(claim_extractor, claim_record),
+                        lambda claim_record, claim_context: self.run_claim(self.submit_claim, claim_record, claim_context, self.mapping_index),
+                        PIPELINE_QUEUE_SIZE,
+                        self.handle_claim_failure
+                    )
+                    claim_pipeline.run(claim_records)
+                else:
+                    for claim_record in claim_records:
+                        self.run_claim(self.process_claim, claim_record, self.mapping_index)
+                log_message("--------------- [Macro Step 6: Add/Remove Labels and Bulk-Apply Payments] ---------------")
+                self.apply_pending_labels()
+            except Exception as e:
+                if self.consecutive_claim_failures >= MAX_CONSECUTIVE_CLAIM_FAILURES:
+                    raise
+                payor_span["error"] = str(e)
+                self.handle_payor_failure(payor, e, attempt)
+
+    def handle_payor_failure(self, payor: dict, error: Exception, attempt: int = 1):
+        """
+        Records a failed payor step with its screenshot, resets the tabs, drops the labels queued in the payor pass
+        (the claim journal queues the submitted claims again on the retry) and queues the payor for a retry with backoff,
+        or gives it up after CLAIM_MAX_ATTEMPTS attempts. Payor failures count as consecutive failures too.
+        """
+        screenshot_name = "Exception_payor_{}_attempt_{}".format("".join(character if character.isalnum() else "_" for character in payor["name"]), attempt)
+        try:
+            capture_page_screenshot(OUTPUT_FOLDER, screenshot_name)
+        except Exception:
+            pass
+        log_message("Payor {} failed (attempt {} of {}): {}".format(payor["name"], attempt, CLAIM_MAX_ATTEMPTS, str(error)))
+        self.reset_after_failure()
+        self.centralreach.pending_label_groups = {}
+        if attempt < CLAIM_MAX_ATTEMPTS:
+            self.payor_retry_queue.append({
+                "payor": payor,
+                "attempt": attempt + 1,
+                "retry_at": time.time() + CLAIM_RETRY_BACKOFF * 2 ** (attempt - 1)
+            })
+        else:
+            self.failed_payors.append({
+                "payor": payor["name"],
+                "attempts": attempt,
+                "error": str(error),
+                "screenshot": screenshot_name
+            })
+        self.consecutive_claim_failures += 1
+        if self.consecutive_claim_failures >= MAX_CONSECUTIVE_CLAIM_FAILURES:
+            raise Exception("{} claims or payors failed in a row, last error: {}".format(self.consecutive_claim_failures, str(error)))
+
+    def retry_failed_payors(self):
+        """
+        Retries the failed payors after the main pass, each one when its backoff is over.
+        """
+        if not self.payor_retry_queue:
+            return
+        log_message("--------------- [Retry Failed Payors: {} payors] ---------------".format(len(self.payor_retry_queue)))
+        while self.payor_retry_queue:
+            retry_item = min(self.payor_retry_queue, key=lambda item: item["retry_at"])
+            self.payor_retry_queue.remove(retry_item)
+            time.sleep(max(retry_item["retry_at"] - time.time(), 0))
+            self.run_payor(retry_item["payor"], retry_item["attempt"])
+
+    def resume_claim(self, claim_record: dict):
+        """
+        Checks the claim journal for a claim handled by a previous run. Completed claims are skipped and submitted claims
+        only get their recorded labels queued again. Returns True if the claim doesn't need to be processed.
+        """
+        journal_entry = self.claim_journal.get(claim_record["claim_id"])
+        if journal_entry is None or journal_entry["state"] not in ("submitted", "completed"):
+            return False
+        if journal_entry["state"] == "completed":
+            log_message("Claim {} was completed by a previous run. Skipping".format(claim_record["claim_id"]))
+            self.resume_stats["completed_claims_skipped"] += 1
+        else:
+            log_message("Claim {} was submitted by a previous run. Resuming at the labels".format(claim_record["claim_id"]))
+            self.centralreach.labels_dict = journal_entry["labels_dict"]
+            self.centralreach.queue_labels_for_claim(claim_record)
+            self.resume_stats["submitted_claims_resumed"] += 1
+        self.resume_stats["time_saved_seconds"] += journal_entry["elapsed_seconds"]
+        return True
+
+    def extract_claim(self, claim_extractor, claim_record: dict):
+        """
+        Pipeline extractor step: reuses the claim context recorded in the claim journal by a previous run, otherwise
+        extracts it from CentralReach and records it.
+        """
+        journal_entry = self.claim_journal.get(claim_record["claim_id"])
+        if journal_entry is not None and journal_entry["claim_context"] is not None:
+            log_message("Claim {} was extracted by a previous run. Resuming at the submission".format(claim_record["claim_id"]))
+            return journal_entry["claim_context"]
+        claim_context = claim_extractor.extract_claim_context(claim_record)
+        self.claim_journal.record(claim_record["claim_id"], "extracted", claim_record["payor"], claim_context=claim_context)
+        return claim_context
+
+    def run_claim(self, claim_function, claim_record: dict, *args, attempt: int = 1):
+        """
+        Runs the processing of a claim in its timing span, logs its tab counters and records it as submitted
+        (or completed if it has no labels to apply) in the claim journal.
+        A failed claim doesn't stop the run, it's queued for a retry. Returns True if the claim was processed.
+        """
+        with timing_span("Claim", "claim", claim_id=claim_record["claim_id"], attempt=attempt) as claim_span:
+            claim_start = time.perf_counter()
+            try:
+                claim_function(claim_record, *args)
+            except Exception as e:
+                claim_span["error"] = str(e)
+                self.handle_claim_failure(claim_record, e, attempt)
+                claim_processed = False
+            else:
+                self.consecutive_claim_failures = 0
+                labels_dict = self.centralreach.labels_dict
+                claim_state = "submitted" if labels_dict.get('labels_to_add') or labels_dict.get('labels_to_remove') else "completed"
+                self.claim_journal.record(claim_record["claim_id"], claim_state, claim_record["payor"], labels_dict, elapsed_seconds=time.perf_counter() - claim_start)
+                self.claims_processed_count += 1
+                claim_processed = True
+            claim_span.update(tab_manager.pop_counters())
+            log_message("Claim {} tabs: {switches} switches ({skipped_switches} skipped), {navigations} navigations ({skipped_navigations} skipped)".format(claim_record["claim_id"], **claim_span))
+        return claim_processed
+
+    def handle_claim_failure(self, claim_record: dict, error: Exception, attempt: int = 1):
+        """
+        Records a failed claim with its screenshot, resets the tabs and queues the claim for a retry with backoff,
+        or gives it up after CLAIM_MAX_ATTEMPTS attempts. Stops the run when too many claims fail in a row,
+        since then the portals or the session are failing rather than the claims.
+        """
+        screenshot_name = "Exception_claim_{}_attempt_{}".format(claim_record["claim_id"], attempt)
+        try:
+            capture_page_screenshot(OUTPUT_FOLDER, screenshot_name)
+        except Exception:
+            pass
+        log_message("Claim {} failed (attempt {} of {}): {}".format(claim_record["claim_id"], attempt, CLAIM_MAX_ATTEMPTS, str(error)))
+        self.reset_after_failure()
+        if attempt < CLAIM_MAX_ATTEMPTS:
+            self.retry_queue.append({
+                "payor": self.current_payor,
+                "claim_record": claim_record,
+                "attempt": attempt + 1,
+                "retry_at": time.time() + CLAIM_RETRY_BACKOFF * 2 ** (attempt - 1)
+            })
+        else:
+            self.failed_claims.append({
+                "claim_id": claim_record["claim_id"],
+                "payor": claim_record["payor"],
+                "attempts": attempt,
+                "error": str(error),
+                "screenshot": screenshot_name
+            })
+        self.consecutive_claim_failures += 1
+        if self.consecutive_claim_failures >= MAX_CONSECUTIVE_CLAIM_FAILURES:
+            raise Exception("{} claims or payors failed in a row, last error: {}".format(self.consecutive_claim_failures, str(error)))
+
+    def reset_after_failure(self):
+        """
+        Brings the tabs back to a known state after a failed claim or payor step: closes the Waystar claim window and
+        any popup, reloads the CentralReach grids and takes SC Medicaid and Waystar back to their start pages.
+        Every tab is reset on its own, so a failing reset doesn't keep the next ones from running.
+        """
+        reset_steps = [
+            ("windows", lambda: tab_manager.reset(("WaystarSubInfo",))),
+            ("CentralReach claim grid", lambda: tab_manager.reload("CentralReachClaim1")),
+            ("SC Medicaid", lambda: tab_manager.reload("SCMedicaid", self.sc_medicaid.enter_professional_claim_url)),
+            ("Waystar", lambda: tab_manager.reload("Waystar", self.waystar.claims_search_url)),
+            ("CentralReach billing grid", lambda: tab_manager.reload("CentralReachMain")),
+        ]
+        for tab_description, reset_step in reset_steps:
+            try:
+                reset_step()
+            except Exception as e:
+                log_message("Reset of the {} after the failure failed: {}".format(tab_description, str(e)))
+        self.centralreach.authorization_page_key = None
+
+    def retry_failed_claims(self):
+        """
+        Retries the failed claims after the main pass, each one when its backoff is over, payor by payor.
+        The labels of each payor's retried claims are applied before moving to the next payor.
+        """
+        if not self.retry_queue:
+            return
+        log_message("--------------- [Retry Failed Claims: {} claims] ---------------".format(len(self.retry_queue)))
+        retry_payor_name = None
+        while self.retry_queue:
+            retry_item = min(self.retry_queue, key=lambda item: (item["payor"]["name"] != retry_payor_name, item["retry_at"]))
+            self.retry_queue.remove(retry_item)
+            if retry_item["payor"]["name"] != retry_payor_name:
+                if retry_payor_name is not None:
+                    self.apply_retried_claims_labels()
+                self.current_payor = retry_item["payor"]
+                try:
+                    self.centralreach.select_payor(retry_item["payor"])
+                except Exception as e:
+                    # The retried claims of the payor fail this attempt, the payor is selected again for their next one
+                    retry_payor_name = None
+                    payor_retry_items = [retry_item] + [item for item in self.retry_queue if item["payor"]["name"] == retry_item["payor"]["name"]]
+                    for payor_retry_item in payor_retry_items[1:]:
+                        self.retry_queue.remove(payor_retry_item)
+                    for payor_retry_item in payor_retry_items:
+                        self.handle_claim_failure(payor_retry_item["claim_record"], e, payor_retry_item["attempt"])
+                    continue
+                retry_payor_name = retry_item["payor"]["name"]
+            time.sleep(max(retry_item["retry_at"] - time.time(), 0))
+            self.run_claim(self.process_claim, retry_item["claim_record"], self.mapping_index, attempt=retry_item["attempt"])
+        self.apply_retried_claims_labels()
+
+    def apply_retried_claims_labels(self):
+        """
+        Applies the queued labels of the retried claims of a payor. If it fails, the queued claims are recorded as failed
+        (they stay submitted in the claim journal, so a restarted run applies their labels again) and the tabs are reset.
+        """
+        try:
+            self.apply_pending_labels()
+        except Exception as e:
+            log_message("Labels of the retried claims of payor {} failed: {}".format(self.current_payor["name"], str(e)))
+            for claim_records in self.centralreach.pending_label_groups.values():
+                for claim_record in claim_records:
+                    self.failed_claims.append({
+                        "claim_id": claim_record["claim_id"],
+                        "payor": claim_record["payor"],
+                        "attempts": 1,
+                        "error": "Labels not applied: {}".format(str(e)),
+                        "screenshot": ""
+                    })
+            self.centralreach.pending_label_groups = {}
+            self.reset_after_failure()
+
+    def apply_pending_labels(self):
+        """
+        Applies the queued labels of the payor and records the claims whose labels couldn't be applied as failed.
+        They stay submitted in the claim journal, so a restarted run applies their labels again.
+        """
+        for claim_record in self.centralreach.apply_pending_labels():
+            self.failed_claims.append({
+                "claim_id": claim_record["claim_id"],
+                "payor": claim_record["payor"],
+                "attempts": 1,
+                "error": "Labels not applied to all the billing entries of the claim",
+                "screenshot": ""
+            })
+
+    def process_claim(self, claim_record: dict, mapping_index):
+        """
+        Processes a single claim of the billing grid: SC Medicaid or Waystar submission and then labels.
+        """
+        self.centralreach.get_claim_information(claim_record)
+        self.claim_journal.record(claim_record["claim_id"], "extracted", claim_record["payor"])
+        log_message("***Processing claim with id {}****".format(self.centralreach.claim_id))
+        if self.centralreach.payor_is_sc_medicaid:
+            log_message("--------------- [Macro Step 5: Process Claims in SC Medicaid] ---------------")
+            is_valid_auth_number = self.centralreach.get_authorization_number()
+            if is_valid_auth_number:
+                service_lines_list = self.centralreach.get_service_lines()
+                self.sc_medicaid.populate_beneficiary_information(self.centralreach.client_name)
+                self.sc_medicaid.populate_rendering_provider(self.centralreach.manager_name)
+                self.sc_medicaid.populate_authorization_number(self.centralreach.authorization_number)
+                self.sc_medicaid.populate_primary_diagnosis()
+                self.sc_medicaid.populate_det_lines(service_lines_list)
+                self.centralreach.labels_dict = self.sc_medicaid.populate_other_coverage_info(self.centralreach.client_name, self.centralreach.total_amounts_dict, self.centralreach.labels_dict)
+        else:
+            log_message("--------------- [Macro Step 4: Process Claims in Waystar] ---------------")
+            self.centralreach.labels_dict = self.waystar.determine_if_valid_secondary_claim(self.centralreach.claim_id, self.centralreach.labels_dict)
+            if len(self.centralreach.labels_dict['labels_to_add']) == 0 and len(self.centralreach.labels_dict['labels_to_remove']) == 0:
+                is_valid_auth_number = self.centralreach.get_authorization_number()
+                if is_valid_auth_number:
+                    self.centralreach.get_subscriber_information()
+                    self.waystar.populate_payer_information(mapping_index, self.centralreach.payor_name)
+                    self.waystar.populate_authorization_and_subscriber_information(self.centralreach.subscriber_info_dict, self.centralreach.authorization_number)
+                    self.centralreach.labels_dict = self.waystar.check_remit_information(mapping_index, self.centralreach.payor_name, self.centralreach.provider_label, self.centralreach.labels_dict)
+
+        self.centralreach.queue_labels_for_claim(claim_record)
+
+    def submit_claim(self, claim_record: dict, claim_context: dict, mapping_index):
+        """
+        Submits a claim extracted by the pipeline extractor to SC Medicaid or Waystar and then queues its labels.
+        Same steps as process_claim, with the CentralReach data already in the claim context.
+        """
+        self.centralreach.load_claim_context(claim_context)
+        log_message("***Processing claim with id {}****".format(self.centralreach.claim_id))
+        if self.centralreach.payor_is_sc_medicaid:
+            log_message("--------------- [Macro Step 5: Process Claims in SC Medicaid] ---------------")
+            if claim_context["valid_auth_number"]:
+                self.sc_medicaid.populate_beneficiary_information(self.centralreach.client_name)
+                self.sc_medicaid.populate_rendering_provider(self.centralreach.manager_name)
+                self.sc_medicaid.populate_authorization_number(self.centralreach.authorization_number)
+                self.sc_medicaid.populate_primary_diagnosis()
+                self.sc_medicaid.populate_det_lines(claim_context["service_lines_list"])
+                self.centralreach.labels_dict = self.sc_medicaid.populate_other_coverage_info(self.centralreach.client_name, self.centralreach.total_amounts_dict, self.centralreach.labels_dict)
+            else:
+                self.centralreach.labels_dict = claim_context["authorization_labels_dict"]
+        else:
+            log_message("--------------- [Macro Step 4: Process Claims in Waystar] ---------------")
+            self.centralreach.labels_dict = self.waystar.determine_if_valid_secondary_claim(self.centralreach.claim_id, self.centralreach.labels_dict)
+            if len(self.centralreach.labels_dict['labels_to_add']) == 0 and len(self.centralreach.labels_dict['labels_to_remove']) == 0:
+                if claim_context["valid_auth_number"]:
+                    self.waystar.populate_payer_information(mapping_index, self.centralreach.payor_name)
+                    self.waystar.populate_authorization_and_subscriber_information(self.centralreach.subscriber_info_dict, self.centralreach.authorization_number)
+                    self.centralreach.labels_dict = self.waystar.check_remit_information(mapping_index, self.centralreach.payor_name, self.centralreach.provider_label, self.centralreach.labels_dict)
+                else:
+                    self.centralreach.labels_dict = claim_context["authorization_labels_dict"]
+
+        self.centralreach.queue_labels_for_claim(claim_record)
 
     def finish(self):
         """
@@ -100,5 +431,39 @@ class Process:
          - uploading files to Google Drive, etc.
         """
         log_message("DW Process Finished")
+        log_element_wait_stats()
+        self.centralreach.log_cache_stats()
+        log_page_ready_stats()
+        log_pipeline_stats()
+        log_message("Resume: {completed_claims_skipped} completed claims skipped, {submitted_claims_resumed} submitted claims resumed at the labels, {time_saved_seconds:.0f}s of claim processing saved".format(**self.resume_stats))
+        if self.run_completed:
+            log_message("Run completed, clearing the claim journal and the applied label groups of {}".format(RUN_STATE_KEY))
+            self.claim_journal.clear()
+            self.centralreach.clear_applied_label_groups()
+        else:
+            self.claim_journal.close()
+        export_timing_spans()
+        self.save_run_summary()
         browser.close_browser()
+
+    def save_run_summary(self):
+        """
+        Saves the date range, claims processed and elapsed time of the run in the output folder.
+        The parallel run coordinator merges these summaries.
+        """
+        run_summary = {
+            "worker_id": WORKER_ID,
+            "worker_count": WORKER_COUNT,
+            "start_date": self.centralreach.start_date,
+            "end_date": self.centralreach.end_date,
+            "claims_processed": self.claims_processed_count,
+            "elapsed_seconds": round(time.time() - self.start_time, 1),
+            "claims_failed": len(self.failed_claims),
+            "failed_claims": self.failed_claims,
+            "payors_failed": len(self.failed_payors),
+            "failed_payors": self.failed_payors,
+            "resume": dict(self.resume_stats, time_saved_seconds=round(self.resume_stats["time_saved_seconds"], 1))
+        }
+        with open("{}/run_summary.json".format(OUTPUT_FOLDER), "w") as summary_file:
+            json.dump(run_summary, summary_file, indent=2)
         
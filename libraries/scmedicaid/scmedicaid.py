@@ -3,11 +3,18 @@ from libraries.common import (
     log_message,
     act_on_element,
     capture_page_screenshot,
-    switch_window
+    switch_window,
+    wait_for_page_ready,
+    timed_step,
+    extract_table_rows,
+    fill_inputs,
+    wait_until,
+    click_without_waiting
 )
+from libraries.session_store import SessionStore
 from config import OUTPUT_FOLDER, RunMode
-import time
 from copy import deepcopy
+import time
 
 
 class SCMedicaid():
@@ -20,21 +27,66 @@ class SCMedicaid():
         self.provider_to_work = "EARLY AUTISM PROJECT INC - 1417477175"
         self.enter_professional_claim_url = "https://portal.scmedicaid.com/claimsentry/cmsclaimslist"
         self.primary_diagnosis_code = "F840"
+        self.det_lines_rows_xpath = '//table[contains(@class, "t-data-grid")]/tbody/tr[td[@class="hcpcsCode"]]'
+        self.insured_list_link_xpath = '//h4[contains(text(), "Add/Edit Other Insurance Coverage Information")]/a[text() = "Get from List"]'
+        # Normalized insured name: {policy number: {"page", "policy_num"}} of the Other Insurance Coverage list, scanned once per session
+        self.insured_index = {}
+        self.insured_index_page_count = 0
+        # Normalized names not found in the insured list (clients without other coverage), not searched again in the session
+        self.missed_insured_names = set()
+        self.insured_list_rescanned = False
+        self.session_store = SessionStore(self.browser, "scmedicaid", ["scmedicaid.com"], "{}:{}".format(self.scmedicaid_login, self.scmedicaid_password))
+        self.session_restored = False
 
     def login(self):
         """
         Login to SCMedicaid with Bitwarden credentials.
         """
+        self.start_login()
+        self.finish_login()
+
+    @timed_step
+    def start_login(self):
+        """
+        Opens SCMedicaid with the saved session cookies if there are valid ones, otherwise submits the login form
+        without waiting for the page it loads.
+        """
         try:
             log_message("Start - Login SCMedicaid")
-            switch_window("SCMedicaid", self.scmedicaid_url)
-            self.input_credentials()
-            self.select_provider()
-            log_message("Finish - Login SCMedicaid")
+            self.session_restored = self.session_store.restore()
+            if self.session_restored:
+                switch_window("SCMedicaid", self.enter_professional_claim_url)
+            else:
+                switch_window("SCMedicaid", self.scmedicaid_url)
+                self.input_credentials()
         except Exception:
             capture_page_screenshot(OUTPUT_FOLDER, "Exception_scmedicaid_Login")
             raise Exception("Login to SCMedicaid failed")
 
+    @timed_step
+    def finish_login(self):
+        """
+        Waits until SCMedicaid is logged in and selects the provider. If the restored session isn't valid,
+        logs in with the credentials.
+        """
+        try:
+            switch_window("SCMedicaid")
+            if self.session_restored:
+                if not self.session_store.is_logged_in('//div[@id="content"]', '//input[@id="password"]'):
+                    log_message("SCMedicaid restored session is not valid, logging in")
+                    self.session_store.clear()
+                    self.session_restored = False
+                    switch_window("SCMedicaid", self.scmedicaid_url)
+                    self.input_credentials()
+            act_on_element('//div[@id="content"]', "find_element", 10)
+            if not self.session_restored:
+                # The selected provider is kept in the session, so a restored session already has it
+                self.select_provider()
+                self.session_store.save()
+            log_message("Finish - Login SCMedicaid")
+        except Exception:
+            capture_page_screenshot(OUTPUT_FOLDER, "Exception_scmedicaid_Login")
+            raise Exception("Login to SCMedicaid failed")
 
     def input_credentials(self):
         """
@@ -43,8 +95,7 @@ class SCMedicaid():
         # self.browser.click_element('//a[text()="LOGIN"]')
         self.browser.input_text_when_element_is_visible('//input[@id="username"]', self.scmedicaid_login)
         self.browser.input_text_when_element_is_visible('//input[@id="password"]', self.scmedicaid_password)
-        self.browser.click_element('//input[@id="submit_0"]')
-        act_on_element('//div[@id="content"]', "find_element", 10)
+        click_without_waiting('//input[@id="submit_0"]')
         
     def select_provider(self):
         """
@@ -55,6 +106,7 @@ class SCMedicaid():
         act_on_element('//input[@id="update"]', "click_element")
         
 
+    @timed_step
     def populate_beneficiary_information(self, client_name: str):
         """
         Function that selects the beneficiary based on the client name found on CentralReach
@@ -65,15 +117,16 @@ class SCMedicaid():
         first_name = split_name[0]
         last_name = split_name[1]
         act_on_element('//a[@id="listwindowdisplaylink" and text() = "Get from List"]', "click_element")
-        time.sleep(1)
+        wait_for_page_ready("scmedicaid", replaced_sleep=1)
         table_base_xpath = '//table[@class="t-data-grid"]/tbody/tr'
         last_name_xpath = 'child::td[@class="lastName" and contains(translate(text(), "{}", "{}"), "{}")]'.format(last_name.upper(), last_name.lower(), last_name.lower())
         first_name_xpath = 'child::td[@class="firstName" and contains(translate(text(), "{}", "{}"), "{}")]'.format(first_name.upper(), first_name.lower(), first_name.lower())
         full_xpath = '{}[{} and {}]//a[@class="memberListLink"]'.format(table_base_xpath, last_name_xpath, first_name_xpath)
         act_on_element(full_xpath, "click_element") 
-        time.sleep(1)
+        wait_for_page_ready("scmedicaid", replaced_sleep=1)
         act_on_element('//input[@value="Continue"]', "click_element") 
 
+    @timed_step
     def populate_rendering_provider(self, manager_name: str):
         """
         Function that populates the rendering provider with manager name found on CentralReach
@@ -85,10 +138,11 @@ class SCMedicaid():
         manager_name_xpath = 'child::td[@class="providerName" and text() = "{}"]'.format(manager_name.upper())
         full_xpath = '{}[{}]//a[@class="providerListLink"]'.format(table_base_xpath, manager_name_xpath)
         act_on_element(full_xpath, "click_element")
-        time.sleep(1)
+        wait_for_page_ready("scmedicaid", replaced_sleep=1)
         act_on_element('//input[@value="Continue"]', "click_element") 
         log_message("Finish - Populate Rendering provider")
 
+    @timed_step
     def populate_authorization_number(self, authorization_number : str):
         """
         Function that populates the authorization number found on CentralReach
@@ -96,10 +150,11 @@ class SCMedicaid():
         log_message("Start - Populate Authorization Number")
         switch_window("SCMedicaid")
         self.browser.input_text_when_element_is_visible('//input[@name="priorAuthNumber"]', authorization_number)
-        time.sleep(1)
+        wait_for_page_ready("scmedicaid", replaced_sleep=1)
         act_on_element('//input[@value="Continue"]', "click_element")
         log_message("Finish - Populate Authorization Number")
 
+    @timed_step
     def populate_primary_diagnosis(self):
         """
         Function that selects the primary diagnosis code 
@@ -110,43 +165,76 @@ class SCMedicaid():
         primary_diagnosis_code_xpath = '//a[@class="codeListLink" and text() = "{}"]'.format(self.primary_diagnosis_code)
         full_xpath = '{}{}'.format(table_base_xpath, primary_diagnosis_code_xpath)
         act_on_element(full_xpath, "click_element")
-        time.sleep(1)
+        wait_for_page_ready("scmedicaid", replaced_sleep=1)
         act_on_element('//input[@value="Continue"]', "click_element")
         log_message("Finish - Populate Primary Diagnosis")
         
+    @timed_step
     def populate_det_lines(self, service_lines_dict_list: list):
         """
-        Function that populates det lines extracted from the claim found on CentralReach
+        Function that populates det lines extracted from the claim found on CentralReach.
+        Each line is filled in one scripted fill and added waiting for the det lines grid to get the new row.
         """
         log_message("Start - Populate Det Lines")
 
         switch_window("SCMedicaid")
-        for service_line in service_lines_dict_list:
-            from_date_service_input = act_on_element('//input[@name="fromDateOfService"]', "find_element")
-            from_date_service_input.click()
-            from_date_service_input.clear()
-            self.browser.input_text_when_element_is_visible(from_date_service_input, service_line['from_date_service'])
-            to_date_service_input = act_on_element('//input[@name="toDateOfService"]', "find_element")
-            to_date_service_input.click()
-            to_date_service_input.clear()
-            self.browser.input_text_when_element_is_visible(to_date_service_input, service_line['to_date_service'])
-            act_on_element('//select[@name="placeOfService"]', "click_element")
-            act_on_element('//select[@name="placeOfService"]/option[@value="{}"]'.format(service_line['place']), "click_element")
-            self.browser.input_text_when_element_is_visible('//input[@name="hcpcsCode"]', service_line['hcpcs_code'])
-            self.browser.input_text_when_element_is_visible('//input[@name="charge"]', service_line['charge'])
-            self.browser.input_text_when_element_is_visible('//input[@name="units"]', service_line['units'])
-            time.sleep(1)
-            act_on_element('//input[@name="addLineButton"]', "click_element")
-            time.sleep(3) # delete later
+        for line_number, service_line in enumerate(service_lines_dict_list, 1):
+            line_start = time.perf_counter()
+            self.add_det_line(service_line)
+            log_message("Det line {} of {} added in {:.2f}s".format(line_number, len(service_lines_dict_list), time.perf_counter() - line_start))
+        self.verify_det_lines(service_lines_dict_list)
         act_on_element('//input[@value="Continue"]', "click_element")
-        time.sleep(1)
+        wait_for_page_ready("scmedicaid", replaced_sleep=1)
         act_on_element('//input[@value="Continue"]', "click_element", 8)
 
         log_message("Finish - Populate Det Lines")
+
+    def count_det_lines(self):
+        return len(self.browser.find_elements(self.det_lines_rows_xpath))
+
+    def add_det_line(self, service_line: dict):
+        """
+        Function that fills the det line form fields in one scripted fill (firing their change events),
+        adds the line and waits until the det lines grid shows it.
+        """
+        act_on_element('//input[@name="fromDateOfService"]', "find_element")
+        act_on_element('//select[@name="placeOfService"]/option[@value="{}"]'.format(service_line['place']), "find_element")
+        det_lines_count = self.count_det_lines()
+        not_found_inputs = fill_inputs([
+            ('//input[@name="fromDateOfService"]', service_line['from_date_service']),
+            ('//input[@name="toDateOfService"]', service_line['to_date_service']),
+            ('//select[@name="placeOfService"]', service_line['place']),
+            ('//input[@name="hcpcsCode"]', service_line['hcpcs_code']),
+            ('//input[@name="charge"]', service_line['charge']),
+            ('//input[@name="units"]', service_line['units'])
+        ])
+        if not_found_inputs:
+            capture_page_screenshot(OUTPUT_FOLDER, "Exception_scmedicaid_add_det_line")
+            raise Exception("Det line inputs {} not found".format(", ".join(not_found_inputs)))
+        wait_for_page_ready("scmedicaid")
+        act_on_element('//input[@name="addLineButton"]', "click_element")
+        try:
+            wait_until(self.det_lines_rows_xpath, lambda: self.count_det_lines() > det_lines_count, 10)
+        except:
+            capture_page_screenshot(OUTPUT_FOLDER, "Exception_scmedicaid_add_det_line")
+            raise Exception("Det line {} {} was not added".format(service_line['from_date_service'], service_line['hcpcs_code']))
+        wait_for_page_ready("scmedicaid")
+
+    def verify_det_lines(self, service_lines_dict_list: list):
+        """
+        Function that checks that the det lines grid shows exactly the submitted lines (same number of lines and procedure codes).
+        """
+        det_lines = extract_table_rows(self.det_lines_rows_xpath, {"hcpcs_code": './td[@class="hcpcsCode"]'})
+        shown_codes = sorted((det_line["hcpcs_code"] or "").strip().upper() for det_line in det_lines)
+        submitted_codes = sorted(service_line['hcpcs_code'].strip().upper() for service_line in service_lines_dict_list)
+        if shown_codes != submitted_codes:
+            capture_page_screenshot(OUTPUT_FOLDER, "Exception_scmedicaid_verify_det_lines")
+            raise Exception("SC Medicaid shows det lines {} but {} were submitted".format(shown_codes, submitted_codes))
     
+    @timed_step
     def populate_other_coverage_info(self, client_name: str, total_amount_info: dict, labels_dict: dict):
         """
-        Function that search all rows that match the client name
+        Function that finds all rows that match the client name in the insured index
         and then selects each one to add the calculated amounts (based on the number of rows found)
         """
         log_message("Start - Populate Other Coverage")
@@ -154,48 +242,17 @@ class SCMedicaid():
 
         insured_name = client_name.split(" ")
         insured_name = "{}, {}".format(insured_name[1], insured_name[0])
-        act_on_element('//h4[contains(text(), "Add/Edit Other Insurance Coverage Information")]/a[text() = "Get from List"]', "click_element")
-        number_of_pages = act_on_element('//div[@class="t-data-grid-pager"][1]/a[contains(@id, "pager")][last()]', "find_element").text
-        number_of_pages = int(number_of_pages)
-        clients_found_dict_list = []
-        for page in range(1, number_of_pages + 1):
-            log_message("-Searching insured patient in page {} of {}...".format(page, number_of_pages))
-            try:
-                act_on_element('//div[@class="t-data-grid-pager"][1]/a[contains(@id, "pager") and text() = "{}"]'.format(page), "click_element", 2)
-            except:
-                pass
-            act_on_element('//div[@class="t-data-grid-pager"][1]/span[@class="current" and text() = "{}"]'.format(page), "find_element") 
-            table_base_xpath = '//table[@class="t-data-grid"]/tbody/tr'
-            insured_xpath = '[child::td[@class="name" and child::a[contains(translate(text(), "{}", "{}"), "{}")]]]//td[@class="policyNum"]'.format(insured_name.upper(), insured_name.lower(), insured_name.lower())
-            full_xpath = '{}{}'.format(table_base_xpath, insured_xpath)
-            try:
-                insured_elements = act_on_element(full_xpath, "find_elements", 1)
-            except:
-                pass
-            else:
-                print("Patient {} was found in page {} - {} time(s)".format(client_name, page, len(insured_elements)))
-                insured_found = [{"page": page, "policy_num": insured_element.text} for insured_element in insured_elements]
-                clients_found_dict_list.extend(insured_found)
-
-        act_on_element('//div[contains(@id, "insuredListWindow")]//div[@class="bluelighting_close" and contains(@id, "close")]', "click_element")
-        time.sleep(5)#delete later
+        clients_found_dict_list = self.find_insured(insured_name)
         if len(clients_found_dict_list) > 0:
+            log_message("Patient {} was found {} time(s) in pages {}".format(client_name, len(clients_found_dict_list), ", ".join(str(client_found["page"]) for client_found in clients_found_dict_list)))
             total_amount_info = self.calculate_insured_amounts(total_amount_info, len(clients_found_dict_list))
             print("Searching every client with new total amount", total_amount_info)
             for client_found in clients_found_dict_list:
-                act_on_element('//h4[contains(text(), "Add/Edit Other Insurance Coverage Information")]/a[text() = "Get from List"]', "click_element")
-                try:
-                    act_on_element('//div[@class="t-data-grid-pager"][1]/a[contains(@id, "pager") and text() = "{}"]'.format(client_found['page']), "click_element", 2)
-                except:
-                    pass
-                act_on_element('//div[@class="t-data-grid-pager"][1]/span[@class="current" and text() = "{}"]'.format(client_found['page']), "find_element")
-                table_base_xpath = '//table[@class="t-data-grid"]/tbody/tr'
-                insured_xpath = '[child::td[@class="policyNum" and text() = "{}"]]//a[contains(translate(text(), "{}", "{}"), "{}")]'.format(client_found['policy_num'], insured_name.upper(), insured_name.lower(), insured_name.lower())
-                full_xpath = '{}{}'.format(table_base_xpath, insured_xpath)
-                act_on_element(full_xpath, "click_element", 3)
+                act_on_element(self.insured_list_link_xpath, "click_element")
+                self.select_insured(client_found, insured_name)
                 self.fill_insured_coverage_form(total_amount_info)
                 act_on_element('//input[@name="addTplRecordButton" and @value = "Save"]', "click_element")
-                time.sleep(5) #delete later
+                wait_for_page_ready("scmedicaid", replaced_sleep=5)
             
             if RunMode.save_changes:
                 act_on_element('//input[@value="Finish Claim"]" and @value = "Save"]', "click_element")
@@ -207,6 +264,108 @@ class SCMedicaid():
         log_message("Finsh - Populate Other Coverage")
         return new_labels_dict
 
+    @staticmethod
+    def normalize_insured_name(insured_name: str):
+        return " ".join(insured_name.lower().split())
+
+    def lookup_insured(self, insured_name: str):
+        """
+        Function that returns the indexed entries of the insured name.
+        """
+        insured_name = self.normalize_insured_name(insured_name)
+        if insured_name in self.insured_index:
+            return list(self.insured_index[insured_name].values())
+        # The list can show the name with a middle name or suffix ("doe, jane m"), which the list scan matched by contains
+        return [entry for indexed_name, entries in self.insured_index.items() if insured_name in indexed_name for entry in entries.values()]
+
+    @timed_step
+    def find_insured(self, insured_name: str):
+        """
+        Function that returns the page and policy number of the rows that match the insured name.
+        The insured list is scanned once per session. When the name is not indexed, the list is refreshed from its last
+        indexed page (rows added since the scan) and, only the first time a name is missing, scanned again completely.
+        Names still missing are remembered, as clients without other coverage are expected, and not searched again.
+        """
+        clients_found_dict_list = self.lookup_insured(insured_name)
+        if clients_found_dict_list:
+            return clients_found_dict_list
+        normalized_insured_name = self.normalize_insured_name(insured_name)
+        if normalized_insured_name in self.missed_insured_names:
+            log_message("Insured {} was already not found in the insured list".format(insured_name))
+            return []
+        act_on_element(self.insured_list_link_xpath, "click_element")
+        if self.insured_index_page_count:
+            log_message("Insured {} not indexed, refreshing the insured list from page {}".format(insured_name, self.insured_index_page_count))
+            self.scan_insured_pages(self.insured_index_page_count)
+            clients_found_dict_list = self.lookup_insured(insured_name)
+            if not clients_found_dict_list and not self.insured_list_rescanned:
+                log_message("Insured {} still not indexed, scanning the insured list again".format(insured_name))
+                self.insured_list_rescanned = True
+                self.insured_index = {}
+                self.scan_insured_pages(1)
+                clients_found_dict_list = self.lookup_insured(insured_name)
+        else:
+            self.scan_insured_pages(1)
+            clients_found_dict_list = self.lookup_insured(insured_name)
+        if not clients_found_dict_list:
+            self.missed_insured_names.add(normalized_insured_name)
+        act_on_element('//div[contains(@id, "insuredListWindow")]//div[@class="bluelighting_close" and contains(@id, "close")]', "click_element")
+        wait_for_page_ready("scmedicaid", replaced_sleep=5)
+        return clients_found_dict_list
+
+    def go_to_insured_page(self, page: int):
+        """
+        Function that opens a page of the insured list window and waits until it's the current page.
+        """
+        try:
+            act_on_element('//div[@class="t-data-grid-pager"][1]/a[contains(@id, "pager") and text() = "{}"]'.format(page), "click_element", 2)
+        except:
+            pass
+        act_on_element('//div[@class="t-data-grid-pager"][1]/span[@class="current" and text() = "{}"]'.format(page), "find_element")
+
+    def scan_insured_pages(self, first_page: int):
+        """
+        Function that adds the insured rows from first_page to the last page of the open insured list window to the index.
+        An insured is indexed once per name and policy number, with the page it was last seen in, so rows that moved
+        to another page since the last scan update their page instead of being added again.
+        """
+        number_of_pages = act_on_element('//div[@class="t-data-grid-pager"][1]/a[contains(@id, "pager")][last()]', "find_element").text
+        number_of_pages = max(int(number_of_pages), first_page)
+        for page in range(first_page, number_of_pages + 1):
+            log_message("-Indexing insured list page {} of {}...".format(page, number_of_pages))
+            self.go_to_insured_page(page)
+            insured_rows = extract_table_rows('//table[@class="t-data-grid"]/tbody/tr', {
+                "name": './td[@class="name"]/a',
+                "policy_num": './td[@class="policyNum"]'
+            })
+            for insured_row in insured_rows:
+                if insured_row["name"]:
+                    entries = self.insured_index.setdefault(self.normalize_insured_name(insured_row["name"]), {})
+                    entries[insured_row["policy_num"]] = {"page": page, "policy_num": insured_row["policy_num"]}
+        self.insured_index_page_count = number_of_pages
+
+    def select_insured(self, client_found: dict, insured_name: str):
+        """
+        Function that selects the insured row of the entry in the open insured list window, going straight to its page.
+        If the row moved to another page since it was indexed, the list is indexed again and the row is searched in its new page.
+        """
+        table_base_xpath = '//table[@class="t-data-grid"]/tbody/tr'
+        insured_xpath = '[child::td[@class="policyNum" and text() = "{}"]]//a[contains(translate(text(), "{}", "{}"), "{}")]'.format(client_found['policy_num'], insured_name.upper(), insured_name.lower(), insured_name.lower())
+        full_xpath = '{}{}'.format(table_base_xpath, insured_xpath)
+        try:
+            self.go_to_insured_page(client_found['page'])
+            act_on_element(full_xpath, "click_element", 3)
+        except:
+            log_message("Insured {} not found in page {}, indexing the insured list again".format(insured_name, client_found['page']))
+            self.insured_index = {}
+            self.scan_insured_pages(1)
+            new_page = next((entry["page"] for entry in self.lookup_insured(insured_name) if entry["policy_num"] == client_found['policy_num']), None)
+            if new_page is None:
+                capture_page_screenshot(OUTPUT_FOLDER, "Exception_scmedicaid_select_insured")
+                raise Exception("Insured {} with policy {} not found in SC Medicaid".format(insured_name, client_found['policy_num']))
+            self.go_to_insured_page(new_page)
+            act_on_element(full_xpath, "click_element", 3)
+
 
     def calculate_insured_amounts(self, insured_amounts_dict: dict, number_of_rows: int):
         """
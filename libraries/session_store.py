@@ -0,0 +1,132 @@
+import base64
+import json
+import os
+import time
+from libraries.common import log_message, act_on_element
+from config import STATE_FOLDER, SESSION_COOKIES_ENABLED, SESSION_COOKIES_MAX_AGE, SESSION_COOKIES_KEY
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+except ImportError:
+    Fernet = None
+
+KEY_DERIVATION_ITERATIONS = 390000
+
+
+class SessionStore():
+    """
+    Encrypted store of the authenticated cookies of a portal, so a restart within the session lifetime can skip the login.
+    The cookies of the site domains are read and set with the Chrome DevTools Protocol, which works for every domain
+    whatever page is open. The file is encrypted with SESSION_COOKIES_KEY or, if it isn't set, with a key derived from
+    the portal credentials (PBKDF2 with a random salt kept next to the file), and expires after SESSION_COOKIES_MAX_AGE seconds.
+    """
+
+    def __init__(self, rpa_selenium_instance, site: str, domains: list, secret: str):
+        self.browser = rpa_selenium_instance
+        self.site = site
+        self.domains = domains
+        self.file_path = os.path.join(STATE_FOLDER, "sessions", "{}.cookies".format(site))
+        self.salt_path = os.path.join(STATE_FOLDER, "sessions", "{}.salt".format(site))
+        self.enabled = SESSION_COOKIES_ENABLED and Fernet is not None
+        self.fernet = None
+        if self.enabled:
+            try:
+                self.fernet = self.get_fernet(secret)
+            except Exception as e:
+                log_message("{} session store is turned off, its key couldn't be loaded: {}".format(site, str(e)))
+                self.enabled = False
+
+    def get_fernet(self, secret: str):
+        """
+        Returns the cipher of the saved session: SESSION_COOKIES_KEY if it's set, otherwise a key derived from the secret
+        with PBKDF2 and the salt of the site, created the first time.
+        """
+        if SESSION_COOKIES_KEY:
+            return Fernet(SESSION_COOKIES_KEY.encode())
+        if os.path.exists(self.salt_path):
+            with open(self.salt_path, "rb") as salt_file:
+                salt = salt_file.read()
+        else:
+            salt = os.urandom(16)
+            os.makedirs(os.path.dirname(self.salt_path), exist_ok=True)
+            temporary_salt_path = "{}.{}.tmp".format(self.salt_path, os.getpid())
+            with open(temporary_salt_path, "wb") as salt_file:
+                salt_file.write(salt)
+            os.replace(temporary_salt_path, self.salt_path)
+        key_derivation = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KEY_DERIVATION_ITERATIONS)
+        return Fernet(base64.urlsafe_b64encode(key_derivation.derive(secret.encode())))
+
+    def is_site_cookie(self, cookie: dict):
+        domain = cookie.get("domain", "").lstrip(".")
+        return any(domain == site_domain or domain.endswith("." + site_domain) for site_domain in self.domains)
+
+    def save(self):
+        """
+        Saves the cookies of the site domains, encrypted, with the time they expire.
+        """
+        if not self.enabled:
+            return
+        try:
+            cookies = [cookie for cookie in self.browser.driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"] if self.is_site_cookie(cookie)]
+            session = {"expires_at": time.time() + SESSION_COOKIES_MAX_AGE, "cookies": cookies}
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            temporary_file_path = "{}.{}.tmp".format(self.file_path, os.getpid())
+            with open(temporary_file_path, "wb") as session_file:
+                session_file.write(self.fernet.encrypt(json.dumps(session).encode()))
+            os.replace(temporary_file_path, self.file_path)
+            log_message("{} session saved ({} cookies)".format(self.site, len(cookies)))
+        except Exception as e:
+            log_message("{} session couldn't be saved: {}".format(self.site, str(e)))
+
+    def restore(self):
+        """
+        Sets the saved cookies in the browser. Returns False if there is no saved session or it expired.
+        """
+        if not self.enabled or not os.path.exists(self.file_path):
+            return False
+        try:
+            with open(self.file_path, "rb") as session_file:
+                session = json.loads(self.fernet.decrypt(session_file.read()).decode())
+        except (InvalidToken, ValueError, OSError) as e:
+            log_message("{} saved session couldn't be read, logging in: {}".format(self.site, str(e)))
+            self.clear()
+            return False
+        now = time.time()
+        if session["expires_at"] <= now:
+            log_message("{} saved session expired, logging in".format(self.site))
+            self.clear()
+            return False
+        cookies = []
+        for cookie in session["cookies"]:
+            if cookie.get("expires", -1) > 0 and cookie["expires"] <= now:
+                continue
+            cookie = {key: value for key, value in cookie.items() if key in ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")}
+            if cookie.get("expires", -1) <= 0:
+                cookie.pop("expires", None)
+            cookies.append(cookie)
+        try:
+            self.browser.driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+        except Exception as e:
+            log_message("{} saved session couldn't be restored, logging in: {}".format(self.site, str(e)))
+            return False
+        log_message("{} session restored ({} cookies)".format(self.site, len(cookies)))
+        return True
+
+    def is_logged_in(self, logged_in_xpath: str, login_form_xpath: str, time_range: float = 10):
+        """
+        Checks that the current page of the restored session is a logged in page and not the login form.
+        """
+        try:
+            act_on_element("{} | {}".format(logged_in_xpath, login_form_xpath), "find_element", time_range)
+        except Exception:
+            return False
+        return len(self.browser.find_elements(login_form_xpath)) == 0 and len(self.browser.find_elements(logged_in_xpath)) > 0
+
+    def clear(self):
+        """
+        Deletes the saved session, e.g. when the restored session turned out to be invalid.
+        """
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
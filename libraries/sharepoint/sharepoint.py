@@ -2,27 +2,130 @@ from libraries.common import (
     log_message,
     act_on_element,
     capture_page_screenshot,
-    check_file_download_complete
+    DownloadWatcher,
+    switch_window,
+    timed_step
 )
-from config import OUTPUT_FOLDER
+from config import OUTPUT_FOLDER, STATE_FOLDER
+import json
+import os
+import threading
+import time
+import requests
 
 class SharePoint():
 
     def __init__(self, rpa_selenium_instance, credentials: dict):
         self.browser = rpa_selenium_instance
         self.sharepoint_url = credentials["url"]
+        self.mapping_file_name = "(SHARED) Thoughtful Automation Spreadsheet - Billing.xlsx"
+        self.stored_file_path = os.path.join(STATE_FOLDER, self.mapping_file_name)
+        self.stored_file_info_path = os.path.join(STATE_FOLDER, "mapping_file_download.json")
+        self.download_thread = None
+        self.download_result = {}
 
+    @timed_step
     def download_file(self):
         """
-        Function that downloads the XLSX file from SharePoint to the OUTPUT folder
+        Function that downloads the XLSX file from SharePoint to the OUTPUT folder and returns its path
         """
         try:
             log_message("Start - Download file from SharePoint")
-            self.browser.go_to(self.sharepoint_url)
+            switch_window("SharePoint", self.sharepoint_url)
             file_download_url = act_on_element('//form[@id="office_form"]/input[@name="fileGetUrl"]', "find_element").get_attribute("value")
-            self.browser.go_to(file_download_url)
-            check_file_download_complete("xlsx", 20)
+            with DownloadWatcher(OUTPUT_FOLDER, "xlsx") as download:
+                switch_window("SharePoint", file_download_url)
+                file_path = download.wait(20)
             log_message("Finish - Download file from SharePoint")
         except Exception as e:
             capture_page_screenshot(OUTPUT_FOLDER, "Exception_Sharepoint_Download_File")
             raise Exception("Download file from SharePoint failed.")
+        return file_path
+
+    @timed_step
+    def start_download(self):
+        """
+        Function that gets the file download url from SharePoint and downloads the file in a background thread
+        with the browser session cookies, so the portal logins don't wait for it. Call wait_for_file to get its path.
+        """
+        log_message("Start - Background download file from SharePoint")
+        try:
+            switch_window("SharePoint", self.sharepoint_url)
+            file_download_url = act_on_element('//form[@id="office_form"]/input[@name="fileGetUrl"]', "find_element").get_attribute("value")
+            session = requests.Session()
+            session.headers["User-Agent"] = self.browser.driver.execute_script("return navigator.userAgent;")
+            for cookie in self.browser.driver.get_cookies():
+                session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+        except Exception as e:
+            log_message("Background download couldn't start, the file will be downloaded with the browser: {}".format(e))
+            return
+        self.download_thread = threading.Thread(target=self.download_in_background, args=(session, file_download_url), daemon=True)
+        self.download_thread.start()
+        log_message("Finish - Background download file from SharePoint")
+
+    def download_in_background(self, session, file_download_url: str):
+        """
+        Function that runs in the download thread. Asks for the file only if it changed since the stored copy
+        (ETag / Last-Modified) and saves the result (file path or error) in download_result.
+        """
+        download_start = time.perf_counter()
+        try:
+            stored_file_info = self.read_stored_file_info()
+            headers = {}
+            if stored_file_info.get("etag"):
+                headers["If-None-Match"] = stored_file_info["etag"]
+            if stored_file_info.get("last_modified"):
+                headers["If-Modified-Since"] = stored_file_info["last_modified"]
+            response = session.get(file_download_url, headers=headers, stream=True, timeout=60)
+            if response.status_code == 304:
+                self.download_result["status"] = "not modified"
+            else:
+                response.raise_for_status()
+                temporary_file_path = "{}.{}.part".format(self.stored_file_path, os.getpid())
+                with open(temporary_file_path, "wb") as downloaded_file:
+                    for chunk in response.iter_content(65536):
+                        downloaded_file.write(chunk)
+                os.replace(temporary_file_path, self.stored_file_path)
+                self.save_stored_file_info({"etag": response.headers.get("ETag", ""), "last_modified": response.headers.get("Last-Modified", "")})
+                self.download_result["status"] = "downloaded"
+            self.download_result["file_path"] = self.stored_file_path
+        except Exception as e:
+            self.download_result["error"] = e
+        self.download_result["elapsed"] = time.perf_counter() - download_start
+
+    def read_stored_file_info(self):
+        """
+        Function that returns the ETag and Last-Modified of the stored copy, or an empty dict if there is no stored copy.
+        """
+        if not os.path.exists(self.stored_file_path) or not os.path.exists(self.stored_file_info_path):
+            return {}
+        try:
+            with open(self.stored_file_info_path) as stored_file_info:
+                return json.load(stored_file_info)
+        except Exception:
+            return {}
+
+    def save_stored_file_info(self, stored_file_info: dict):
+        temporary_info_path = "{}.{}.tmp".format(self.stored_file_info_path, os.getpid())
+        with open(temporary_info_path, "w") as stored_file_info_file:
+            json.dump(stored_file_info, stored_file_info_file)
+        os.replace(temporary_info_path, self.stored_file_info_path)
+
+    @timed_step
+    def wait_for_file(self, time_range: float = 60):
+        """
+        Function that waits for the background download and returns the file path.
+        Falls back to the browser download if the background download didn't start or failed.
+        """
+        if self.download_thread is None:
+            return self.download_file()
+        wait_start = time.perf_counter()
+        self.download_thread.join(time_range)
+        waited = time.perf_counter() - wait_start
+        if self.download_thread.is_alive() or "error" in self.download_result:
+            log_message("Background download of the mapping file failed, downloading it with the browser: {}".format(self.download_result.get("error", "timeout")))
+            return self.download_file()
+        download_elapsed = self.download_result["elapsed"]
+        log_message("Mapping file {} in {:.1f}s in the background, waited {:.1f}s for it, {:.1f}s of startup saved".format(
+            self.download_result["status"], download_elapsed, waited, max(download_elapsed - waited, 0)))
+        return self.download_result["file_path"]
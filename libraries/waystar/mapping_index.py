@@ -0,0 +1,79 @@
+from libraries.common import log_message
+
+
+class MappingIndex():
+    """
+    Sheets of the mapping file indexed by their lookup keys:
+    payor name for 'Payor List' and 'Payor Address', (payor, provider label, billing code) for 'Provider Modifier'
+    and (payor, location) for 'Location Modifier'. Keys are normalized once when the file is loaded.
+    The sheet rows are still available as mapping_index[sheet_name], as in the dict returned before.
+    """
+
+    # Sheet name: columns of the lookup key
+    key_columns = {
+        "Payor List": ("CentralReach Payor Name",),
+        "Payor Address": ("CentralReach Payor Name",),
+        "Provider Modifier": ("CentralReach Payor Name", "Provider Label", "Billing Code"),
+        "Location Modifier": ("Payor", "Location"),
+    }
+
+    def __init__(self, sheets: dict):
+        self.sheets = sheets
+        self.indexes = {}
+        self.conflicts = []
+        for sheet_name, columns in self.key_columns.items():
+            self.indexes[sheet_name] = self.build_index(sheet_name, columns)
+
+    @staticmethod
+    def normalize_key(*values):
+        """
+        Normalizes key values the same way the lookups compare them (text, upper case).
+        """
+        return tuple(str(value).upper() for value in values)
+
+    def build_index(self, sheet_name: str, columns: tuple):
+        """
+        Indexes the rows of a sheet by their key. The first row of a key wins, as the linear scans did,
+        and later rows with the same key are recorded as duplicates (same values) or conflicts (different values).
+        """
+        index = {}
+        for row_number, row in enumerate(self.sheets.get(sheet_name, []), 1):
+            if not all(column in row for column in columns):
+                continue
+            key = self.normalize_key(*[row[column] for column in columns])
+            if key in index:
+                self.conflicts.append({
+                    "sheet": sheet_name,
+                    "key": key,
+                    "row": row_number,
+                    "type": "duplicate" if row == index[key] else "conflict",
+                })
+            else:
+                index[key] = row
+        return index
+
+    def __getitem__(self, sheet_name: str):
+        return self.sheets[sheet_name]
+
+    def __contains__(self, sheet_name: str):
+        return sheet_name in self.sheets
+
+    def log_conflicts(self):
+        """
+        Logs the duplicated and conflicting keys found in the mapping file.
+        """
+        for conflict in self.conflicts:
+            log_message("Mapping file {} in sheet '{}' entry {}: key {} already defined, the first entry is used".format(
+                conflict["type"], conflict["sheet"], conflict["row"], " / ".join(conflict["key"])))
+
+    def get_payor(self, payor_name: str):
+        return self.indexes["Payor List"].get(self.normalize_key(payor_name))
+
+    def get_payor_address(self, payor_name: str):
+        return self.indexes["Payor Address"].get(self.normalize_key(payor_name))
+
+    def get_provider_modifier(self, payor_name: str, provider_label: str, billing_code: str):
+        return self.indexes["Provider Modifier"].get(self.normalize_key(payor_name, provider_label, billing_code))
+
+    def get_location_modifier(self, payor_name: str, location: str):
+        return self.indexes["Location Modifier"].get(self.normalize_key(payor_name, location))
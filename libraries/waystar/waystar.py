@@ -1,8 +1,13 @@
 
-from libraries.common import act_on_element, capture_page_screenshot, log_message, switch_window, close_window, files
-from config import OUTPUT_FOLDER, RunMode
-import time
+from libraries.common import act_on_element, capture_page_screenshot, log_message, switch_window, close_window, wait_for_page_ready, timed_step, files, get_file_sha256, wait_for_table_rows, fill_inputs, click_without_waiting, mark_for_rerender, wait_for_rerender
+from libraries.session_store import SessionStore
+from libraries.waystar.mapping_index import MappingIndex
+from config import OUTPUT_FOLDER, STATE_FOLDER, SHARED_STATE_FOLDER, RUN_STATE_KEY, WORKER_ID, MAPPING_FILE_CACHE_ENABLED, WAYSTAR_PREFETCH_MAX_PAGES, RunMode
 from copy import deepcopy
+import json
+import os
+import pickle
+import time
 
 class Waystar():
 
@@ -11,34 +16,85 @@ class Waystar():
         self.waystar_url = credentials["url"]
         self.waystar_login = credentials["login"]
         self.waystar_password = credentials["password"]
+        self.session_store = SessionStore(rpa_selenium_instance, "waystar", ["zirmed.com", "waystar.com"], "{}:{}".format(self.waystar_login, self.waystar_password))
+        self.session_restored = False
         self.additional_authentication_answer = "Thoughtful Automation"
         self.claims_search_url = "https://claims.zirmed.com/Claims/Listing/Index?appid=1"
         self.mapping_file_name = "(SHARED) Thoughtful Automation Spreadsheet - Billing.xlsx"
+        self.mapping_cache_file = os.path.join(STATE_FOLDER, "mapping_file_cache.pickle")
+        self.claims_grid_rows_xpath = '//table[@id="claimsGrid"]//tr[contains(@class,"gridViewRow")]'
+        self.claims_grid_columns = {
+            "patient_number": './td[contains(@class, "patNumCell")]',
+            "sequence_number": './td[contains(@class, "sequenceNumCell")]',
+            "payer_name": ('./td[contains(@class, "subPayerCell")]/span', "title"),
+            "has_remit": ('./following-sibling::tr[1][contains(@class,"tagRow")]//span[@title = "Has Remit"]', "title")
+        }
+        self.claims_grid_next_page_xpath = '//div[contains(@class, "pager")]//a[contains(@class, "next") and not(contains(@class, "disabled"))]'
+        self.claim_status_dict = {}
+        self.claim_statuses_prefetched = False
+        # The workers of a parallel run read the claims grid once: the first one shares the rows in this file
+        self.shared_claim_statuses_file = os.path.join(SHARED_STATE_FOLDER, "shared_waystar_claim_statuses_{}.json".format(RUN_STATE_KEY)) if WORKER_ID else ""
+        self.shared_claim_statuses_wait = 600
+        self.service_rows_xpath = '//table[@id="scr4_FV1_GV"]//tr[descendant::a[text() = "Delete"]]'
 
     def login(self):
         """
         Login to Waystar with Bitwarden credentials.
         """
+        self.start_login()
+        self.finish_login()
+
+    @timed_step
+    def start_login(self):
+        """
+        Opens Waystar with the saved session cookies if there are valid ones, otherwise submits the login form
+        without waiting for the page it loads, so the other portals can start their login meanwhile.
+        """
         log_message("Start - Login Waystar")
         try:
-            switch_window("Waystar", self.waystar_url)
-            self.input_credentials()
-            self.check_additional_authentication()
+            self.session_restored = self.session_store.restore()
+            if self.session_restored:
+                switch_window("Waystar", self.claims_search_url)
+            else:
+                switch_window("Waystar", self.waystar_url)
+                self.input_credentials()
+        except Exception:
+            capture_page_screenshot(OUTPUT_FOLDER, "Exception_waystar_Login")
+            raise Exception("Login to Waystar failed")
+
+    @timed_step
+    def finish_login(self):
+        """
+        Waits until Waystar is logged in, answering the additional authentication question if it's asked.
+        If the restored session isn't valid, logs in with the credentials.
+        """
+        try:
+            switch_window("Waystar")
+            if self.session_restored:
+                if not self.session_store.is_logged_in('//div[@id="mainContent"]', '//input[@id="loginName"]'):
+                    log_message("Waystar restored session is not valid, logging in")
+                    self.session_store.clear()
+                    self.session_restored = False
+                    switch_window("Waystar", self.waystar_url)
+                    self.input_credentials()
+            if not self.session_restored:
+                act_on_element('//input[@id="verifyAnswer"] | //div[@id="mainContent"]', "find_element", 15)
+                self.check_additional_authentication()
             act_on_element('//div[@id="mainContent"]', "find_element")
-            
+            if not self.session_restored:
+                self.session_store.save()
         except Exception:
             capture_page_screenshot(OUTPUT_FOLDER, "Exception_waystar_Login")
             raise Exception("Login to Waystar failed")
         log_message("Finish - Login Waystar")
 
-        
     def input_credentials(self):
         """
         Function that writes the credentials and submits the login form.
         """
         self.browser.input_text_when_element_is_visible('//input[@id="loginName"]', self.waystar_login)
         self.browser.input_text_when_element_is_visible('//input[@id="password"]', self.waystar_password)
-        self.browser.click_element('//input[@id="loginButton"]')
+        click_without_waiting('//input[@id="loginButton"]')
         return
 
     def check_additional_authentication(self):
@@ -53,41 +109,91 @@ class Waystar():
         except:
             pass
 
-    def read_mapping_file(self):
+    @timed_step
+    def read_mapping_file(self, mapping_file_path: str = ""):
         """
-        Function that opens the mapping file and reads the specified sheets
+        Function that opens the mapping file and reads the specified sheets.
+        Uses the downloaded file path when it's given, otherwise the default file name in the output folder.
+        The cleaned sheets are cached by the workbook SHA-256, so an unchanged workbook isn't opened again.
+        Returns a MappingIndex with the sheets indexed by their lookup keys.
         """
         log_message("Start - Read Mapping File")
 
+        load_start = time.perf_counter()
+        try:
+            if not mapping_file_path:
+                mapping_file_path = "{}/{}".format(OUTPUT_FOLDER, self.mapping_file_name)
+            workbook_hash = get_file_sha256(mapping_file_path)
+            mapping_file_data = self.load_mapping_cache(workbook_hash)
+            if mapping_file_data is not None:
+                log_message("Mapping file loaded from cache in {:.3f}s".format(time.perf_counter() - load_start))
+            else:
+                mapping_file_data = self.read_mapping_workbook(mapping_file_path)
+                log_message("Mapping file read from workbook in {:.3f}s".format(time.perf_counter() - load_start))
+                self.save_mapping_cache(workbook_hash, mapping_file_data)
+        except Exception as e:
+            raise Exception("Read mapping file failed:" , e)
+        mapping_index = MappingIndex(mapping_file_data)
+        mapping_index.log_conflicts()
+
+        log_message("Finish - Read Mapping File")
+        return mapping_index
+
+    def read_mapping_workbook(self, mapping_file_path: str):
+        """
+        Function that reads and cleans the mapping sheets from the workbook.
+        """
         mapping_file_data = {
             "Payor List": [],
             "Payor Address": [],
             "Provider Modifier": [],
             "Location Modifier": []
         }
-        try:
-            files.open_workbook("{}/{}".format(OUTPUT_FOLDER, self.mapping_file_name))
-            #files.open_workbook("{}".format(self.mapping_file_name))
-            for sheet_name in mapping_file_data:
-                excel_data_list = files.read_worksheet(name = sheet_name, header = True)
-                excel_data_cleaned_list = [row for row in [{key: value for key, value in row_dict.items() if value != None} for row_dict in excel_data_list] if len(row)>0]
-                mapping_file_data[sheet_name] = excel_data_cleaned_list
-            files.close_workbook()
-        except Exception as e:
-            raise Exception("Read mapping file failed:" , e)
-
-        log_message("Finish - Read Mapping File")
+        files.open_workbook(mapping_file_path)
+        #files.open_workbook("{}".format(self.mapping_file_name))
+        for sheet_name in mapping_file_data:
+            excel_data_list = files.read_worksheet(name = sheet_name, header = True)
+            excel_data_cleaned_list = [row for row in [{key: value for key, value in row_dict.items() if value != None} for row_dict in excel_data_list] if len(row)>0]
+            mapping_file_data[sheet_name] = excel_data_cleaned_list
+        files.close_workbook()
         return mapping_file_data
 
-    def determine_if_valid_secondary_claim(self, claim_id: str, labels_dict: dict):
+    def load_mapping_cache(self, workbook_hash: str):
         """
-        Function that searchs the claim and checks if it has a proper secondary 
-        """        
-        log_message("Start - Determine If Valid Secondary Claim")
+        Function that returns the cached mapping sheets if they were read from the same workbook content, otherwise None.
+        """
+        if not MAPPING_FILE_CACHE_ENABLED or not os.path.exists(self.mapping_cache_file):
+            return None
+        try:
+            with open(self.mapping_cache_file, "rb") as cache_file:
+                mapping_cache = pickle.load(cache_file)
+        except Exception as e:
+            log_message("Mapping file cache couldn't be read, reading the workbook: {}".format(e))
+            return None
+        if mapping_cache.get("workbook_hash") != workbook_hash:
+            log_message("Mapping file changed since it was cached, reading the workbook")
+            return None
+        return mapping_cache["sheets"]
 
-        seq_number_to_check = "2"
-        new_labels_dict = deepcopy(labels_dict)
+    def save_mapping_cache(self, workbook_hash: str, mapping_file_data: dict):
+        """
+        Function that saves the cleaned mapping sheets with the workbook hash. Written to a temporary file first,
+        so an interrupted run can't leave a partial cache.
+        """
+        if not MAPPING_FILE_CACHE_ENABLED:
+            return
+        try:
+            temporary_cache_file = "{}.{}.tmp".format(self.mapping_cache_file, os.getpid())
+            with open(temporary_cache_file, "wb") as cache_file:
+                pickle.dump({"workbook_hash": workbook_hash, "sheets": mapping_file_data}, cache_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_cache_file, self.mapping_cache_file)
+        except Exception as e:
+            log_message("Mapping file cache couldn't be saved: {}".format(e))
 
+    def search_claims(self, claim_id: str = ""):
+        """
+        Function that searchs the claims with any status and transaction date, of one patient number if it's given.
+        """
         switch_window("Waystar", self.claims_search_url)
         act_on_element('//select[@id="SearchCriteria_Status"]', "click_element")
         act_on_element('//select[@id="SearchCriteria_Status"]/option[@value="-1"]', "click_element")
@@ -96,25 +202,128 @@ class Waystar():
         act_on_element('//select[@id="SearchCriteria_TransDate"]/option[text()="All"]', "click_element")
         act_on_element('//input[@id="ClaimListingSearchButtonBottom"]', "click_element")
 
-        claim_seq = act_on_element('//table[@id="claimsGrid"]//tr[contains(@class,"gridViewRow")][1]/td[contains(@class, "sequenceNumCell")]', "find_element").text
-        if seq_number_to_check == claim_seq.strip():
+    @timed_step
+    def prefetch_claim_statuses(self, claim_ids: list):
+        """
+        Function that searchs the claims once per run and reads sequence number, sub payer and remit tag of every row
+        of the claims grid, up to WAYSTAR_PREFETCH_MAX_PAGES pages, keyed by patient number. The first row of a patient
+        number is kept, as in the single claim search. The next payors look their claims up in the rows already read,
+        and the workers of a parallel run use the rows read by the first of them.
+        """
+        if not self.claim_statuses_prefetched and not self.read_shared_claim_statuses():
+            log_message("Start - Prefetch Claim Statuses")
+            self.claim_statuses_prefetched = True
+            try:
+                self.search_claims()
+                for page in range(1, WAYSTAR_PREFETCH_MAX_PAGES + 1):
+                    claim_rows = wait_for_table_rows(self.claims_grid_rows_xpath, self.claims_grid_columns)
+                    for claim_row in claim_rows:
+                        patient_number = (claim_row["patient_number"] or "").strip()
+                        if patient_number and patient_number not in self.claim_status_dict:
+                            self.claim_status_dict[patient_number] = claim_row
+                    if page == WAYSTAR_PREFETCH_MAX_PAGES:
+                        break
+                    mark_for_rerender(self.claims_grid_rows_xpath)
+                    try:
+                        act_on_element(self.claims_grid_next_page_xpath, "click_element", 1)
+                    except:
+                        break
+                    wait_for_rerender(self.claims_grid_rows_xpath, "waystar")
+            except Exception as e:
+                capture_page_screenshot(OUTPUT_FOLDER, "Exception_waystar_prefetch_claim_statuses")
+                log_message("Prefetch of claim statuses stopped, the missing claims will be searched one by one: {}".format(e))
+            log_message("Finish - Prefetch Claim Statuses: {} claims read".format(len(self.claim_status_dict)))
+            self.share_claim_statuses()
+        found_claims = len([claim_id for claim_id in set(claim_ids) if claim_id in self.claim_status_dict])
+        log_message("{} of {} claims found in the prefetched claim statuses".format(found_claims, len(set(claim_ids))))
+
+    def read_shared_claim_statuses(self):
+        """
+        Function that loads the claim statuses read by another worker of the parallel run. The first worker to get here
+        takes the lock and reads the grid itself; the others wait for its file. Returns True if the statuses were loaded.
+        """
+        if not self.shared_claim_statuses_file:
+            return False
+        self.claim_statuses_prefetched = True
+        try:
+            os.close(os.open("{}.lock".format(self.shared_claim_statuses_file), os.O_CREAT | os.O_EXCL))
+            return False
+        except FileExistsError:
+            pass
+        wait_end = time.time() + self.shared_claim_statuses_wait
+        while not os.path.exists(self.shared_claim_statuses_file) and time.time() < wait_end:
+            time.sleep(1)
+        try:
+            with open(self.shared_claim_statuses_file) as shared_file:
+                self.claim_status_dict = json.load(shared_file)
+        except Exception as e:
+            log_message("Claim statuses of the other workers couldn't be read, reading the claims grid: {}".format(e))
+            return False
+        log_message("Prefetch Claim Statuses: {} claims read by another worker".format(len(self.claim_status_dict)))
+        return True
+
+    def share_claim_statuses(self):
+        """
+        Function that saves the prefetched claim statuses for the other workers of the parallel run.
+        """
+        if not self.shared_claim_statuses_file:
+            return
+        try:
+            temporary_file = "{}.{}.tmp".format(self.shared_claim_statuses_file, os.getpid())
+            with open(temporary_file, "w") as shared_file:
+                json.dump(self.claim_status_dict, shared_file)
+            os.replace(temporary_file, self.shared_claim_statuses_file)
+        except Exception as e:
+            log_message("Claim statuses couldn't be shared with the other workers: {}".format(e))
+
+    def get_claim_status_labels(self, claim_status: dict, labels_dict: dict):
+        """
+        Function that returns the labels of a claim from its sequence number, sub payer and remit tag.
+        """
+        seq_number_to_check = "2"
+        new_labels_dict = deepcopy(labels_dict)
+        if seq_number_to_check == (claim_status["sequence_number"] or "").strip():
             new_labels_dict['labels_to_add'].append("AR:Secondary Billed")
             new_labels_dict['labels_to_remove'].append("AR:Need to Bill Secondary")
-        else:   
-            payer_name_waystar = act_on_element('//table[@id="claimsGrid"]//tr[contains(@class,"gridViewRow")][1]/td[contains(@class, "subPayerCell")]/span', "find_element").get_attribute("title")
+        else:
+            payer_name_waystar = claim_status["payer_name"] or ""
             if "tricare" in payer_name_waystar.lower() or "humana" in payer_name_waystar.lower():
                 new_labels_dict['labels_to_add'].append("TA: Payor Exclusion")
-            else:
+            elif not claim_status["has_remit"]:
+                log_message("Claim doesn't have remit")
+                new_labels_dict['labels_to_add'].append("TA: No Primary Remit")
+        return new_labels_dict
+
+    @timed_step
+    def determine_if_valid_secondary_claim(self, claim_id: str, labels_dict: dict):
+        """
+        Function that checks if the claim has a proper secondary, with the prefetched claim status when there is one.
+        The prefetched status is only trusted to skip a claim (secondary already billed or payor excluded). Otherwise the
+        claim is searched and its labels come from the searched row, since the prefetch is read once per run and the next
+        steps open the claim from the grid.
+        """        
+        log_message("Start - Determine If Valid Secondary Claim")
+
+        claim_status = self.claim_status_dict.get(claim_id)
+        new_labels_dict = self.get_claim_status_labels(claim_status, labels_dict) if claim_status else None
+        if new_labels_dict is None or new_labels_dict == labels_dict or "TA: No Primary Remit" in new_labels_dict['labels_to_add']:
+            self.search_claims(claim_id)
+            claim_status = wait_for_table_rows('{}[1]'.format(self.claims_grid_rows_xpath), self.claims_grid_columns)[0]
+            new_labels_dict = self.get_claim_status_labels(claim_status, labels_dict)
+            if "TA: No Primary Remit" in new_labels_dict['labels_to_add']:
+                # The remit tag can render after the row, give it the time the remit check waited before
                 try:
                     act_on_element('//table[@id="claimsGrid"]//tr[contains(@class,"tagRow")][1]//span[@title = "Has Remit"]', 'find_element', 2)
+                    claim_status["has_remit"] = "Has Remit"
+                    new_labels_dict = self.get_claim_status_labels(claim_status, labels_dict)
                 except:
-                    log_message("Claim doesn't have remit")
-                    new_labels_dict['labels_to_add'].append("TA: No Primary Remit")
+                    pass
 
         log_message("Finish - Determine If Valid Secondary Claim")
         return new_labels_dict
 
-    def populate_payer_information(self, mapping_file_data_dict_list: dict, payor_name_cr: str):
+    @timed_step
+    def populate_payer_information(self, mapping_index: MappingIndex, payor_name_cr: str):
         """
         Function that populates payer information from the mapping file to Waystar using the CentralReach payor name.
         """
@@ -125,18 +334,18 @@ class Waystar():
         act_on_element('//a[@id="gridActionSecond"]', 'click_element', 7)
         switch_window("WaystarSubInfo", open_new_window = False)
         act_on_element('//input[@id="scr1_ChangePayerButton"]', 'click_element')
-        payor = next((payor for payor in mapping_file_data_dict_list['Payor List'] if payor_name_cr.upper() == str(payor['CentralReach Payor Name']).upper()), None)
+        payor = mapping_index.get_payor(payor_name_cr)
         if payor:
             self.browser.input_text_when_element_is_visible('//input[@id="scr1_name"]', payor['Waystar Payer Name'])
             self.browser.input_text_when_element_is_visible('//input[@id="scr1_payerid"]', payor['Payer ID'])
             if payor['Requires Address'].upper() == "YES":
-                payor_address = next((payor for payor in mapping_file_data_dict_list['Payor Address'] if payor_name_cr.upper() == str(payor['CentralReach Payor Name']).upper()), None)
+                payor_address = mapping_index.get_payor_address(payor_name_cr)
                 if payor_address:
                     self.browser.input_text_when_element_is_visible('//input[@id="scr1_payeradd1"]', payor_address['Address Line 1'])
                     self.browser.input_text_when_element_is_visible('//input[@id="scr1_payercity"]', payor_address['City'])
                     self.browser.input_text_when_element_is_visible('//input[@id="scr1_payerstate"]', payor_address['State'])
                     self.browser.input_text_when_element_is_visible('//input[@id="scr1_payerzip"]', payor_address['Zip'])
-        time.sleep(5) #delete later
+        wait_for_page_ready("waystar", replaced_sleep=5)
         if RunMode.save_changes:
             act_on_element('//input[@id="scr1_SaveButton"]', 'click_element')
         else:
@@ -144,6 +353,7 @@ class Waystar():
         
         log_message("Finish - Populate Payer Information")
 
+    @timed_step
     def populate_authorization_and_subscriber_information(self, subscriber_info_dict: dict, authorization_number: str):
         """
         Function that populates subscriber information that was previously extracted from CentralReach
@@ -167,18 +377,19 @@ class Waystar():
         act_on_element('//select[@id="scr1_FV3_releaseinfo"]/option[@value = "{}"]'.format(release_information_option_value), "click_element")
         act_on_element('//select[@id="scr1_FV3_assignbenefits"]', "click_element")
         act_on_element('//select[@id="scr1_FV3_assignbenefits"]/option[@value = "{}"]'.format(assign_benefits_option_value), "click_element")
-        time.sleep(5)#delete later 
+        wait_for_page_ready("waystar", replaced_sleep=5)
         act_on_element('//input[@id="NextButton"]', 'click_element')
 
         log_message("Finish - Populate Authorization and Subscriber Information")
 
 
-    def check_remit_information(self, mapping_file_data_dict_list: dict, payor_name_cr: str, provider_label: str, labels_dict: dict):
+    @timed_step
+    def check_remit_information(self, mapping_index: MappingIndex, payor_name_cr: str, provider_label: str, labels_dict: dict):
         """
         Function that checks if the remit information is valid to proceed. Otherwise set labels.
         """
         new_labels_dict = deepcopy(labels_dict)
-        payor = next((payor for payor in mapping_file_data_dict_list['Payor List'] if payor_name_cr.upper() == str(payor['CentralReach Payor Name']).upper()), None)
+        payor = mapping_index.get_payor(payor_name_cr)
         if payor:
             valid_billing = self.check_billing_information(payor)
             if valid_billing:
@@ -186,7 +397,7 @@ class Waystar():
                 valid_adjudication = self.check_adjudication_information()
                 if valid_adjudication:
                     act_on_element('//input[@id="NextButton"]', 'click_element')
-                    self.populate_modifiers_information(payor, mapping_file_data_dict_list, payor_name_cr, provider_label)
+                    self.populate_modifiers_information(payor, mapping_index, payor_name_cr, provider_label)
                     new_labels_dict['labels_to_add'].append("AR:Secondary Billed")
                     new_labels_dict['labels_to_remove'].append("AR:Need to Bill Secondary")
                 else:
@@ -197,6 +408,7 @@ class Waystar():
             raise Exception("Waystar payor in mapping file not found")
         return new_labels_dict
 
+    @timed_step
     def check_billing_information(self, payor_dict: dict):
         """
         Checks if the payor is a RENDERING provider and the individual rendering option is checked on Waystar
@@ -208,6 +420,7 @@ class Waystar():
         log_message("Finish - Check Billing Information")
         return payor_dict['Rendering Provider'].upper() == "RENDERING" and individual_rendering_checked
                 
+    @timed_step
     def check_adjudication_information(self):
         """
         Function that checks if claim paid date, payer paid amount and other payer control number inputs are auto-populated
@@ -222,52 +435,71 @@ class Waystar():
         return adjudication_date_value and payer_paid_amount_value and other_payer_claim_control_num_value
     
 
-    def populate_modifiers_information(self, payor_dict: dict, mapping_file_data_dict_list: dict, payor_name_cr: str, provider_label: str):
+    def plan_page_modifiers(self, payor_dict: dict, mapping_index: MappingIndex, payor_name_cr: str, provider_label: str, service_rows: list):
+        """
+        Function that works out the modifier inputs to fill on a page from its service rows (procedure code and place of service).
+        Returns the list of (input xpath, value) and the list of modifiers without a match in the mapping file.
+        """
+        modifiers_column_pos = 6
+        planned_inputs = []
+        unmatched_modifiers = []
+        for row_number, service_row in enumerate(service_rows, 1):
+            procedure_code = service_row["procedure_code"] or ""
+            place_of_service_value = service_row["place_of_service"] or ""
+            for modifier_number in range(1, payor_dict['# OF MODIFIERS'] + 1):
+                modifier = "MODIFIER {}".format(modifier_number)
+                modifier_value = None
+                if payor_dict[modifier].upper() == "PROVIDER":
+                    provider_modifier = mapping_index.get_provider_modifier(payor_name_cr, provider_label, procedure_code)
+                    if provider_modifier:
+                        modifier_value = provider_modifier.get("PROVIDER {}".format(modifier))
+                elif payor_dict[modifier].upper() == "PLACE OF SERVICE":
+                    location_modifier = mapping_index.get_location_modifier(payor_name_cr, place_of_service_value)
+                    if location_modifier:
+                        modifier_value = location_modifier.get(modifier.title())
+                else:
+                    continue
+                if modifier_value is None:
+                    unmatched_modifiers.append("row {} ({} / POS {}) {}".format(row_number, procedure_code, place_of_service_value, modifier.lower()))
+                else:
+                    planned_inputs.append(('({})[{}]/td[{}]//input[{}]'.format(self.service_rows_xpath, row_number, modifiers_column_pos, modifier_number), modifier_value))
+        return planned_inputs, unmatched_modifiers
+
+    @timed_step
+    def populate_modifiers_information(self, payor_dict: dict, mapping_index: MappingIndex, payor_name_cr: str, provider_label: str):
         """
         Function that populates modifiers for each service row based on the mapping file information.
-        Each row can be populated up to 2 modifiers with two different types (PROVIDER and PLACE OF SERVICE)
+        Each row can be populated up to 2 modifiers with two different types (PROVIDER and PLACE OF SERVICE).
+        The rows of a page are read in one call and all the planned modifiers are filled in one scripted fill.
         """
         log_message("Start - Populate Modifiers Information")
 
         if payor_dict['MODIFIER'].upper() == "YES":
-            number_of_modifiers = payor_dict['# OF MODIFIERS']
             place_of_service_column_pos = 4
             procedure_code_column_pos = 5
-            modifiers_column_pos = 6
             page_count = act_on_element('//span[@id="scr4_FV1_topPager_lblPageCount"]', 'find_element').text
             page_count = int(page_count)
+            unmatched_modifiers = []
             
             for page in range(1, page_count + 1):
                 log_message("Populating modifiers for page {} of {}".format(page, page_count))
                 try:
                     act_on_element('//input[@id="scr4_FV1_topPager_txtPage" and @value = "{}"]'.format(page), 'find_element', 4)
-                    service_rows = act_on_element('//table[@id="scr4_FV1_GV"]//tr[descendant::a[text() = "Delete"]]', 'find_elements')
+                    service_rows = wait_for_table_rows(self.service_rows_xpath, {
+                        "procedure_code": ('./td[{}]//input'.format(procedure_code_column_pos), "value"),
+                        "place_of_service": ('./td[{}]//input'.format(place_of_service_column_pos), "value")
+                    })
                 except:
                     capture_page_screenshot(OUTPUT_FOLDER, "Exception_get_service_rows_Waystar")
                     log_message("Get service rows failed")
                 else:
-                    for service_row in service_rows:
-                        procedure_code = service_row.find_element_by_xpath('./td[{}]//input'.format(procedure_code_column_pos)).get_attribute("value")
-                        
-                        for modifier_number in range(1, number_of_modifiers + 1):
-                            try:
-
-                                modifier = "MODIFIER {}".format(modifier_number)
-                                if payor_dict[modifier].upper() == "PROVIDER":
-                                    provider_modifier = next((provider_mod for provider_mod in mapping_file_data_dict_list['Provider Modifier'] if payor_name_cr.upper() == str(provider_mod['CentralReach Payor Name']).upper() and provider_label.upper() == str(provider_mod['Provider Label']).upper() and procedure_code.upper() == str(provider_mod['Billing Code']).upper()), None)
-                                    if provider_modifier:
-                                        modifier_input = service_row.find_element_by_xpath('./td[{}]//input[{}]'.format(modifiers_column_pos, modifier_number))
-                                        self.browser.input_text_when_element_is_visible(modifier_input, provider_modifier["PROVIDER {}".format(modifier)])
-                                elif payor_dict[modifier].upper() == "PLACE OF SERVICE":
-                                    place_of_service_value = service_row.find_element_by_xpath('./td[{}]//input'.format(place_of_service_column_pos)).get_attribute("value")
-                                    location_modifier = next((location_mod for location_mod in mapping_file_data_dict_list['Location Modifier'] if payor_name_cr.upper() == str(location_mod['Payor'].upper()) and place_of_service_value == str(location_mod['Location'])), None)
-                                    if location_modifier:
-                                        modifier_input = service_row.find_element_by_xpath('./td[{}]//input[{}]'.format(modifiers_column_pos, modifier_number))
-                                        self.browser.input_text_when_element_is_visible(modifier_input, location_modifier[modifier.title()])
-                            except Exception as e:
-                                print(e)
-                                capture_page_screenshot(OUTPUT_FOLDER, "Exception_Populating_Modifier_number_{}_Waystar".format(modifier_number))
-                                log_message("Populating Modifier number {} for payor {} in Waystar failed".format(modifier_number, payor_dict['Waystar Payer Name']))
+                    planned_inputs, page_unmatched_modifiers = self.plan_page_modifiers(payor_dict, mapping_index, payor_name_cr, provider_label, service_rows)
+                    unmatched_modifiers.extend(["page {} {}".format(page, unmatched_modifier) for unmatched_modifier in page_unmatched_modifiers])
+                    not_found_inputs = fill_inputs(planned_inputs)
+                    if not_found_inputs:
+                        capture_page_screenshot(OUTPUT_FOLDER, "Exception_Populating_Modifiers_page_{}_Waystar".format(page))
+                        log_message("Populating {} modifiers of page {} for payor {} in Waystar failed, inputs not found: {}".format(len(not_found_inputs), page, payor_dict['Waystar Payer Name'], ", ".join(not_found_inputs)))
+                    log_message("{} modifiers filled on page {}".format(len(planned_inputs) - len(not_found_inputs), page))
                 
                 
                 if page_count > 1 and page < page_count:
@@ -275,12 +507,14 @@ class Waystar():
                         act_on_element('//a[@id="scr4_FV1_topPager_lnkNext"]', 'click_element', 1)
                     except:
                         print("next page not clicked")              
+            if unmatched_modifiers:
+                log_message("Modifiers without a match in the mapping file for payor {}: {}".format(payor_dict['Waystar Payer Name'], "; ".join(unmatched_modifiers)))
         else:
             log_message("This payor doesn't have any modifiers")
-        time.sleep(5) #delete later
+        wait_for_page_ready("waystar", replaced_sleep=5)
         if RunMode.save_changes:
             act_on_element('//input[@id="SubmitButton"]', 'click_element')
         else:
             close_window("WaystarSubInfo")
 
-        log_message("Finish - Populate Modifiers Information")
\ No newline at end of file
+        log_message("Finish - Populate Modifiers Information")
@@ -1,6 +1,8 @@
-from config import TEMP_FOLDER, OUTPUT_FOLDER
+import os
+from config import TEMP_FOLDER, OUTPUT_FOLDER, STATE_FOLDER, WORKER_ID, PARALLEL_WORKERS, MAX_CONCURRENT_WORKERS, CLAIMS_START_DATE, CLAIMS_END_DATE
 from libraries.common import log_message, print_version, create_or_clean_dir, get_bitwarden_data, capture_page_screenshot
 from libraries.process import Process
+from libraries.parallel import run_parallel
 
 def main():
     """
@@ -8,6 +10,11 @@ def main():
     """
     create_or_clean_dir(TEMP_FOLDER)
     create_or_clean_dir(OUTPUT_FOLDER)
+    os.makedirs(STATE_FOLDER, exist_ok=True)
+
+    if PARALLEL_WORKERS > 1 and not WORKER_ID:
+        run_parallel(CLAIMS_START_DATE, CLAIMS_END_DATE, PARALLEL_WORKERS, MAX_CONCURRENT_WORKERS)
+        return
 
     # Get credentials
     credentials = get_bitwarden_data()
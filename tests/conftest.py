@@ -0,0 +1,41 @@
+import os
+import sys
+import pytest
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_FOLDER = os.path.join(ROOT_FOLDER, "tests", "fixtures")
+sys.path.insert(0, ROOT_FOLDER)
+
+
+@pytest.fixture(scope="session")
+def common():
+    """
+    libraries.common, skipping the test when the robot dependencies are not installed.
+    """
+    pytest.importorskip("RPA.Browser.Selenium")
+    pytest.importorskip("ta_bitwarden_cli")
+    from libraries import common
+    return common
+
+
+@pytest.fixture(scope="session")
+def fixture_browser(common):
+    """
+    Headless Chrome of libraries.common, for the tests that drive the helpers against the local fixture pages.
+    """
+    try:
+        common.browser.open_available_browser(headless=True)
+    except Exception as e:
+        pytest.skip("No browser available: {}".format(e))
+    yield common.browser
+    common.browser.close_browser()
+
+
+@pytest.fixture
+def open_fixture_page(fixture_browser):
+    """
+    Returns a function that opens a page of the fixtures folder in the test browser.
+    """
+    def open_page(file_name: str):
+        fixture_browser.go_to("file://{}".format(os.path.join(FIXTURES_FOLDER, file_name)))
+    return open_page
@@ -0,0 +1,105 @@
+import json
+import os
+import urllib.error
+import urllib.request
+import pytest
+from libraries.centralreach.centralreach_api_replay import CentralReachReplayServer, get_record_file_name
+
+API_RECORD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "centralreach_api")
+SERVICE_LINES_METHOD = "claims.loadclaimservicelines"
+
+
+class WaystarTabBrowser():
+    """
+    Stand-in for the browser with the Waystar tab active: its cookies are the claims.zirmed.com ones.
+    """
+
+    class driver():
+
+        @staticmethod
+        def get_cookies():
+            return [{"name": "ASP.NET_SessionId", "value": "waystar", "domain": "claims.zirmed.com"}]
+
+        @staticmethod
+        def execute_script(script: str):
+            return "test-agent"
+
+
+def post_json(url: str, payload: dict):
+    request = urllib.request.Request(url, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_record_file_name_is_keyed_by_method_and_params():
+    assert get_record_file_name(SERVICE_LINES_METHOD, {"claimId": "9001"}) != get_record_file_name(SERVICE_LINES_METHOD, {"claimId": "9002"})
+    assert get_record_file_name(SERVICE_LINES_METHOD, {"a": 1, "b": 2}) == get_record_file_name(SERVICE_LINES_METHOD, {"b": 2, "a": 1})
+    assert get_record_file_name(SERVICE_LINES_METHOD).startswith(SERVICE_LINES_METHOD)
+
+
+def test_replay_server_returns_the_recording_of_the_params():
+    with CentralReachReplayServer(API_RECORD_FOLDER) as replay_server:
+        url = "{}/api/?{}".format(replay_server.base_url, SERVICE_LINES_METHOD)
+        first_claim = post_json(url, {"claimId": "9001"})
+        second_claim = post_json(url, {"claimId": "9002"})
+
+    assert [item["formattedService"] for item in first_claim["items"]] == ["97153", "97155"]
+    assert [item["formattedService"] for item in second_claim["items"]] == ["97151"]
+    assert replay_server.requests_count == 2
+
+
+def test_replay_server_answers_404_without_recording():
+    with CentralReachReplayServer(API_RECORD_FOLDER) as replay_server:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post_json("{}/api/?{}".format(replay_server.base_url, SERVICE_LINES_METHOD), {"claimId": "missing"})
+
+    assert error.value.code == 404
+    assert replay_server.missing_recordings == [get_record_file_name(SERVICE_LINES_METHOD, {"claimId": "missing"})]
+
+
+def test_api_records_one_file_per_params(common, tmp_path):
+    from libraries.centralreach.centralreach_api import CentralReachAPI
+
+    with CentralReachReplayServer(API_RECORD_FOLDER) as replay_server:
+        api = CentralReachAPI(replay_server.base_url, record_folder=str(tmp_path))
+        api.get_service_lines("9001")
+        api.get_service_lines("9002")
+
+    assert sorted(os.listdir(str(tmp_path))) == sorted([
+        get_record_file_name(SERVICE_LINES_METHOD, {"claimId": "9001"}),
+        get_record_file_name(SERVICE_LINES_METHOD, {"claimId": "9002"}),
+    ])
+
+
+def test_api_and_ui_service_lines_match(common, open_fixture_page, monkeypatch):
+    from libraries.centralreach import centralreach as centralreach_module
+    from libraries.centralreach.centralreach_api import CentralReachAPI
+
+    # The UI mode reads the recorded page of claim 9001 instead of the live claim editor
+    monkeypatch.setattr(centralreach_module, "switch_window", lambda *args, **kwargs: open_fixture_page("centralreach_service_lines.html"))
+    centralreach = centralreach_module.CentralReach(common.browser, {"url": "", "login": "", "password": ""})
+    centralreach.claim_id = "9001"
+    ui_service_lines = centralreach.get_service_lines()
+
+    with CentralReachReplayServer(API_RECORD_FOLDER) as replay_server:
+        centralreach.api = CentralReachAPI(replay_server.base_url)
+        api_service_lines = centralreach.get_service_lines()
+
+    assert len(ui_service_lines) == 2
+    assert api_service_lines == ui_service_lines
+
+
+def test_claim_extractor_keeps_the_api_session_after_a_tab_switch(common, monkeypatch):
+    from libraries.centralreach import centralreach as centralreach_module
+    from libraries.centralreach.centralreach_api import CentralReachAPI
+
+    monkeypatch.setattr(centralreach_module, "switch_window", lambda *args, **kwargs: None)
+    centralreach = centralreach_module.CentralReach(WaystarTabBrowser(), {"url": "", "login": "", "password": ""})
+    with CentralReachReplayServer(API_RECORD_FOLDER) as replay_server:
+        centralreach.api = CentralReachAPI(replay_server.base_url, [{"name": "crsession", "value": "centralreach"}])
+        claim_extractor = centralreach.create_claim_extractor()
+        service_lines = claim_extractor.api.get_service_lines("9001")
+
+    assert claim_extractor.api.session is not centralreach.api.session
+    assert replay_server.cookie_headers == ["crsession=centralreach"]
+    assert len(service_lines) == 2
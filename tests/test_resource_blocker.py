@@ -0,0 +1,83 @@
+class FakeDriver():
+    """
+    Stand-in for the WebDriver of the browser that records the DevTools Protocol commands.
+    """
+
+    def __init__(self, cdp_available: bool = True):
+        self.current_window_handle = "tab-1"
+        self.cdp_available = cdp_available
+        self.cdp_commands = []
+
+    def execute_cdp_cmd(self, command: str, params: dict):
+        if not self.cdp_available:
+            raise Exception("DevTools Protocol not supported")
+        self.cdp_commands.append((command, params))
+
+
+class FakeBrowser():
+
+    def __init__(self, cdp_available: bool = True):
+        self.driver = FakeDriver(cdp_available)
+
+
+def get_blocked_urls(driver: FakeDriver):
+    return [params["urls"] for command, params in driver.cdp_commands if command == "Network.setBlockedURLs"]
+
+
+def test_get_site_matches_the_host_of_each_site(common):
+    resource_blocker = common.ResourceBlocker(FakeBrowser(), True)
+
+    assert resource_blocker.get_site("https://members.centralreach.com/#billingmanager/billing") == "centralreach"
+    assert resource_blocker.get_site("https://claims.zirmed.com/Claims/Listing/Index?appid=1") == "waystar"
+    assert resource_blocker.get_site("https://portal.scmedicaid.com/claimsentry/cmsclaimslist") == "scmedicaid"
+    assert resource_blocker.get_site("https://esaeducation.sharepoint.com/:x:/g/behavioralhealth") == "sharepoint"
+    assert resource_blocker.get_site("https://example.com") == ""
+
+
+def test_allowlist_removes_patterns_of_its_site_only(common):
+    resource_blocker = common.ResourceBlocker(FakeBrowser(), True)
+
+    centralreach_patterns = resource_blocker.get_blocked_patterns("centralreach")
+    scmedicaid_patterns = resource_blocker.get_blocked_patterns("scmedicaid")
+    assert "*.woff2" not in centralreach_patterns and "*.svg" not in centralreach_patterns
+    assert "*.png" in centralreach_patterns
+    assert "*google.com/recaptcha*" not in scmedicaid_patterns and "*gstatic.com*" not in scmedicaid_patterns
+    assert "*.woff2" in scmedicaid_patterns
+    assert "*.png" not in resource_blocker.get_blocked_patterns("waystar")
+    assert resource_blocker.get_blocked_patterns("") == resource_blocker.blocked_patterns
+
+
+def test_allowlists_only_name_blocked_patterns(common):
+    for site, allowlist in common.ResourceBlocker.site_allowlists.items():
+        assert site in common.ResourceBlocker.site_hosts
+        assert set(allowlist) <= set(common.ResourceBlocker.blocked_patterns)
+
+
+def test_apply_sets_the_block_list_once_per_tab_and_site(common):
+    browser = FakeBrowser()
+    resource_blocker = common.ResourceBlocker(browser, True)
+
+    resource_blocker.apply("https://portal.scmedicaid.com/login")
+    resource_blocker.apply("https://portal.scmedicaid.com/claimsentry/cmsclaimslist")
+    resource_blocker.apply("https://claims.zirmed.com/Claims/Listing/Index?appid=1")
+
+    assert get_blocked_urls(browser.driver) == [
+        resource_blocker.get_blocked_patterns("scmedicaid"),
+        resource_blocker.get_blocked_patterns("waystar"),
+    ]
+
+
+def test_apply_turns_off_when_devtools_protocol_is_not_available(common):
+    browser = FakeBrowser(cdp_available=False)
+    resource_blocker = common.ResourceBlocker(browser, True)
+
+    resource_blocker.apply("https://members.centralreach.com")
+
+    assert not resource_blocker.enabled
+
+
+def test_disabled_blocker_sends_nothing(common):
+    browser = FakeBrowser()
+    common.ResourceBlocker(browser, False).apply("https://members.centralreach.com")
+
+    assert browser.driver.cdp_commands == []
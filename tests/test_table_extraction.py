@@ -0,0 +1,64 @@
+ROWS_XPATH = '//div[@id="content"]/table/tbody/tr[contains(@class, "row-item")]'
+COLUMNS = {
+    "row_id": (".", "id"),
+    "date": './td[1]/span[contains(@class, "inline-block")]',
+    "client_name": './td[2]/a[contains(@class, "vcard")]',
+    "client_id": ('./td[2]/a[contains(@class, "vcard")]', "contactid"),
+    "claim_url": ('./td[3]/a[@class="claim"]', "href"),
+    "claim_text": './td[3]',
+    "amount": './td[4]',
+}
+
+
+def read_rows_per_cell(browser):
+    """
+    The per-cell reads that extract_table_rows replaced: one WebDriver call per row lookup, cell and attribute.
+    """
+    rows = []
+    for row in browser.find_elements("xpath:{}".format(ROWS_XPATH)):
+        row_data = {}
+        for key, column in COLUMNS.items():
+            column_xpath, attribute = column if isinstance(column, tuple) else (column, "text")
+            cells = row.find_elements("xpath", column_xpath)
+            if not cells:
+                row_data[key] = None
+            elif attribute == "text":
+                row_data[key] = cells[0].text.strip()
+            else:
+                row_data[key] = cells[0].get_attribute(attribute)
+        rows.append(row_data)
+    return rows
+
+
+def test_extract_table_rows_maps_columns(common, open_fixture_page):
+    open_fixture_page("billing_grid.html")
+    rows = common.extract_table_rows(ROWS_XPATH, COLUMNS)
+
+    assert [row["row_id"] for row in rows] == ["billing-grid-row-1001", "billing-grid-row-1002", "billing-grid-row-1003"]
+    assert rows[0]["date"] == "03/01/22"
+    assert rows[0]["client_name"] == "Jane Doe"
+    assert rows[0]["client_id"] == "501"
+    assert rows[0]["claim_url"].endswith("#claims/editor/?claimId=9001")
+    assert rows[1]["amount"] == "$80.50"
+
+
+def test_extract_table_rows_missing_cells_are_none(common, open_fixture_page):
+    open_fixture_page("billing_grid.html")
+    rows = common.extract_table_rows(ROWS_XPATH, COLUMNS)
+
+    assert rows[2]["date"] is None
+    assert rows[2]["claim_url"] is None
+    assert rows[2]["claim_text"] == "no claim"
+
+
+def test_extract_table_rows_accepts_xpath_prefix(common, open_fixture_page):
+    open_fixture_page("billing_grid.html")
+
+    assert common.extract_table_rows("xpath:{}".format(ROWS_XPATH), COLUMNS) == common.extract_table_rows(ROWS_XPATH, COLUMNS)
+    assert common.wait_for_table_rows(ROWS_XPATH, {"row_id": (".", "id")})[0]["row_id"] == "billing-grid-row-1001"
+
+
+def test_extract_table_rows_matches_per_cell_reads(common, fixture_browser, open_fixture_page):
+    open_fixture_page("billing_grid.html")
+
+    assert common.extract_table_rows(ROWS_XPATH, COLUMNS) == read_rows_per_cell(fixture_browser)